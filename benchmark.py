@@ -0,0 +1,215 @@
+"""
+Benchmark parsing, loading and clone planning on synthetic projects
+
+Run from the directory containing the plugin, like test.sh does:
+
+	python -m self.benchmark --sizes small,medium --output results.jsonl
+
+Prints one JSON object per line for each (size, stage), with all timings and
+the peak traced allocation size, so results can be collected across commits
+and machines and plotted as scaling curves.
+"""
+from argparse import ArgumentParser
+from dataclasses import asdict
+import json
+import logging
+from pathlib import Path
+import sys
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, TextIO, Type
+
+from .kicad_v8_model import Footprint, Project, SchematicLoader, LayoutLoader
+from .kicad_v8_model import parser
+from .kicad_v8_model.parser import Parser
+from .kicad_v8_model.bench_harness import run_benchmark
+from .kicad_v8_model.synthetic_project import SYNTHETIC_PROJECT_SIZES, SyntheticProjectGenerator
+from .clone_placement.footprint_mapping import map_subcircuit
+from .clone_placement.spath import Spath
+from .clone_placement.placement_settings import (
+	ClonePlacementGridFlow,
+	ClonePlacementGridSort,
+	ClonePlacementGridStrategySettings,
+	ClonePlacementRelativeStrategySettings,
+	ClonePlacementSettings,
+	ClonePlacementStrategyType,
+)
+from .clone_placement.placement_strategy import ClonePlacementStrategy
+from .utils.kicad_units import UserUnits, SizeUnits
+
+
+logger = logging.getLogger(__name__)
+
+
+Stage = Callable[[], None]
+
+
+def measure(op: Stage, repeats: int, trace_memory: bool) -> Dict[str, Any]:
+	timing = run_benchmark("", op, repeats=repeats)
+	result: Dict[str, Any] = {
+		"times": timing.samples,
+		"min": min(timing.samples),
+		"median": timing.median,
+		"p95": timing.p95,
+		"stddev": timing.stddev,
+		"ci_low": timing.ci_low,
+		"ci_high": timing.ci_high,
+	}
+	if trace_memory:
+		# Separate run, tracing slows everything down a lot
+		tracemalloc.start()
+		op()
+		result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+	return result
+
+
+def load_project(generator: SyntheticProjectGenerator) -> Project:
+	project = Project()
+	SchematicLoader.load(project, str(generator.schematic_file))
+	LayoutLoader.load(project, str(generator.layout_file))
+	return project
+
+
+def get_selected_footprints(project: Project) -> List[Footprint]:
+	""" Footprints of the first block under the root sheet """
+	source_sheet = project.root_sheet_instance.children[0]
+	return [
+		footprint
+		for footprint in project.footprints.values()
+		if footprint.component.units[0].path.startswith(source_sheet.path)
+	]
+
+
+def get_clone_strategy(project: Project) -> ClonePlacementStrategy:
+	""" Placements of the siblings of the first block under the root sheet """
+	selected_footprints = get_selected_footprints(project)
+	subcircuit_mapping = map_subcircuit(logger, project, selected_footprints)
+	reference = selected_footprints[0]
+	# Same settings as the plugin starts with
+	strategy = ClonePlacementStrategy.get(
+		project=project,
+		settings=ClonePlacementSettings(
+			strategy=ClonePlacementStrategyType.RELATIVE,
+			relative=ClonePlacementRelativeStrategySettings(anchor=reference),
+			grid=ClonePlacementGridStrategySettings(
+				sort=ClonePlacementGridSort.HIERARCHY,
+				flow=ClonePlacementGridFlow.ROW,
+				main_interval=50 * SizeUnits.PER_MILLIMETRE,
+				cross_interval=50 * SizeUnits.PER_MILLIMETRE,
+				length_unit=UserUnits.MILLIMETRE,
+				wrap=False,
+				wrap_at=8,
+			),
+		),
+		reference=reference,
+		targets=[
+			target.footprint
+			for target in subcircuit_mapping.footprint_mapping[reference]
+			if target.base_sheet in subcircuit_mapping.base_sheets
+		],
+	)
+	return strategy
+
+
+def map_footprints_by_spath(project: Project):
+	""" Resolve a spath per (selected footprint, instance) pair, as mapping used to, for comparison """
+	selected_footprints = get_selected_footprints(project)
+	root = project.root_sheet_instance
+	source_sheet = root.children[0]
+	source_spath = Spath.create(source_sheet, root, project.siblings)
+	instance_spaths = [
+		Spath.create(sheet, root, project.siblings)
+		for sheet in source_sheet.definition.instances
+	]
+	for footprint in selected_footprints:
+		relative_spath = Spath.create(footprint.component.units[0], root, project.siblings)[len(source_spath):]
+		for instance_spath in instance_spaths:
+			(instance_spath + relative_spath).resolve_symbol(root, project.siblings).component.footprint
+
+
+def plan_clone(project: Project):
+	""" Clone the first block under the root sheet onto all of its siblings """
+	for _ in get_clone_strategy(project):
+		pass
+
+
+def get_stages(generator: SyntheticProjectGenerator) -> Dict[str, Stage]:
+	project = load_project(generator)
+	sheet_files = sorted(str(path) for path in generator.directory.glob("*.kicad_sch"))
+
+	def parse_schematic():
+		for sheet_file in sheet_files:
+			SchematicLoader.parser_class(schema=SchematicLoader.schema).parse_file(sheet_file)
+
+	def parse_layout():
+		LayoutLoader.parser_class(schema=LayoutLoader.schema).parse_file(str(generator.layout_file))
+
+	def load_schematic():
+		SchematicLoader.load(Project(), str(generator.schematic_file))
+
+	def load_layout():
+		LayoutLoader.load(project, str(generator.layout_file))
+
+	return {
+		"parse_schematic": parse_schematic,
+		"parse_layout": parse_layout,
+		"load_schematic": load_schematic,
+		"load_layout": load_layout,
+		"footprint_mapping": lambda: map_subcircuit(logger, project, get_selected_footprints(project)),
+		"footprint_mapping_spath": lambda: map_footprints_by_spath(project),
+		"clone_planning": lambda: plan_clone(project),
+	}
+
+
+def run_size(size: str, directory: Path, repeats: int, trace_memory: bool, output: TextIO):
+	settings = SYNTHETIC_PROJECT_SIZES[size]
+	generator = SyntheticProjectGenerator.generate(settings, directory / size)
+	file_bytes = sum(path.stat().st_size for path in generator.directory.iterdir())
+	for stage_name, stage in get_stages(generator).items():
+		record = {
+			"size": size,
+			"stage": stage_name,
+			"parser": SchematicLoader.parser_class.__name__,
+			"repeats": repeats,
+			"python": sys.version.split()[0],
+			"file_bytes": file_bytes,
+			"sheet_instances": settings.sheet_instance_count,
+			"symbol_instances": settings.symbol_instance_count,
+			"settings": asdict(settings),
+			**measure(stage, repeats, trace_memory),
+		}
+		output.write(json.dumps(record) + "\n")
+		output.flush()
+
+
+def run(args: Optional[List[str]] = None):
+	argument_parser = ArgumentParser(description=__doc__.split("\n")[1])
+	argument_parser.add_argument("--sizes", default="small,medium,large", help=f"comma-separated, from: {', '.join(SYNTHETIC_PROJECT_SIZES)}")
+	argument_parser.add_argument("--parser", default="FastParser", help="parser class for both loaders")
+	argument_parser.add_argument("--repeats", type=int, default=3)
+	argument_parser.add_argument("--no-memory", action="store_true", help="skip the traced memory run")
+	argument_parser.add_argument("--directory", type=Path, help="where to generate projects (default: temporary)")
+	argument_parser.add_argument("--output", type=Path, help="append results here instead of stdout")
+	options = argument_parser.parse_args(args)
+
+	# Loaders log every entity at info level, which would dominate the timings
+	logging.basicConfig(level=logging.WARNING, force=True)
+
+	parser_class: Type[Parser] = getattr(parser, options.parser)
+	SchematicLoader.parser_class = parser_class
+	LayoutLoader.parser_class = parser_class
+
+	output = sys.stdout if options.output is None else open(options.output, "a", encoding="utf-8")
+	try:
+		with tempfile.TemporaryDirectory(prefix="kicad-benchmark-") as temp_directory:
+			directory = options.directory or Path(temp_directory)
+			for size in options.sizes.split(","):
+				run_size(size, directory, options.repeats, not options.no_memory, output)
+	finally:
+		if output is not sys.stdout:
+			output.close()
+
+
+if __name__ == "__main__":
+	run()
@@ -1,21 +1,13 @@
 from dataclasses import dataclass
-from typing import Mapping, Sequence
+from typing import Sequence
 
 from .service import CloneSelection
 from .settings import CloneSettings
+from .footprint_mapping import FootprintMapping
 
 from ..kicad_v8_model import Project, Footprint, SheetInstance
 
 
-@dataclass
-class TargetFootprint():
-	base_sheet: SheetInstance
-	footprint: Footprint
-
-
-FootprintMapping = Mapping[Footprint, Sequence[TargetFootprint]]
-
-
 @dataclass
 class CloneContext():
 	project: Project
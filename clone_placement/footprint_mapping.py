@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from functools import reduce
+from logging import Logger
+from typing import Dict, List, Mapping, Sequence, TypeVar
+
+from ..kicad_v8_model import Project, Footprint, SheetInstance, SymbolInstance
+
+from .spath import Spath, SpathObject
+
+
+@dataclass
+class TargetFootprint():
+	base_sheet: SheetInstance
+	footprint: Footprint
+
+
+FootprintMapping = Mapping[Footprint, Sequence[TargetFootprint]]
+
+SiblingType = TypeVar("SiblingType", SheetInstance, SymbolInstance)
+
+
+def match_siblings(sources: Sequence[SiblingType], targets: Sequence[SiblingType]) -> Sequence[SiblingType]:
+	"""
+	Target for each source: the n-th target of a definition for the n-th
+	source of that definition, as spaths index them
+	"""
+	if [source.definition for source in sources] == [target.definition for target in targets]:
+		# Instances of the same sheet file list them in the same order
+		return targets
+	groups: Dict[SpathObject, List[SiblingType]] = {}
+	for target in targets:
+		groups.setdefault(target.definition, []).append(target)
+	positions: Dict[SpathObject, int] = {}
+	matched: List[SiblingType] = []
+	for source in sources:
+		position = positions.get(source.definition, 0)
+		positions[source.definition] = position + 1
+		matched.append(groups[source.definition][position])
+	return matched
+
+
+def match_symbols(source_sheet: SheetInstance, target_sheet: SheetInstance) -> List[SymbolInstance]:
+	"""
+	Walk both subtrees together, returning the symbol under the target sheet
+	at the same relative spath as each symbol under the source sheet.  The
+	order only depends on the source subtree, so match_symbols(source_sheet,
+	source_sheet) lists the source symbols in the same order.
+	"""
+	matched: List[SymbolInstance] = []
+	pending = [(source_sheet, target_sheet)]
+	while pending:
+		source, target = pending.pop()
+		matched += match_siblings(source.symbols, target.symbols)
+		pending += zip(source.children, match_siblings(source.children, target.children))
+	return matched
+
+
+def map_footprints(
+	source_sheet: SheetInstance,
+	base_sheets: Sequence[SheetInstance],
+	footprints: Sequence[Footprint],
+) -> FootprintMapping:
+	"""
+	Footprints under the source sheet, each mapped to the footprint at the
+	same relative spath under each base sheet (in order).  One walk per
+	distinct base sheet, instead of resolving a spath per footprint per
+	base sheet.
+	"""
+	rows = {
+		symbol: row
+		for row, symbol in enumerate(match_symbols(source_sheet, source_sheet))
+	}
+	matched: Dict[SheetInstance, List[SymbolInstance]] = {}
+	for base_sheet in base_sheets:
+		if base_sheet not in matched:
+			matched[base_sheet] = match_symbols(source_sheet, base_sheet)
+	columns = [
+		(base_sheet, matched[base_sheet])
+		for base_sheet in base_sheets
+	]
+	return {
+		footprint: [
+			TargetFootprint(
+				base_sheet=base_sheet,
+				footprint=symbols[row].component.footprint,
+			)
+			for base_sheet, symbols in columns
+		]
+		for footprint in footprints
+		for row in (rows[footprint.component.units[0]],)
+	}
+
+
+@dataclass
+class SubcircuitMapping():
+	source_sheet: SheetInstance
+	base_sheets: List[SheetInstance]
+	footprint_mapping: FootprintMapping
+
+
+def map_subcircuit(logger: Logger, project: Project, selected_footprints: Sequence[Footprint]) -> SubcircuitMapping:
+	""" Find the sheet containing the selection, and the corresponding footprints in each other instance of it """
+	selected_symbol_spaths = set(
+		Spath.create(unit.sheet, project.root_sheet_instance, project.siblings)
+		for footprint in selected_footprints
+		for unit in footprint.component.units
+	)
+	logger.info("Selected symbol spaths:")
+	for spath in selected_symbol_spaths:
+		logger.info(" * %s", spath)
+
+	selected_symbols_base_spath = reduce(Spath.__and__, selected_symbol_spaths).without_symbol()
+	logger.info("Selection prefix spath: %s", selected_symbols_base_spath)
+	assert len(selected_symbols_base_spath) > 0
+
+	source_sheet = selected_symbols_base_spath.resolve_sheet(project.root_sheet_instance, project.siblings)
+
+	selected_symbols_relative_spaths = [
+		path[len(selected_symbols_base_spath):]
+		for path in selected_symbol_spaths
+	]
+	logger.info("Paths to selected footprints, relative to selection prefix:")
+	for spath in selected_symbols_relative_spaths:
+		logger.info(" * %s", spath)
+
+	reference_symbol_instances = selected_footprints[0].component.units[0].definition.instances
+
+	reference_symbol_instances_spaths = [
+		Spath.create(symbol, project.root_sheet_instance, project.siblings)
+		for symbol in reference_symbol_instances
+	]
+
+	instances_prefix_spaths = [
+		instance_spath[0:len(selected_symbols_base_spath)]
+		for instance_spath in reference_symbol_instances_spaths
+	]
+
+	instance_base_sheets = [
+		instance_prefix_spath.resolve_sheet(project.root_sheet_instance, project.siblings)
+		for instance_prefix_spath in instances_prefix_spaths
+	]
+
+	footprint_mapping = map_footprints(source_sheet, instance_base_sheets, selected_footprints)
+
+	logger.info("Footprint mappings:")
+	for source, targets in footprint_mapping.items():
+		logger.info(" * %s", source.component.reference)
+		for target in targets:
+			logger.info("    - %s", target.footprint.component.reference)
+
+	base_sheets = [
+		base_sheet
+		for base_sheet, instance_prefix_spath in zip(instance_base_sheets, instances_prefix_spaths)
+		if instance_prefix_spath != selected_symbols_base_spath
+	]
+
+	return SubcircuitMapping(
+		source_sheet=source_sheet,
+		base_sheets=base_sheets,
+		footprint_mapping=footprint_mapping,
+	)
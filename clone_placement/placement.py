@@ -26,3 +26,17 @@ class Placement():
 			)
 		else:
 			raise TypeError()
+
+	def rotation_onto(self, target: "Placement") -> Angle:
+		""" Rotation which, after flipping if the sides differ, turns this orientation into the target's """
+		orientation = flipped_orientation(self.orientation) if self.flipped != target.flipped else self.orientation
+		return (target.orientation - orientation).wrap()
+
+
+def flipped_orientation(orientation: Angle) -> Angle:
+	"""
+	FlipAction flips left/right around the footprint's own position, which
+	Kicad does as a top/bottom flip (negating the orientation) and then a
+	half turn, so the orientation becomes 180 - orientation
+	"""
+	return (Angle.from_degrees(180) - orientation).wrap()
@@ -7,13 +7,19 @@ from pcbnew import GetUserUnits, BOARD_ITEM
 
 from ..utils.kicad_units import UserUnits, SizeUnits
 from ..utils.user_exception import UserException
+from ..utils.cancellation import OperationCancelled
+from ..utils.tracing import Tracer, traced
 
 from ..kicad_v8_model import SchematicLoader, Project, EntityPathComponent
+from ..kicad_v8_model.parser import ThrottledParserObserver
 
 from ..kicad_v8_native_adapter import Plugin
 from ..kicad_v8_native_adapter import PluginLayoutLoader
 
-from .context import CloneContext, TargetFootprint
+from ..ui.bored_user_entertainer import BoredUserEntertainer
+
+from .context import CloneContext
+from .footprint_mapping import map_subcircuit
 from .service import CloneSelection
 from .settings_controller import CloneSettingsController
 from .settings_view import CloneSettingsView
@@ -26,7 +32,6 @@ from .placement_settings import (
 	ClonePlacementSettings,
 	ClonePlacementStrategyType,
 )
-from .spath import Spath
 
 ItemType = TypeVar("ItemType", bound=BOARD_ITEM)
 
@@ -107,18 +112,27 @@ class ClonePlugin(Plugin):
 			if item.IsSelected()
 		]
 
+	@traced("clone plugin")
 	def execute(self) -> None:
 		logger = self.logger
 		board = self.board
 
 		try:
-			board_file = board.GetFileName()
-			logger.info("Board path: %s", board_file)
-			schematic_file = str(Path(board_file).with_suffix(".kicad_sch"))
-			logger.info("Assumed project path: %s", schematic_file)
-			project = Project()
-			SchematicLoader.load(project, schematic_file)
-			PluginLayoutLoader.load(project, board)
+			with Tracer.span("load project"):
+				board_file = board.GetFileName()
+				logger.info("Board path: %s", board_file)
+				schematic_file = str(Path(board_file).with_suffix(".kicad_sch"))
+				logger.info("Assumed project path: %s", schematic_file)
+				project = Project()
+				# Updates the progress dialog, and lets the user cancel a slow load
+				observer = ThrottledParserObserver(
+					BoredUserEntertainer.progress,
+					cancellation=BoredUserEntertainer.cancellation(),
+				)
+				SchematicLoader.load(project, schematic_file, observer)
+				PluginLayoutLoader.load(project, board)
+		except OperationCancelled:
+			raise
 		except Exception as error:
 			raise UserException("Failed to parse board / project structure") from error
 		self.project = project
@@ -142,74 +156,11 @@ class ClonePlugin(Plugin):
 		for footprint in selected_footprints:
 			logger.info(" * %s", footprint.component.reference)
 
-		selected_symbol_spaths = set(
-			Spath.create(unit.sheet, project.root_sheet_instance)
-			for footprint in selected_footprints
-			for unit in footprint.component.units
-		)
-		logger.info("Selected symbol spaths:")
-		for spath in selected_symbol_spaths:
-			logger.info(" * %s", spath)
-
-		selected_symbols_base_spath = reduce(Spath.__and__, selected_symbol_spaths).without_symbol()
-		logger.info("Selection prefix spath: %s", selected_symbols_base_spath)
-		assert len(selected_symbols_base_spath) > 0
-
-		source_sheet = selected_symbols_base_spath.resolve_sheet(project.root_sheet_instance)
-
-		selected_symbols_relative_spaths = [
-			path[len(selected_symbols_base_spath):]
-			for path in selected_symbol_spaths
-		]
-		logger.info("Paths to selected footprints, relative to selection prefix:")
-		for spath in selected_symbols_relative_spaths:
-			logger.info(" * %s", spath)
-
-		reference_symbol_instances = selected_footprints[0].component.units[0].definition.instances
-
-		reference_symbol_instances_spaths = [
-			Spath.create(symbol, project.root_sheet_instance)
-			for symbol in reference_symbol_instances
-		]
-
-		instances_prefix_spaths = [
-			instance_spath[0:len(selected_symbols_base_spath)]
-			for instance_spath in reference_symbol_instances_spaths
-		]
-
-		footprint_mapping = {
-			source_footprint: [
-				TargetFootprint(
-					base_sheet=instance_prefix_spath.resolve_sheet(project.root_sheet_instance),
-					footprint=target_spath.resolve_symbol(project.root_sheet_instance).component.footprint
-				)
-				for instance_prefix_spath in instances_prefix_spaths
-				for target_spath in (
-					(
-						instance_prefix_spath + source_spath[len(selected_symbols_base_spath):]
-					),
-				)
-			]
-			for source_footprint in selected_footprints
-			for source_spath in (
-				Spath.create(
-					source_footprint.component.units[0],
-					project.root_sheet_instance
-				),
-			)
-		}
-
-		logger.info("Footprint mappings:")
-		for source, targets in footprint_mapping.items():
-			logger.info(" * %s", source.component.reference)
-			for target in targets:
-				logger.info("    - %s", target.footprint.component.reference)
-
-		base_sheets = [
-			instance_prefix_spath.resolve_sheet(project.root_sheet_instance)
-			for instance_prefix_spath in instances_prefix_spaths
-			if instance_prefix_spath != selected_symbols_base_spath
-		]
+		with Tracer.span("map subcircuit", selected_footprints=len(selected_footprints)):
+			subcircuit_mapping = map_subcircuit(logger, project, selected_footprints)
+		source_sheet = subcircuit_mapping.source_sheet
+		footprint_mapping = subcircuit_mapping.footprint_mapping
+		base_sheets = subcircuit_mapping.base_sheets
 
 		kicad_footprints = {
 			EntityPathComponent.parse(footprint.GetFPIDAsString()): footprint
@@ -288,4 +239,5 @@ class ClonePlugin(Plugin):
 			context=context,
 			controller=settings_controller,
 		)
-		view.execute()
+		with Tracer.span("open settings view"):
+			view.execute()
@@ -7,6 +7,7 @@ from pcbnew import FOOTPRINT, PCB_TRACK, BOARD_ITEM, ZONE, Refresh as RefreshVie
 
 from ..ui.spinner import spin_while
 from ..ui.bored_user_entertainer import BoredUserEntertainer
+from ..utils.tracing import Tracer, traced
 
 from .context import CloneContext
 from .placement import Placement
@@ -53,6 +54,7 @@ class CloneService():
 		RefreshView()
 
 	@spin_while
+	@traced("clone subcircuits")
 	def clone_subcircuits(
 		self,
 		logger: Logger,
@@ -104,46 +106,50 @@ class CloneService():
 
 		BoredUserEntertainer.message("Planning clone operation")
 
-		for target_reference, target_reference_placement in placement_strategy:
-			logger.info("Planning clone of subcircuit around %s", target_reference.component.reference)
-			for source_index, source_footprint in enumerate(source_footprints):
-				target_footprint_mapping = footprint_mapping[source_footprint][source_index]
-				target_footprint = target_footprint_mapping.footprint
-				logger.debug("Matched source %s to target %s", source_footprint, target_footprint)
-				if target_footprint_mapping.base_sheet not in settings.instances:
-					logger.debug("Sheet deselected, skipping footprint")
-					continue
-				transaction_builder.add_item(
-					source_reference=source_reference_placement,
-					target_reference=target_reference_placement,
-					source_item=source_footprint.pcbnew_footprint,
-					target_item=target_footprint.pcbnew_footprint,
-				)
-			for source_track in selection.source_tracks:
-				transaction_builder.add_item(
-					source_reference=source_reference_placement,
-					target_reference=target_reference_placement,
-					source_item=source_track,
-				)
-			for source_drawing in selection.source_drawings:
-				transaction_builder.add_item(
-					source_reference=source_reference_placement,
-					target_reference=target_reference_placement,
-					source_item=source_drawing,
-				)
-			for source_zone in selection.source_zones:
-				transaction_builder.add_item(
-					source_reference=source_reference_placement,
-					target_reference=target_reference_placement,
-					source_item=source_zone,
-				)
-
-		self.transaction = transaction_builder.build()
+		with Tracer.span("plan clone") as span:
+			for target_reference, target_reference_placement in placement_strategy:
+				logger.info("Planning clone of subcircuit around %s", target_reference.component.reference)
+				span.count("subcircuits")
+				for source_index, source_footprint in enumerate(source_footprints):
+					target_footprint_mapping = footprint_mapping[source_footprint][source_index]
+					target_footprint = target_footprint_mapping.footprint
+					logger.debug("Matched source %s to target %s", source_footprint, target_footprint)
+					if target_footprint_mapping.base_sheet not in settings.instances:
+						logger.debug("Sheet deselected, skipping footprint")
+						continue
+					transaction_builder.add_item(
+						source_reference=source_reference_placement,
+						target_reference=target_reference_placement,
+						source_item=source_footprint.pcbnew_footprint,
+						target_item=target_footprint.pcbnew_footprint,
+					)
+				for source_track in selection.source_tracks:
+					transaction_builder.add_item(
+						source_reference=source_reference_placement,
+						target_reference=target_reference_placement,
+						source_item=source_track,
+					)
+				for source_drawing in selection.source_drawings:
+					transaction_builder.add_item(
+						source_reference=source_reference_placement,
+						target_reference=target_reference_placement,
+						source_item=source_drawing,
+					)
+				for source_zone in selection.source_zones:
+					transaction_builder.add_item(
+						source_reference=source_reference_placement,
+						target_reference=target_reference_placement,
+						source_item=source_zone,
+					)
+
+			self.transaction = transaction_builder.build()
 		self.transaction.on_progress = BoredUserEntertainer.progress
 
 		BoredUserEntertainer.message("Executing clone operation")
-		self.transaction.apply()
+		with Tracer.span("apply transaction"):
+			self.transaction.apply()
 
 		BoredUserEntertainer.message("Refreshing pcbnew...")
 		logger.info("Refreshing pcbnew")
-		RefreshView()
+		with Tracer.span("refresh view"):
+			RefreshView()
@@ -2,10 +2,11 @@
 
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, List, Sequence, TypeVar, Union, overload
+from typing import Any, List, Optional, Sequence, TypeVar, Union, overload
 
 from ..kicad_v8_model import SheetDefinition
 from ..kicad_v8_model import SheetInstance
+from ..kicad_v8_model import SiblingIndex
 from ..kicad_v8_model import SymbolDefinition
 from ..kicad_v8_model import SymbolInstance
 
@@ -38,9 +39,10 @@ def get_siblings_of_item_by_definition(item: SpathTargetType) -> Sequence[SpathT
 		raise TypeError()
 
 
-def get_index_of_item_within_siblings_of_same_definition(item: SpathTarget) -> int:
-	siblings = get_siblings_of_item_by_definition(item)
-	return siblings.index(item)
+def get_index_of_item_within_siblings_of_same_definition(item: SpathTarget, siblings: Optional[SiblingIndex] = None) -> int:
+	if siblings is not None:
+		return siblings.position(item)
+	return get_siblings_of_item_by_definition(item).index(item)
 
 
 def find_instance_of_item_by_index_within_siblings_of_same_definition(items: Sequence[SpathTargetType], definition: SpathObject, index: int) -> SpathTargetType:
@@ -165,7 +167,8 @@ class Spath():
 			return Spath(parts=self.parts)
 
 	@staticmethod
-	def create(item: SpathTarget, root: SheetInstance) -> "Spath":
+	def create(item: SpathTarget, root: SheetInstance, siblings: Optional[SiblingIndex] = None) -> "Spath":
+		""" With the project's sibling index, this is a lookup per level instead of a scan """
 		parts: List[SpathComponent] = []
 		it: SheetInstance
 		if isinstance(item, SheetInstance):
@@ -174,43 +177,53 @@ class Spath():
 			it = item.sheet
 		else:
 			raise TypeError()
-		while it != root:
+		while it is not root:
 			parts.append(
 				SpathComponent(
 					definition=it.definition,
-					index=get_index_of_item_within_siblings_of_same_definition(it)
+					index=get_index_of_item_within_siblings_of_same_definition(it, siblings)
 				)
 			)
 			if it.parent is None:
 				raise ValueError()
 			it = it.parent
+		# Collected from the item up, but paths read from the root down
+		parts.reverse()
 		if isinstance(item, SymbolInstance):
 			parts.append(
 				SpathComponent(
 					definition=item.definition,
-					index=get_index_of_item_within_siblings_of_same_definition(item)
+					index=get_index_of_item_within_siblings_of_same_definition(item, siblings)
 				)
 			)
 		return Spath(parts=parts)
 
-	def resolve_sheet(self, root: SheetInstance) -> SheetInstance:
+	def resolve_sheet(self, root: SheetInstance, siblings: Optional[SiblingIndex] = None) -> SheetInstance:
 		it: SheetInstance = root
 		for part in self.parts:
 			if isinstance(part.definition, SymbolDefinition):
 				break
-			it = find_instance_of_item_by_index_within_siblings_of_same_definition(
-				items=it.children,
-				definition=part.definition,
-				index=part.index,
-			)
+			if siblings is not None:
+				it = siblings.siblings(it, part.definition)[part.index]
+			else:
+				it = find_instance_of_item_by_index_within_siblings_of_same_definition(
+					items=it.children,
+					definition=part.definition,
+					index=part.index,
+				)
 		return it
 
-	def resolve_symbol(self, root: SheetInstance) -> SymbolInstance:
-		sheet = self.resolve_sheet(root)
+	def resolve_symbol(self, root: SheetInstance, siblings: Optional[SiblingIndex] = None) -> SymbolInstance:
+		sheet = self.resolve_sheet(root, siblings)
 		symbol_part = self.parts[-1]
+		symbol_definition = symbol_part.definition
+		if not isinstance(symbol_definition, SymbolDefinition):
+			raise TypeError()
+		if siblings is not None:
+			return siblings.siblings(sheet, symbol_definition)[symbol_part.index]
 		symbol = find_instance_of_item_by_index_within_siblings_of_same_definition(
 			items=sheet.symbols,
-			definition=symbol_part.definition,
+			definition=symbol_definition,
 			index=symbol_part.index,
 		)
 		return symbol
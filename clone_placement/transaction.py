@@ -1,12 +1,10 @@
 from typing import Iterable, Union, final, List, Callable, overload
 from abc import ABC
-from math import copysign
 
 from pcbnew import EDA_ANGLE, DEGREE_T, BOARD_ITEM, FOOTPRINT, VECTOR2I
 
 from ..layout_transaction.command import CloneCommand, Command, DisplaceCommand, FlipCommand, MoveToLayerCommand, RotateCommand
 
-from ..kicad_v8_model.angle import Angle
 from ..kicad_v8_model.entities import ArcRoute, Footprint, PolygonRoute, StraightRoute, Via
 
 from ..utils.kicad_units import RotationUnits
@@ -20,7 +18,7 @@ class CloneTransactionOperator(ABC):
 	def __init__(self, source_reference_placement: Placement, target_reference_placement: Placement):
 		self.source_reference_placement = source_reference_placement
 		self.target_reference_placement = target_reference_placement
-		self.rotation = (target_reference_placement.orientation - source_reference_placement.orientation).wrap()
+		self.rotation = source_reference_placement.rotation_onto(target_reference_placement)
 		self.flip = target_reference_placement.flipped != source_reference_placement.flipped
 		self.displacement = target_reference_placement.position - source_reference_placement.position
 
@@ -55,14 +53,8 @@ class CloneTransactionOperator(ABC):
 		if self.flip:
 			yield FlipCommand(target=target_item)
 		if isinstance(target_item, Footprint):
-			rotation = self.rotation.degrees
-			if self.flip:
-				source_angle = self.source_reference_placement.orientation.degrees
-				target_angle = self.target_reference_placement.orientation.degrees
-				flipped_angle = copysign(180 - abs(source_angle), source_angle)
-				rotation = 180 - flipped_angle - target_angle
-			rotation += (self.target_reference_placement.orientation - self.source_reference_placement.orientation).degrees
-			yield RotateCommand(target=target_item, rotation=Angle.from_degrees(rotation))
+			# Rotation is for the orientation after the flip
+			yield RotateCommand(target=target_item, rotation=self.rotation)
 
 
 @final
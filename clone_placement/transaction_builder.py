@@ -29,7 +29,7 @@ class CloneTransactionBuilder():
 		target_reference: Placement,
 		target: CommandTarget,
 	):
-		rotation = (target_reference.orientation - source_reference.orientation).wrap()
+		rotation = source_reference.rotation_onto(target_reference)
 		flip = target_reference.flipped != source_reference.flipped
 		displacement = target_reference.position - source_reference.position
 		if displacement != Vector2.ZERO():
@@ -37,15 +37,16 @@ class CloneTransactionBuilder():
 				target=target,
 				displacement=displacement,
 			)
-		if rotation != 0:
-			yield RotateCommand(
-				target=target,
-				rotation=rotation,
-			)
+		# Flip first, the rotation is for the flipped orientation
 		if flip:
 			yield FlipCommand(
 				target=target,
 			)
+		if rotation.value != 0:
+			yield RotateCommand(
+				target=target,
+				rotation=rotation,
+			)
 
 	def add_route(
 		self,
@@ -1,4 +1,4 @@
-from .node import Node
+from .node import Node, NodeView
 from .selection import Selection
 from .parser import Parser
 from .entity_path import (
@@ -38,5 +38,11 @@ from .board import (
 	BoardLayer,
 	Layer,
 )
+from .geometry_tables import GeometryTables
+from .sibling_index import SiblingIndex
+from .spatial_index import (
+	Box,
+	SpatialIndex,
+)
 from .schematic_loader import SchematicLoader
 from .layout_loader import LayoutLoader
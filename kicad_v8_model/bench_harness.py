@@ -0,0 +1,203 @@
+"""
+Repeatable timing of benchmark operations
+
+Each operation is run a few times untimed to warm up caches, then timed over
+a number of repeats with the garbage collector paused (after a full collect),
+so that a collection triggered by an earlier run isn't billed to a later one.
+Results carry the median, 95th percentile and standard deviation, plus a
+bootstrapped 95% confidence interval of the median.
+
+Results can be saved as a JSON baseline, and later runs compared against it:
+an operation is flagged as a regression when its median is slower than the
+baseline median by more than the threshold, and the whole confidence interval
+is slower than the baseline median (i.e. it's not just noise).
+"""
+from dataclasses import asdict, dataclass, field
+import gc
+import json
+import logging
+import math
+from pathlib import Path
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+# Resamples used for the confidence interval of the median
+BOOTSTRAP_RESAMPLES = 1000
+
+# Relative slowdown of the median that counts as a regression
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+	""" Nearest-rank percentile """
+	rank = max(1, math.ceil(fraction * len(sorted_samples)))
+	return sorted_samples[rank - 1]
+
+
+def bootstrap_median_interval(samples: List[float], confidence: float = 0.95) -> Tuple[float, float]:
+	# Fixed seed, so the same samples always give the same interval
+	rng = random.Random(0)
+	medians = sorted(
+		statistics.median(rng.choices(samples, k=len(samples)))
+		for _ in range(BOOTSTRAP_RESAMPLES)
+	)
+	tail = (1 - confidence) / 2
+	return percentile(medians, tail), percentile(medians, 1 - tail)
+
+
+@dataclass
+class BenchmarkResult():
+	name: str
+	samples: List[float]
+	median: float
+	p95: float
+	mean: float
+	stddev: float
+	ci_low: float
+	ci_high: float
+
+	@staticmethod
+	def from_samples(name: str, samples: List[float]) -> "BenchmarkResult":
+		sorted_samples = sorted(samples)
+		ci_low, ci_high = bootstrap_median_interval(samples)
+		return BenchmarkResult(
+			name=name,
+			samples=samples,
+			median=statistics.median(samples),
+			p95=percentile(sorted_samples, 0.95),
+			mean=statistics.fmean(samples),
+			stddev=statistics.stdev(samples) if len(samples) > 1 else 0.0,
+			ci_low=ci_low,
+			ci_high=ci_high,
+		)
+
+	def __str__(self):
+		return (
+			f"bench: {self.name}, "
+			f"median: {self.median:.3f}s "
+			f"(95% CI {self.ci_low:.3f}-{self.ci_high:.3f}s), "
+			f"p95: {self.p95:.3f}s, "
+			f"stddev: {self.stddev:.3f}s, "
+			f"n: {len(self.samples)}"
+		)
+
+
+def run_benchmark(
+	name: str,
+	op: Callable[[], None],
+	repeats: int = 10,
+	warmup: int = 1,
+	setup: Optional[Callable[[], None]] = None,
+	disable_gc: bool = True,
+) -> BenchmarkResult:
+	"""
+	Time op over repeats runs, after warmup untimed runs.  Setup (if given) is
+	run untimed before every run, e.g. to create a fresh project to load into.
+	"""
+	samples: List[float] = []
+	gc_was_enabled = gc.isenabled()
+	try:
+		for iteration in range(warmup + repeats):
+			if setup is not None:
+				setup()
+			gc.collect()
+			if disable_gc:
+				gc.disable()
+			t0 = time.perf_counter()
+			op()
+			t1 = time.perf_counter()
+			if gc_was_enabled:
+				gc.enable()
+			if iteration >= warmup:
+				samples.append(t1 - t0)
+	finally:
+		if gc_was_enabled:
+			gc.enable()
+	return BenchmarkResult.from_samples(name, samples)
+
+
+@dataclass
+class Regression():
+	name: str
+	baseline_median: float
+	median: float
+
+	@property
+	def slowdown(self) -> float:
+		return self.median / self.baseline_median - 1
+
+	def __str__(self):
+		return (
+			f"regression: {self.name}, "
+			f"median: {self.baseline_median:.3f}s -> {self.median:.3f}s "
+			f"(+{self.slowdown * 100:.0f}%)"
+		)
+
+
+@dataclass
+class BenchmarkSession():
+	""" Collects results of one run, for saving and comparing against a baseline """
+
+	repeats: int = 10
+	warmup: int = 1
+	results: Dict[str, BenchmarkResult] = field(default_factory=dict)
+
+	def run(
+		self,
+		name: str,
+		op: Callable[[], None],
+		setup: Optional[Callable[[], None]] = None,
+		repeats: Optional[int] = None,
+		warmup: Optional[int] = None,
+	) -> BenchmarkResult:
+		result = run_benchmark(
+			name,
+			op,
+			repeats=self.repeats if repeats is None else repeats,
+			warmup=self.warmup if warmup is None else warmup,
+			setup=setup,
+		)
+		self.results[name] = result
+		print("")
+		print(result)
+		print("")
+		return result
+
+	def to_json(self) -> Dict[str, Any]:
+		return {
+			"python": sys.version.split()[0],
+			"repeats": self.repeats,
+			"warmup": self.warmup,
+			"results": {
+				name: asdict(result)
+				for name, result in self.results.items()
+			},
+		}
+
+	def save(self, path: Path):
+		with open(path, "w", encoding="utf-8") as fp:
+			json.dump(self.to_json(), fp, indent=2)
+		logger.info("Saved %d benchmark results to %s", len(self.results), path)
+
+	def compare(self, path: Path, threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> List[Regression]:
+		""" Compare against a saved baseline, returns the regressions """
+		with open(path, "r", encoding="utf-8") as fp:
+			baseline = json.load(fp)["results"]
+		regressions: List[Regression] = []
+		for name, result in self.results.items():
+			if (previous := baseline.get(name)) is None:
+				logger.info("No baseline for %s", name)
+				continue
+			baseline_median = previous["median"]
+			change = result.median / baseline_median - 1
+			logger.info("%s: %+.1f%% against baseline", name, change * 100)
+			if change > threshold and result.ci_low > baseline_median:
+				regressions.append(Regression(name, baseline_median, result.median))
+		return regressions
@@ -1,14 +1,18 @@
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 from dataclasses import dataclass, field
 import re
 from pathlib import Path
 
 from .board import BoardLayer, Layer
-from .entity_path import EntityPath, EntityPathComponent
+from .entity_path import EntityPath, EntityPathComponent, EntityPathTrie
 from .entity_traits import HasArc, HasLine, HasPolygon, HasProperties, HasId, HasPath, Net, HasNet, HasLayer, HasPosition, HasOrientation
 from .angle import Angle
 from .vector2 import Vector2
 
+if TYPE_CHECKING:
+	from .geometry_tables import GeometryTables
+	from .sibling_index import SiblingIndex
+
 
 # Many of the PCB-related dataclasses are incomplete, containing only what we
 # currently need (or slightly more).
@@ -88,6 +92,9 @@ class SheetDefinition(HasId):
 	def __str__(self):
 		return Path(self.filename).stem
 
+	def __hash__(self):
+		return hash(self.id)
+
 
 @dataclass
 class SheetInstance(HasPath):
@@ -103,6 +110,9 @@ class SheetInstance(HasPath):
 	def __str__(self):
 		return f"{self.name}#{self.page}"
 
+	def __hash__(self):
+		return hash(self.path)
+
 
 @dataclass
 class SymbolDefinition(HasId):
@@ -239,6 +249,10 @@ class Project():
 	sheet_instances: Dict[EntityPath, SheetInstance] = field(init=False)
 	symbol_definitions: Dict[EntityPathComponent, SymbolDefinition] = field(init=False)
 	symbol_instances: Dict[EntityPath, SymbolInstance] = field(init=False)
+	# Sheet and symbol instances by path, for finding everything under a sheet
+	paths: EntityPathTrie[Union[SheetInstance, SymbolInstance]] = field(init=False)
+	# Sheet and symbol instances by parent and definition, for spaths
+	siblings: "SiblingIndex" = field(init=False)
 	component_definitions: List[ComponentDefinition] = field(init=False)
 	component_instances: Dict[str, ComponentInstance] = field(init=False)
 	root_sheet_instance: SheetInstance = field(init=False)
@@ -255,3 +269,34 @@ class Project():
 	track_arcs: Dict[EntityPathComponent, ArcRoute] = field(init=False)
 	zones: Dict[EntityPathComponent, PolygonRoute] = field(init=False)
 	vias: Dict[EntityPathComponent, Via] = field(init=False)
+	# Columnar copy of the routes above, built on first use
+	_geometry: Optional["GeometryTables"] = field(init=False, default=None)
+
+	@property
+	def geometry(self) -> Optional["GeometryTables"]:
+		""" Columnar copy of the routes, None without NumPy """
+		if self._geometry is None:
+			from .geometry_tables import GeometryTables
+			self._geometry = GeometryTables.build(
+				list(self.tracks.values()),
+				list(self.track_arcs.values()),
+				list(self.vias.values()),
+				list(self.zones.values()),
+			)
+		return self._geometry
+
+	def sheets_under(self, path: EntityPath) -> List[SheetInstance]:
+		""" The sheet at the path and all sheets below it """
+		return [
+			instance
+			for instance in self.paths.values_under(path)
+			if isinstance(instance, SheetInstance)
+		]
+
+	def symbols_under(self, path: EntityPath) -> List[SymbolInstance]:
+		""" Symbols in the sheet at the path and all sheets below it """
+		return [
+			instance
+			for instance in self.paths.values_under(path)
+			if isinstance(instance, SymbolInstance)
+		]
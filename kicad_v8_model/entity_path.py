@@ -1,6 +1,7 @@
-from dataclasses import dataclass
-from typing import Any, List, Sequence, Union, overload
+from dataclasses import dataclass, field
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar, Union, overload
 from uuid import UUID
+from weakref import WeakValueDictionary
 
 try:
     from pcbnew import KIID, KIID_PATH  # pyright: ignore
@@ -15,9 +16,29 @@ except ModuleNotFoundError:
             return ""
 
 
-@dataclass(frozen=True, eq=True)
+ValueType = TypeVar("ValueType")
+
+
+@dataclass(frozen=True, eq=True, slots=True)
 class EntityPathComponent():
-    value: UUID
+    """
+    Holds the uuid as its 128-bit int, which is much cheaper to parse, hash
+    and compare than a UUID object, the UUID is only built when asked for
+    """
+    int_value: int
+    _uuid: Optional[UUID] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if type(self.int_value) is not int:
+            # Also accept a UUID, as before
+            object.__setattr__(self, "int_value", UUID(str(self.int_value)).int)
+
+    @property
+    def value(self) -> UUID:
+        if (value := self._uuid) is None:
+            value = UUID(int=self.int_value)
+            object.__setattr__(self, "_uuid", value)
+        return value
 
     @overload
     @staticmethod
@@ -32,23 +53,35 @@ class EntityPathComponent():
     @staticmethod
     def parse(value: Union[str, KIID]) -> "EntityPathComponent":
         if isinstance(value, str):
-            return EntityPathComponent(UUID(hex=value))
+            # Same as UUID(hex=value).int for plain uuids
+            digits = value.replace("-", "")
+            if len(digits) == 32:
+                return EntityPathComponent(int(digits, 16))
+            # Braces, urn:uuid: prefix, or invalid (raises)
+            return EntityPathComponent(UUID(hex=value).int)
         elif isinstance(value, KIID):
             return EntityPathComponent.parse(value.AsString())
         else:
             raise ValueError()
 
+    def __hash__(self):
+        return hash(self.int_value)
+
+    def __eq__(self, other: Any):
+        return type(other) is EntityPathComponent and self.int_value == other.int_value
+
     def __str__(self):
-        return str(self.value)
+        digits = f"{self.int_value:032x}"
+        return f"{digits[:8]}-{digits[8:12]}-{digits[12:16]}-{digits[16:20]}-{digits[20:]}"
 
     def __repr__(self):
         return str(self)
 
     def __lt__(self, other: "EntityPathComponent"):
-        return self.value < other.value
+        return self.int_value < other.int_value
 
     def __gt__(self, other: "EntityPathComponent"):
-        return self.value > other.value
+        return self.int_value > other.int_value
 
     @overload
     def __add__(self, other: "EntityPathComponent") -> "EntityPath":
@@ -60,16 +93,38 @@ class EntityPathComponent():
 
     def __add__(self, other: Union["EntityPath", "EntityPathComponent"]) -> "EntityPath":
         if isinstance(other, EntityPath):
-            return EntityPath(parts=[self, *other])
+            return EntityPath.of((self, *other.parts))
         elif isinstance(other, EntityPathComponent):
-            return EntityPath(parts=[self, other])
+            return EntityPath.of((self, other))
         else:
             raise TypeError()
 
 
+# Canonical instance of each live path, see EntityPath.of
+_interned_paths: "WeakValueDictionary[Tuple[EntityPathComponent, ...], EntityPath]" = WeakValueDictionary()
+
+
 @dataclass(frozen=True)
 class EntityPath(Sequence[EntityPathComponent]):
-    parts: Sequence[EntityPathComponent]
+    """
+    Parts are held as a tuple and the hash is cached, as paths are dict keys
+    all over the project.  Paths built by parsing, slicing or concatenating
+    are interned, so equal paths are usually the same object.
+    """
+    parts: Tuple[EntityPathComponent, ...]
+    _hash: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if type(self.parts) is not tuple:
+            object.__setattr__(self, "parts", tuple(self.parts))
+
+    @staticmethod
+    def of(parts: Iterable[EntityPathComponent]) -> "EntityPath":
+        """ Interned path """
+        key = tuple(parts)
+        if (path := _interned_paths.get(key)) is None:
+            path = _interned_paths[key] = EntityPath(key)
+        return path
 
     @overload
     @staticmethod
@@ -86,11 +141,11 @@ class EntityPath(Sequence[EntityPathComponent]):
         if isinstance(path, str):
             if path.startswith("/"):
                 path = path[1:]
-            return EntityPath(parts=[
+            return EntityPath.of(
                 EntityPathComponent.parse(part)
                 for index, part in enumerate(path.split("/"))
                 if not (part == "" and index == 0)
-            ])
+            )
         elif isinstance(path, KIID_PATH):
             return EntityPath.parse(path.AsString())
         else:
@@ -109,19 +164,29 @@ class EntityPath(Sequence[EntityPathComponent]):
         return bool(self.parts)
 
     def __hash__(self):
-        return hash(tuple(part for part in self.parts))
+        if (value := self._hash) is None:
+            value = hash(self.parts)
+            object.__setattr__(self, "_hash", value)
+        return value
 
     def __eq__(self, other: Any):
+        if self is other:
+            return True
         return (
             isinstance(other, EntityPath) and
-            tuple(self.parts) == tuple(other.parts)
+            hash(self) == hash(other) and
+            self.parts == other.parts
         )
 
     def __lt__(self, other: "EntityPath"):
-        return list(self.parts) < list(other.parts)
+        return self.parts < other.parts
 
     def __gt__(self, other: "EntityPath"):
-        return list(self.parts) > list(other.parts)
+        return self.parts > other.parts
+
+    def __reduce__(self):
+        # Intern again when unpickled, e.g. results from worker processes
+        return (EntityPath.of, (self.parts,))
 
     @overload
     def __getitem__(self, index_or_slice: int) -> EntityPathComponent:
@@ -135,7 +200,7 @@ class EntityPath(Sequence[EntityPathComponent]):
         if isinstance(index_or_slice, int):
             return self.parts[index_or_slice]
         else:
-            return EntityPath(self.parts[index_or_slice])
+            return EntityPath.of(self.parts[index_or_slice])
 
     def __str__(self):
         return "/" + "/".join(map(str, self.parts))
@@ -144,13 +209,9 @@ class EntityPath(Sequence[EntityPathComponent]):
         return str(self)
 
     def startswith(self, prefix: Sequence[EntityPathComponent]):
-        return (
-            len(self) >= len(prefix) and
-            all(
-                a == b
-                for a, b in zip(self, prefix)
-            )
-        )
+        if isinstance(prefix, EntityPath):
+            prefix = prefix.parts
+        return self.parts[:len(prefix)] == tuple(prefix)
 
     @overload
     def __add__(self, suffix: EntityPathComponent) -> "EntityPath":
@@ -163,16 +224,131 @@ class EntityPath(Sequence[EntityPathComponent]):
     def __add__(self, suffix: Union[EntityPathComponent, Sequence[EntityPathComponent]]) -> "EntityPath":
         """ Concatenate """
         if isinstance(suffix, EntityPathComponent):
-            return self + [suffix]
+            return EntityPath.of(self.parts + (suffix,))
         else:
-            return EntityPath(parts=list(self) + list(suffix))
+            return EntityPath.of(self.parts + tuple(suffix))
 
     def __and__(self, other: "EntityPath") -> "EntityPath":
         """ Common prefix """
-        prefix: List[EntityPathComponent] = []
-        for a, b in zip(self, other):
-            if a == b:
-                prefix += [a]
-            else:
+        if self is other:
+            return self
+        length = 0
+        for a, b in zip(self.parts, other.parts):
+            if a != b:
+                break
+            length += 1
+        return self if length == len(self.parts) else EntityPath.of(self.parts[:length])
+
+
+class EntityPathTrieNode(Generic[ValueType]):
+
+    __slots__ = ("children", "path", "value")
+
+    children: Dict[EntityPathComponent, "EntityPathTrieNode[ValueType]"]
+    # Set if a value is stored at this node
+    path: Optional[EntityPath]
+    value: Optional[ValueType]
+
+    def __init__(self):
+        self.children = {}
+        self.path = None
+        self.value = None
+
+
+class EntityPathTrie(Generic[ValueType]):
+    """
+    Map of paths to values, which can list everything under a path or find
+    the deepest stored prefix of a path, in time proportional to the depth of
+    the path (plus the number of results) rather than to the number of paths
+    """
+
+    root: EntityPathTrieNode[ValueType]
+    count: int
+
+    def __init__(self, items: Iterable[Tuple[EntityPath, ValueType]] = ()):
+        self.root = EntityPathTrieNode()
+        self.count = 0
+        for path, value in items:
+            self[path] = value
+
+    def find(self, path: Sequence[EntityPathComponent]) -> Optional[EntityPathTrieNode[ValueType]]:
+        node = self.root
+        for part in path:
+            if (node := node.children.get(part)) is None:
+                return None
+        return node
+
+    def __len__(self):
+        return self.count
+
+    def __setitem__(self, path: EntityPath, value: ValueType):
+        node = self.root
+        for part in path:
+            if (child := node.children.get(part)) is None:
+                child = node.children[part] = EntityPathTrieNode()
+            node = child
+        if node.path is None:
+            self.count += 1
+        node.path = path
+        node.value = value
+
+    def __getitem__(self, path: EntityPath) -> ValueType:
+        if (node := self.find(path)) is None or node.path is None:
+            raise KeyError(path)
+        return node.value  # pyright: ignore
+
+    def __contains__(self, path: EntityPath):
+        return (node := self.find(path)) is not None and node.path is not None
+
+    def __delitem__(self, path: EntityPath):
+        nodes = [self.root]
+        for part in path:
+            if (child := nodes[-1].children.get(part)) is None:
+                raise KeyError(path)
+            nodes.append(child)
+        if nodes[-1].path is None:
+            raise KeyError(path)
+        nodes[-1].path = None
+        nodes[-1].value = None
+        self.count -= 1
+        # Prune branches left empty
+        for parent, part, node in zip(reversed(nodes[:-1]), reversed(path.parts), reversed(nodes)):
+            if node.children or node.path is not None:
+                break
+            del parent.children[part]
+
+    def items_under(self, prefix: Sequence[EntityPathComponent]) -> Iterator[Tuple[EntityPath, ValueType]]:
+        """ Everything at or under the prefix, depth first """
+        if (start := self.find(prefix)) is None:
+            return
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node.path is not None:
+                yield node.path, node.value  # pyright: ignore
+            stack.extend(node.children.values())
+
+    def values_under(self, prefix: Sequence[EntityPathComponent]) -> Iterator[ValueType]:
+        return (value for _, value in self.items_under(prefix))
+
+    def longest_prefix(self, path: Sequence[EntityPathComponent]) -> Optional[EntityPath]:
+        """ Deepest stored path which the path starts with (including the path itself) """
+        node = self.root
+        found = node.path
+        for part in path:
+            if (node := node.children.get(part)) is None:
                 break
-        return EntityPath(prefix)
+            if node.path is not None:
+                found = node.path
+        return found
+
+    def common_prefix(self) -> EntityPath:
+        """ Longest prefix shared by all stored paths, where the trie first branches or a path ends """
+        if not self.count:
+            raise ValueError("No paths")
+        node = self.root
+        parts: List[EntityPathComponent] = []
+        while node.path is None and len(node.children) == 1:
+            (part, node), = node.children.items()
+            parts.append(part)
+        return EntityPath.of(parts)
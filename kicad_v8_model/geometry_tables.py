@@ -0,0 +1,227 @@
+"""
+Columnar copies of the board routing geometry
+
+The project holds tracks, arcs, vias and zones as one dataclass per item,
+which is convenient but makes any geometric query over a whole board a
+Python loop.  These tables hold the same geometry as NumPy arrays, one row
+per item (in the same order as the project dicts), so queries and bulk
+transforms are a few array operations:
+
+	tables = project.geometry
+	rows = tables.tracks.rows_in_box(Vector2(0, 0), Vector2(50_000_000, 50_000_000))
+	ids = [tables.tracks.ids[row] for row in rows]
+
+Coordinates are int64 nanometres, layers are the Kicad layer numbers and
+nets are net codes.  The tables are built on first use of project.geometry,
+and only when NumPy is installed, otherwise project.geometry is None.
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from .entities import ArcRoute, PolygonRoute, StraightRoute, Via
+from .entity_path import EntityPathComponent
+from .vector2 import Vector2
+
+
+logger = logging.getLogger(__name__)
+
+
+# NumPy arrays, typed loosely so this module imports without NumPy
+Array = Any
+
+
+def _points(points: Iterable[Vector2]) -> Array:
+	""" (n, 2) array of x, y """
+	array = numpy.array([(point.x, point.y) for point in points], dtype=numpy.int64)
+	return array.reshape(-1, 2)
+
+
+def _column(values: Iterable[int]) -> Array:
+	return numpy.fromiter(values, dtype=numpy.int32)
+
+
+def _overlaps_box(low: Array, high: Array, box_low: Vector2, box_high: Vector2) -> Array:
+	""" Mask of rows whose bounding box (low, high) overlaps the box """
+	return (
+		(low[:, 0] <= box_high.x) & (high[:, 0] >= box_low.x) &
+		(low[:, 1] <= box_high.y) & (high[:, 1] >= box_low.y)
+	)
+
+
+@dataclass
+class GeometryTable(ABC):
+	""" Row i of every column describes the item ids[i] """
+
+	ids: List[EntityPathComponent]
+	layer: Array
+	net: Array
+	_rows: Optional[Dict[EntityPathComponent, int]] = field(default=None, init=False, repr=False)
+
+	def __len__(self):
+		return len(self.ids)
+
+	def row(self, id: EntityPathComponent) -> int:
+		""" Row of an item, by uuid """
+		if self._rows is None:
+			self._rows = {
+				id: row
+				for row, id in enumerate(self.ids)
+			}
+		return self._rows[id]
+
+	@abstractmethod
+	def bounds(self) -> Array:
+		""" (n, 2, 2) array of the (low, high) corners of each row's bounding box """
+		...
+
+	def rows_in_box(self, box_low: Vector2, box_high: Vector2) -> Array:
+		""" Rows whose bounding box overlaps the box """
+		bounds = self.bounds()
+		return numpy.flatnonzero(_overlaps_box(bounds[:, 0], bounds[:, 1], box_low, box_high))
+
+	def rows_on_layer(self, layer: int) -> Array:
+		return numpy.flatnonzero(self.layer == layer)
+
+	def rows_on_net(self, net: int) -> Array:
+		return numpy.flatnonzero(self.net == net)
+
+
+@dataclass
+class TrackTable(GeometryTable):
+	start: Array
+	end: Array
+
+	@staticmethod
+	def build(tracks: Sequence[StraightRoute]) -> "TrackTable":
+		return TrackTable(
+			ids=[track.id for track in tracks],
+			layer=_column(track.layer.number for track in tracks),
+			net=_column(track.net.number for track in tracks),
+			start=_points(track.start for track in tracks),
+			end=_points(track.end for track in tracks),
+		)
+
+	def bounds(self) -> Array:
+		return numpy.stack((
+			numpy.minimum(self.start, self.end),
+			numpy.maximum(self.start, self.end),
+		), axis=1)
+
+
+@dataclass
+class ArcTable(GeometryTable):
+	start: Array
+	mid: Array
+	end: Array
+
+	@staticmethod
+	def build(arcs: Sequence[ArcRoute]) -> "ArcTable":
+		return ArcTable(
+			ids=[arc.id for arc in arcs],
+			layer=_column(arc.layer.number for arc in arcs),
+			net=_column(arc.net.number for arc in arcs),
+			start=_points(arc.start for arc in arcs),
+			mid=_points(arc.mid for arc in arcs),
+			end=_points(arc.end for arc in arcs),
+		)
+
+	def bounds(self) -> Array:
+		"""
+		Box around the three points, which can miss a bulge past an axis
+		extreme of the arc, but is good enough for picking candidates
+		"""
+		points = numpy.stack((self.start, self.mid, self.end), axis=1)
+		return numpy.stack((points.min(axis=1), points.max(axis=1)), axis=1)
+
+
+@dataclass
+class ViaTable(GeometryTable):
+	""" Layer is the first (top) layer, layers holds both """
+
+	position: Array
+	layers: Array
+
+	@staticmethod
+	def build(vias: Sequence[Via]) -> "ViaTable":
+		layers = numpy.array([
+			(via.layers[0].number, via.layers[1].number)
+			for via in vias
+		], dtype=numpy.int32).reshape(-1, 2)
+		return ViaTable(
+			ids=[via.id for via in vias],
+			layer=layers[:, 0].copy(),
+			net=_column(via.net.number for via in vias),
+			position=_points(via.position for via in vias),
+			layers=layers,
+		)
+
+	def bounds(self) -> Array:
+		return numpy.stack((self.position, self.position), axis=1)
+
+
+@dataclass
+class ZoneTable(GeometryTable):
+	"""
+	Outlines of all zones are concatenated into points, the outline of row i
+	is points[offsets[i]:offsets[i + 1]]
+	"""
+
+	points: Array
+	offsets: Array
+
+	@staticmethod
+	def build(zones: Sequence[PolygonRoute]) -> "ZoneTable":
+		offsets = numpy.zeros(len(zones) + 1, dtype=numpy.int64)
+		numpy.cumsum([len(zone.points) for zone in zones], out=offsets[1:])
+		return ZoneTable(
+			ids=[zone.id for zone in zones],
+			layer=_column(zone.layer.number for zone in zones),
+			net=_column(zone.net.number for zone in zones),
+			points=_points(point for zone in zones for point in zone.points),
+			offsets=offsets,
+		)
+
+	def outline(self, row: int) -> Array:
+		return self.points[self.offsets[row]:self.offsets[row + 1]]
+
+	def bounds(self) -> Array:
+		if not len(self):
+			return numpy.zeros((0, 2, 2), dtype=numpy.int64)
+		starts = self.offsets[:-1]
+		return numpy.stack((
+			numpy.minimum.reduceat(self.points, starts, axis=0),
+			numpy.maximum.reduceat(self.points, starts, axis=0),
+		), axis=1)
+
+
+@dataclass
+class GeometryTables():
+	tracks: TrackTable
+	track_arcs: ArcTable
+	vias: ViaTable
+	zones: ZoneTable
+
+	@staticmethod
+	def build(
+		tracks: Sequence[StraightRoute],
+		track_arcs: Sequence[ArcRoute],
+		vias: Sequence[Via],
+		zones: Sequence[PolygonRoute],
+	) -> Optional["GeometryTables"]:
+		""" None if NumPy isn't available """
+		if numpy is None:
+			logger.debug("NumPy not available, not building geometry tables")
+			return None
+		return GeometryTables(
+			tracks=TrackTable.build(tracks),
+			track_arcs=ArcTable.build(track_arcs),
+			vias=ViaTable.build(vias),
+			zones=ZoneTable.build(zones),
+		)
@@ -1,16 +1,15 @@
 import logging
-from typing import Dict, List, Type
+from typing import Callable, Dict, List, Type
 
 from ..utils.to_dict_strict import to_dict_strict
+from ..utils.tracing import Tracer
 
-from .angle import Angle
-from .vector2 import Vector2
-
-from .parser import Parser, FastParser
-from .entities import ArcRoute, Footprint, PolygonRoute, Project, StraightRoute, Via
-from .entity_path import EntityPath, EntityPathComponent
+from .parser import Parser, ParseSchema, FastParser, StreamingParser, ParserObserver, NullParserObserver
+from .entities import ArcRoute, ComponentInstance, Footprint, PolygonRoute, Project, StraightRoute, Via
+from .entity_path import EntityPath
 from .entity_traits import Net
 from .board import BoardLayer, Layer
+from .node import Node, NodeStream
 from .selection import Selection
 
 
@@ -46,27 +45,74 @@ class BaseLayoutLoader():
 		project.track_arcs = to_dict_strict(self.track_arcs, lambda route: route.id)
 		project.zones = to_dict_strict(self.zones, lambda route: route.id)
 		project.vias = to_dict_strict(self.vias, lambda via: via.id)
+		# Routes changed, rebuild the geometry tables when next used
+		project._geometry = None
 
 
 class LayoutLoader(BaseLayoutLoader):
 
 	parser_class: Type[Parser] = FastParser
 
+	# Only parse what we read, filled_polygon in particular is often most of the file
+	schema: ParseSchema = {
+		"net": None,
+		"layers": None,
+		"footprint": {
+			"layer": None,
+			"uuid": None,
+			"at": None,
+			"property": None,
+			"path": None,
+			"attr": None,
+		},
+		"segment": None,
+		"arc": None,
+		"via": None,
+		"zone": {
+			"uuid": None,
+			"net": None,
+			"layer": None,
+			"polygon": None,
+		},
+	}
+
 	@staticmethod
-	def load(project: Project, filename: str):
-		loader = LayoutLoader(project, filename)
-		loader.get_result()
+	def load(project: Project, filename: str, observer: ParserObserver = NullParserObserver()):
+		with Tracer.span("load layout", path=filename):
+			# Stores the result in the project
+			LayoutLoader(project, filename, observer)
 
-	def __init__(self, project: Project, filename: str):
+	def __init__(self, project: Project, filename: str, observer: ParserObserver = NullParserObserver()):
 		super().__init__(project)
-		pcb_node = self.parser_class().parse_file(filename).kicad_pcb
-		self.read_nets(pcb_node.net)
-		self.read_layers(pcb_node.layers)
-		self.read_footprints(pcb_node.footprint)
-		self.read_tracks(pcb_node.segment)
-		self.read_track_arcs(pcb_node.arc)
-		self.read_track_zones(pcb_node.zone)
-		self.read_vias(pcb_node.via)
+		parser = self.parser_class(observer=observer, schema=self.schema)
+		if isinstance(parser, StreamingParser):
+			with Tracer.span("read layout stream", parser=type(parser).__name__):
+				self.read_stream(parser.stream_file(filename))
+		else:
+			self.read_tree(parser.parse_file(filename).kicad_pcb)
+		self.get_result()
+
+	def read_tree(self, pcb_node: Selection):
+		with Tracer.span("read nets") as span:
+			self.read_nets(pcb_node.net)
+			span.set(nets=len(self.nets))
+		with Tracer.span("read layers"):
+			self.read_layers(pcb_node.layers)
+		with Tracer.span("read footprints") as span:
+			self.read_footprints(pcb_node.footprint)
+			span.set(footprints=len(self.footprints))
+		with Tracer.span("read tracks") as span:
+			self.read_tracks(pcb_node.segment)
+			span.set(tracks=len(self.tracks))
+		with Tracer.span("read track arcs") as span:
+			self.read_track_arcs(pcb_node.arc)
+			span.set(track_arcs=len(self.track_arcs))
+		with Tracer.span("read zones") as span:
+			self.read_track_zones(pcb_node.zone)
+			span.set(zones=len(self.zones))
+		with Tracer.span("read vias") as span:
+			self.read_vias(pcb_node.via)
+			span.set(vias=len(self.vias))
 		# self.read_graphics(
 		# 	pcb_node.gr_text +
 		# 	pcb_node.gr_text_box +
@@ -77,19 +123,51 @@ class LayoutLoader(BaseLayoutLoader):
 		# 	pcb_node.gr_poly +
 		# 	pcb_node.bezier
 		# )
-		self.get_result()
+
+	def read_stream(self, pcb_node: NodeStream):
+		"""
+		Build entities as the parser yields each top-level node, so we never
+		hold the whole node tree in memory.
+
+		Kicad writes the layers and nets before any items which reference them,
+		but just in case, hold back items until we have seen the layer table.
+		"""
+		component_instances = self.get_component_instances_by_path()
+		readers: Dict[str, Callable[[Selection], None]] = {
+			"footprint": lambda node: self.read_footprint(node, component_instances),
+			"segment": self.read_track,
+			"arc": self.read_track_arc,
+			"zone": self.read_track_zone,
+			"via": self.read_via,
+		}
+		deferred: List[Node] = []
+		for node in pcb_node.children:
+			if node.key == "net":
+				self.read_net(Selection([node]))
+			elif node.key == "layers":
+				self.read_layers(Selection([node]))
+			elif node.key in readers:
+				if self.layers:
+					readers[node.key](Selection([node]))
+				else:
+					deferred.append(node)
+		for node in deferred:
+			readers[node.key](Selection([node]))
 
 	def read_nets(self, net_nodes: Selection):
-		nets: List[Net] = []
 		for net_node in net_nodes:
-			net_id = int(net_node[0])
-			net_name = net_node[1]
-			net = Net(
-				number=net_id,
-				name=net_name,
-			)
-			nets.append(net)
-		self.nets = to_dict_strict(nets, lambda net: net.number)
+			self.read_net(net_node)
+
+	def read_net(self, net_node: Selection):
+		net_id = net_node.as_int()
+		net_name = net_node[1]
+		net = Net(
+			number=net_id,
+			name=net_name,
+		)
+		if net_id in self.nets:
+			raise KeyError("Duplicate key", net_id, repr(self.nets[net_id]), repr(net))
+		self.nets[net_id] = net
 
 	def read_layers(self, layers_node: Selection):
 		layers: List[Layer] = []
@@ -106,129 +184,132 @@ class LayoutLoader(BaseLayoutLoader):
 			layers.append(layer)
 		self.layers = to_dict_strict(layers, lambda layer: layer.type.value)
 
-	def _vector(self, node: Selection, index: int = 0):
-		x = int(float(node[index]) * 1e6)
-		y = int(float(node[index + 1]) * 1e6)
-		return Vector2(
-			x=x,
-			y=y,
-		)
-
-	def _angle(self, node: Selection, index: int = 2):
-		angle = float(node.value_by_index(index, "0"))
-		return Angle.from_degrees(angle)
-
-	def read_footprints(self, footprint_nodes: Selection):
-		project = self.project
-		component_instances = {
+	def get_component_instances_by_path(self) -> Dict[EntityPath, ComponentInstance]:
+		return {
 			unit.path: component_instance
-			for component_instance in project.component_instances.values()
+			for component_instance in self.project.component_instances.values()
 			for unit in component_instance.units
 		}
-		root_sheet_id = project.root_sheet_definition.id
+
+	def read_footprints(self, footprint_nodes: Selection):
+		component_instances = self.get_component_instances_by_path()
 		for footprint_node in footprint_nodes:
-			locked = "locked" in footprint_node.values
-			layer_name = footprint_node.layer[0]
-			footprint_id = EntityPathComponent.parse(footprint_node.uuid[0])
-			position = self._vector(footprint_node.at)
-			angle = self._angle(footprint_node.at)
-			properties = {
-				property_node[0]: property_node[1]
-				for property_node in footprint_node.property
-			}
-			symbol_path = root_sheet_id + EntityPath.parse(footprint_node.path[0])
-			if footprint_node.attr:
-				board_only = "board_only" in footprint_node.attr.values
-			else:
-				board_only = False
-			layer = self.layers[layer_name]
-			footprint = Footprint(
-				locked=locked,
-				board_only=board_only,
-				layer=layer,
-				id=footprint_id,
-				position=position,
-				orientation=angle,
-				properties=properties,
-				symbol_path=symbol_path,
-			)
-			if not board_only:
-				footprint.component = component_instances[symbol_path]
-				self.footprints.append(footprint)
+			self.read_footprint(footprint_node, component_instances)
+
+	def read_footprint(self, footprint_node: Selection, component_instances: Dict[EntityPath, ComponentInstance]):
+		root_sheet_id = self.project.root_sheet_definition.id
+		locked = "locked" in footprint_node.values
+		layer_name = footprint_node.layer[0]
+		footprint_id = footprint_node.uuid.as_id()
+		position = footprint_node.at.as_vector()
+		angle = footprint_node.at.as_angle(2, "0")
+		properties = {
+			property_node[0]: property_node[1]
+			for property_node in footprint_node.property
+		}
+		symbol_path = root_sheet_id + EntityPath.parse(footprint_node.path[0])
+		if footprint_node.attr:
+			board_only = "board_only" in footprint_node.attr.values
+		else:
+			board_only = False
+		layer = self.layers[layer_name]
+		footprint = Footprint(
+			locked=locked,
+			board_only=board_only,
+			layer=layer,
+			id=footprint_id,
+			position=position,
+			orientation=angle,
+			properties=properties,
+			symbol_path=symbol_path,
+		)
+		if not board_only:
+			footprint.component = component_instances[symbol_path]
+			footprint.component.footprint = footprint
+			self.footprints.append(footprint)
 
 	def read_tracks(self, track_nodes: Selection):
 		for track_node in track_nodes:
-			id = EntityPathComponent.parse(track_node.uuid[0])
-			net = self.nets[int(track_node.net[0])]
-			start = self._vector(track_node.start)
-			end = self._vector(track_node.end)
-			layer_name = track_node.layer[0]
-			layer = self.layers[layer_name]
-			position = start
-			track = StraightRoute(
-				id=id,
-				position=position,
-				start=start,
-				end=end,
-				net=net,
-				layer=layer,
-			)
-			self.tracks.append(track)
+			self.read_track(track_node)
+
+	def read_track(self, track_node: Selection):
+		id = track_node.uuid.as_id()
+		net = self.nets[track_node.net.as_int()]
+		start = track_node.start.as_vector()
+		end = track_node.end.as_vector()
+		layer_name = track_node.layer[0]
+		layer = self.layers[layer_name]
+		position = start
+		track = StraightRoute(
+			id=id,
+			position=position,
+			start=start,
+			end=end,
+			net=net,
+			layer=layer,
+		)
+		self.tracks.append(track)
 
 	def read_track_arcs(self, track_arc_nodes: Selection):
 		for track_arc_node in track_arc_nodes:
-			id = EntityPathComponent.parse(track_arc_node.uuid[0])
-			net = self.nets[int(track_arc_node.net[0])]
-			start = self._vector(track_arc_node.start)
-			mid = self._vector(track_arc_node.mid)
-			end = self._vector(track_arc_node.end)
-			layer_name = track_arc_node.layer[0]
-			layer = self.layers[layer_name]
-			position = start
-			track_arc = ArcRoute(
-				id=id,
-				position=position,
-				start=start,
-				mid=mid,
-				end=end,
-				net=net,
-				layer=layer,
-			)
-			self.track_arcs.append(track_arc)
+			self.read_track_arc(track_arc_node)
+
+	def read_track_arc(self, track_arc_node: Selection):
+		id = track_arc_node.uuid.as_id()
+		net = self.nets[track_arc_node.net.as_int()]
+		start = track_arc_node.start.as_vector()
+		mid = track_arc_node.mid.as_vector()
+		end = track_arc_node.end.as_vector()
+		layer_name = track_arc_node.layer[0]
+		layer = self.layers[layer_name]
+		position = start
+		track_arc = ArcRoute(
+			id=id,
+			position=position,
+			start=start,
+			mid=mid,
+			end=end,
+			net=net,
+			layer=layer,
+		)
+		self.track_arcs.append(track_arc)
 
 	def read_track_zones(self, zone_nodes: Selection):
 		for zone_node in zone_nodes:
-			id = EntityPathComponent.parse(zone_node.uuid[0])
-			net = self.nets[int(zone_node.net[0])]
-			points = [
-				self._vector(point_node)
-				for point_node in zone_node.polygon.pts.xy
-			]
-			layer_name = zone_node.layer[0]
-			layer = self.layers[layer_name]
-			position = points[0]
-			zone = PolygonRoute(
-				id=id,
-				position=position,
-				points=points,
-				net=net,
-				layer=layer,
-			)
-			self.zones.append(zone)
+			self.read_track_zone(zone_node)
+
+	def read_track_zone(self, zone_node: Selection):
+		id = zone_node.uuid.as_id()
+		net = self.nets[zone_node.net.as_int()]
+		points = zone_node.polygon.pts.xy.as_vectors()
+		layer_name = zone_node.layer[0]
+		layer = self.layers[layer_name]
+		position = points[0]
+		zone = PolygonRoute(
+			id=id,
+			position=position,
+			points=points,
+			net=net,
+			layer=layer,
+		)
+		self.zones.append(zone)
 
 	def read_vias(self, via_nodes: Selection):
 		for via_node in via_nodes:
-			id = EntityPathComponent.parse(via_node.uuid[0])
-			net = self.nets[int(via_node.net[0])]
-			position = self._vector(via_node.at)
-			layer1_name = via_node.layers[0]
-			layer2_name = via_node.layers[1]
-			layer1 = self.layers[layer1_name]
-			layer2 = self.layers[layer2_name]
-			via = Via(
-				id=id,
-				position=position,
-				net=net,
-				layers=(layer1, layer2),
-			)
-			self.vias.append(via)
+			self.read_via(via_node)
+
+	def read_via(self, via_node: Selection):
+		id = via_node.uuid.as_id()
+		net = self.nets[via_node.net.as_int()]
+		position = via_node.at.as_vector()
+		layer1_name = via_node.layers[0]
+		layer2_name = via_node.layers[1]
+		layer1 = self.layers[layer1_name]
+		layer2 = self.layers[layer2_name]
+		via = Via(
+			id=id,
+			position=position,
+			net=net,
+			layers=(layer1, layer2),
+		)
+		self.vias.append(via)
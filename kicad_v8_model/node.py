@@ -1,9 +1,89 @@
-from dataclasses import dataclass
-from typing import Sequence
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Sequence, Tuple
+import sys
 
 
-@dataclass(frozen=True, eq=True)
+# Longest value worth interning, keeps uuids and long text out of the intern table
+INTERN_MAX_LENGTH = 16
+NUMBER_START = frozenset("0123456789+-.")
+
+
+def intern_value(value: str) -> str:
+	"""
+	Share one str between all nodes for short symbolic values (yes/no, smd,
+	layer names, ...), numbers are rarely repeated exactly so leave those be
+	"""
+	if len(value) <= INTERN_MAX_LENGTH and value and value[0] not in NUMBER_START:
+		return sys.intern(value)
+	return value
+
+
+class NodeView(Protocol):
+	""" What Selection reads from a node, provided by Node and the flat parser's FlatNode """
+
+	@property
+	def key(self) -> str:
+		...
+
+	@property
+	def values(self) -> Sequence[str]:
+		...
+
+	@property
+	def children(self) -> Sequence["NodeView"]:
+		...
+
+	def children_by_key(self, key: str) -> Sequence["NodeView"]:
+		...
+
+
+@dataclass(frozen=True, eq=True, slots=True)
 class Node():
+	""" Parsers store values and children as tuples, and intern keys """
 	key: str
 	values: Sequence[str]
 	children: Sequence["Node"]
+	# Children grouped by key, built on first lookup
+	_children_index: Optional[Dict[str, List["Node"]]] = field(default=None, init=False, repr=False, compare=False)
+
+	def children_by_key(self, key: str) -> Sequence["Node"]:
+		index = self._children_index
+		if index is None:
+			index = {}
+			for child in self.children:
+				if (group := index.get(child.key)) is None:
+					index[child.key] = [child]
+				else:
+					group.append(child)
+			object.__setattr__(self, "_children_index", index)
+		return index.get(key, ())
+
+
+@dataclass
+class NodeStream():
+	""" Node whose children are parsed on demand, one at a time, in file order """
+	key: str
+	values: Sequence[str]
+	children: Iterator[Node]
+
+
+# Plain nested tuples (key, values, children), cheap to marshal/pickle
+PackedNode = Tuple[str, Tuple[str, ...], Tuple[Any, ...]]
+
+
+def pack_node(node: NodeView) -> PackedNode:
+	return (
+		node.key,
+		tuple(node.values),
+		tuple(pack_node(child) for child in node.children),
+	)
+
+
+def unpack_node(packed: PackedNode) -> Node:
+	key, values, children = packed
+	return Node(
+		# Keys lose their interning when pickled
+		key=sys.intern(key),
+		values=values,
+		children=tuple(unpack_node(child) for child in children),
+	)
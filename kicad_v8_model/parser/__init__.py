@@ -1,7 +1,12 @@
 # from .string_iterator import StringIterator
 
-from .parser import Parser
-from .parser_observer import ParserObserver, NullParserObserver
+from .parser import Parser, ParseSchema, StreamingParser
+from .parser_observer import ParserObserver, NullParserObserver, ThrottledParserObserver
 
 from .simple_parser import SimpleParser
 from .fast_parser import FastParser
+from .mmap_parser import MmapParser
+from .lazy_parser import LazyParser
+from .flat_parser import FlatParser
+from .incremental_parser import IncrementalParser
+from .cached_parser import CachedParser
@@ -0,0 +1,198 @@
+"""
+Persistent on-disk cache of parsed s-expression files
+
+Wraps another parser, and stores the node tree of each parsed file on disk in
+marshal format (nested tuples, much faster to load than re-parsing the file).
+
+Each file gets its own cache entry, so editing one sheet only invalidates that
+sheet.  An entry is valid if the size and mtime of the file are unchanged, or
+failing that, if the content hash is unchanged (e.g. file was touched or
+re-saved without modification).
+
+Entries are loaded with marshal, which is not safe against crafted input, so
+the cache lives in a per-user directory which must be private to the user
+(mode 0700 on POSIX), and isn't used at all otherwise.  Entries unused for
+max_age are dropped, then the least recently used until the cache fits in
+max_size.
+
+The cache is opt-in: set SchematicLoader.parser_class to CachedParser, or
+set the MARK_PLUGIN_PARSE_CACHE environment variable for plugin runs.
+"""
+from hashlib import sha1
+import logging
+import marshal
+import os
+import sys
+import time
+from typing import List, Optional, Sequence, Tuple, Type
+
+from ..node import PackedNode, pack_node, unpack_node
+from ..selection import Selection
+from ...utils.tracing import Tracer
+
+from .parser import Parser, ParseSchema
+from .parser_observer import ParserObserver, NullParserObserver
+from .fast_parser import FastParser
+
+
+logger = logging.getLogger(__name__)
+
+
+# Set to any non-empty value to use the parse cache in plugin runs
+PARSE_CACHE_ENVIRONMENT_VARIABLE = "MARK_PLUGIN_PARSE_CACHE"
+
+# Bump if the cache layout or node tree representation changes
+CACHE_FORMAT_VERSION = 3
+
+# (format version, python version, path, schema, size, mtime, content hash)
+CacheHeader = Tuple[int, str, str, str, int, int, str]
+
+
+def get_user_cache_dir() -> str:
+	""" Per-user cache directory of the platform """
+	if sys.platform == "win32":
+		base = os.environ.get("LOCALAPPDATA") or os.path.expanduser(os.path.join("~", "AppData", "Local"))
+	elif sys.platform == "darwin":
+		base = os.path.expanduser(os.path.join("~", "Library", "Caches"))
+	else:
+		base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache"))
+	return os.path.join(base, "mark-plugin", "parse-cache")
+
+
+class CachedParser(Parser):
+
+	parser_class: Type[Parser] = FastParser
+	cache_dir: str = get_user_cache_dir()
+	# Entries unused for longer than this (seconds) are dropped
+	max_age: float = 30 * 24 * 60 * 60
+	# Least recently used entries are dropped past this many bytes in total
+	max_size: int = 256 << 20
+
+	observer: ParserObserver
+	schema: ParseSchema
+	parser: Parser
+	# Whether the cache directory is usable, checked (and pruned) on first use
+	cache_usable: Optional[bool]
+
+	def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
+		self.observer = observer
+		self.schema = schema
+		self.parser = self.parser_class(observer, schema)
+		self.cache_usable = None
+
+	def parse(self, text: str, root_values: Optional[Sequence[str]] = None) -> Selection:
+		return self.parser.parse(text, root_values)
+
+	def open_cache_dir(self) -> bool:
+		""" Create the cache directory, False if it isn't private to this user """
+		try:
+			os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+			stat = os.stat(self.cache_dir)
+		except OSError as error:
+			logger.warning("Not using parse cache %s: %s", self.cache_dir, error)
+			return False
+		if os.name == "posix" and (stat.st_uid != os.getuid() or stat.st_mode & 0o077):
+			logger.warning("Not using parse cache %s, it must be owned by this user with mode 0700", self.cache_dir)
+			return False
+		return True
+
+	def prune(self) -> None:
+		""" Drop entries unused for max_age, then the least recently used until the rest fit in max_size """
+		now = time.time()
+		entries: List[Tuple[float, int, str]] = []
+		try:
+			with os.scandir(self.cache_dir) as scan:
+				for entry in scan:
+					if entry.is_file(follow_symlinks=False):
+						stat = entry.stat(follow_symlinks=False)
+						entries.append((stat.st_mtime, stat.st_size, entry.path))
+		except OSError as error:
+			logger.warning("Failed to prune parse cache %s: %s", self.cache_dir, error)
+			return
+		entries.sort()
+		total = sum(size for _, size, _ in entries)
+		for mtime, size, entry_path in entries:
+			if now - mtime <= self.max_age and total <= self.max_size:
+				break
+			try:
+				os.remove(entry_path)
+			except OSError:
+				continue
+			total -= size
+
+	def get_cache_path(self, path: str) -> str:
+		# Trees parsed with different schemas differ, so cache them separately
+		name = sha1(f"{os.path.abspath(path)}\n{self.schema!r}".encode("utf-8")).hexdigest()
+		return os.path.join(self.cache_dir, f"{name}.marshal")
+
+	def make_header(self, path: str, stat: os.stat_result, digest: str) -> CacheHeader:
+		return (
+			CACHE_FORMAT_VERSION,
+			sys.version,
+			os.path.abspath(path),
+			repr(self.schema),
+			stat.st_size,
+			stat.st_mtime_ns,
+			digest,
+		)
+
+	def read_cache(self, path: str, stat: os.stat_result, content: Optional[bytes]) -> Optional[Selection]:
+		cache_path = self.get_cache_path(path)
+		try:
+			with open(cache_path, "rb") as fp:
+				header: CacheHeader = marshal.load(fp)
+				version, python_version, cached_path, schema, size, mtime, digest = header
+				if (version, python_version, cached_path, schema) != (CACHE_FORMAT_VERSION, sys.version, os.path.abspath(path), repr(self.schema)):
+					return None
+				if (size, mtime) != (stat.st_size, stat.st_mtime_ns):
+					# Fall back to content hash, if the caller has read the file
+					if content is None or sha1(content).hexdigest() != digest:
+						return None
+				packed: PackedNode = marshal.load(fp)
+		except FileNotFoundError:
+			return None
+		except (OSError, EOFError, ValueError, TypeError) as error:
+			logger.warning("Failed to read parse cache for %s: %s", path, error)
+			return None
+		try:
+			# Mark as recently used, for pruning
+			os.utime(cache_path)
+		except OSError:
+			pass
+		return Selection(nodes=[unpack_node(packed)])
+
+	def write_cache(self, path: str, header: CacheHeader, result: Selection) -> None:
+		cache_path = self.get_cache_path(path)
+		temp_path = f"{cache_path}.{os.getpid()}.tmp"
+		try:
+			with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600), "wb") as fp:
+				marshal.dump(header, fp)
+				marshal.dump(pack_node(~result), fp)
+			os.replace(temp_path, cache_path)
+		except OSError as error:
+			logger.warning("Failed to write parse cache for %s: %s", path, error)
+
+	def parse_file(self, path: str) -> Selection:
+		if self.cache_usable is None:
+			if (usable := self.open_cache_dir()):
+				self.prune()
+			self.cache_usable = usable
+		if not self.cache_usable:
+			return self.parser.parse_file(path)
+		with Tracer.span("parse file", parser=type(self).__name__, path=path) as span:
+			stat = os.stat(path)
+			if (result := self.read_cache(path, stat, None)) is not None:
+				logger.info("Parse cache hit: %s", path)
+				span.set(cache="hit")
+				return result
+			with open(path, "rb") as fp:
+				content = fp.read()
+			if (result := self.read_cache(path, stat, content)) is not None:
+				logger.info("Parse cache hit (content unchanged): %s", path)
+				span.set(cache="hit (content unchanged)")
+			else:
+				logger.info("Parse cache miss: %s", path)
+				span.set(cache="miss")
+				result = self.parse(content.decode("utf-8"), root_values=[path])
+			self.write_cache(path, self.make_header(path, stat, sha1(content).hexdigest()), result)
+			return result
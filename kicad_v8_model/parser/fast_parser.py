@@ -2,15 +2,19 @@
 Parse Kicad-style s-expression files 2x faster than simple parser
 """
 from dataclasses import dataclass
-from typing import List, Sequence, Optional
+from typing import AnyStr, BinaryIO, Dict, Iterator, List, Sequence, Optional
+import codecs
 import logging
+import os
 import re
 from functools import reduce
+from sys import intern
 
-from ..node import Node
+from ..node import Node, NodeStream, intern_value
 from ..selection import Selection
+from ...utils.tracing import Tracer
 
-from .parser import Parser
+from .parser import Parser, ParseSchema
 from .parser_observer import ParserObserver, NullParserObserver
 
 
@@ -30,7 +34,8 @@ SPACE_OPT = r"\s*"
 #
 # Assume up to 10% error on all measurements, since we
 # don't do any repeats (10% is what I saw when manually
-# repeating the same test over and over).
+# repeating the same test over and over).  The repeated
+# sweep in test_perf (bench_batch_sizes) supersedes this.
 #
 # | N   | n   | t_sch   | t_lay   | p_sch   | p_lay   |
 # |-----|-----|---------|---------|---------|---------|
@@ -58,45 +63,121 @@ NODE_START_ATTR_BATCH = 10
 # Max attrs that can be parsed in one match/batch
 NODE_ATTR_BATCH = 10
 
+def build_node_start(attr_batch: int) -> "re.Pattern[str]":
+	""" Regex for an opening bracket, key, up to attr_batch values, and optional closing bracket """
+	return re.compile(
+		f"{SPACE_OPT}"
+		f"{OPEN}"
+		f"({TOKEN})" +
+		reduce(
+			lambda s, _: (
+				f"(?:{SPACE}" + (
+					f"(?:({UNQUOTED_VALUE})|({QUOTED_VALUE}))" + s
+				) + ")?"
+			),
+			range(0, attr_batch),
+			"",
+		) +
+		f"(?:{SPACE_OPT}({CLOSE}))?"
+	)
+
+
+def build_node_attr(attr_batch: int) -> "re.Pattern[str]":
+	""" Regex for 1 to attr_batch values, and optional closing bracket """
+	return re.compile(
+		reduce(
+			lambda s, nesting: (
+				f"(?:{SPACE}" + (
+					f"(?:({UNQUOTED_VALUE})|({QUOTED_VALUE}))" + s
+				) + ")" + ("" if nesting == 1 else "?")
+			),
+			range(attr_batch, 0, -1),
+			"",
+		) +
+		f"(?:{SPACE_OPT}({CLOSE}))?"
+	)
+
+
 # Build parser regexes (named groups are nice, but also a lot slower to extract)
-NODE_START = re.compile(
-	f"{SPACE_OPT}"
-	f"{OPEN}"
-	f"({TOKEN})" +
-	reduce(
-		lambda s, _: (
-			f"(?:{SPACE}" + (
-				f"(?:({UNQUOTED_VALUE})|({QUOTED_VALUE}))" + s
-			) + ")?"
-		),
-		range(0, NODE_START_ATTR_BATCH),
-		"",
-	) +
-	f"(?:{SPACE_OPT}({CLOSE}))?"
-)
-NODE_ATTR = re.compile(
-	reduce(
-		lambda s, nesting: (
-			f"(?:{SPACE}" + (
-				f"(?:({UNQUOTED_VALUE})|({QUOTED_VALUE}))" + s
-			) + ")" + ("" if nesting == 1 else "?")
-		),
-		range(NODE_ATTR_BATCH, 0, -1),
-		"",
-	) +
-	f"(?:{SPACE_OPT}({CLOSE}))?"
-)
+NODE_START = build_node_start(NODE_START_ATTR_BATCH)
+NODE_ATTR = build_node_attr(NODE_ATTR_BATCH)
 NODE_CLOSE = re.compile(
 	f"{SPACE_OPT}"
 	f"{CLOSE}"
 )
 NODE_SPACE = re.compile(SPACE)
 
-# Quoted-strin parser regexes
-ESCAPE_BASIC = r"""([\\"rnt\\])"""
-ESCAPE_HEX = r"""x([0-9a-fA-F][0-9a-fA-F])"""
-ESCAPE_OCT = r"""([0-7][0-7][0-7])"""
-STR_ESCAPES = re.compile(r"\\(?:{ESCAPE_BASIC}|{ESCAPE_HEX}|{ESCAPE_OCT})")
+# Quoted-string escapes, same as allowed by QUOTED_VALUE
+ESCAPE_BASIC = r"""[\\"rnt]"""
+ESCAPE_HEX = r"""x[0-9a-fA-F][0-9a-fA-F]"""
+ESCAPE_OCT = r"""[0-7][0-7][0-7]"""
+STR_ESCAPES = re.compile(rf"\\(?:{ESCAPE_BASIC}|{ESCAPE_HEX}|{ESCAPE_OCT})")
+
+# Decoded char of every escape sequence matched by STR_ESCAPES
+HEX_DIGITS = "0123456789abcdefABCDEF"
+ESCAPE_TABLE: Dict[str, str] = {
+	"\\\\": "\\",
+	"\\\"": "\"",
+	"\\r": "\r",
+	"\\n": "\n",
+	"\\t": "\t",
+	**{
+		f"\\x{high}{low}": chr(int(high + low, 16))
+		for high in HEX_DIGITS
+		for low in HEX_DIGITS
+	},
+	**{
+		f"\\{code:03o}": chr(code)
+		for code in range(0o1000)
+	},
+}
+
+
+def decode_escape(match: "re.Match[str]") -> str:
+	return ESCAPE_TABLE[match.group()]
+
+
+def dequote(value: str) -> str:
+	""" Strip the quotes, and decode escapes if there are any (rarely) """
+	if "\\" not in value:
+		return value[1:-1]
+	return STR_ESCAPES.sub(decode_escape, value[1:-1])
+
+# Skip to the next bracket, stepping over quoted strings
+SUBTREE_BRACKET = re.compile(r"""[^()"]*(?:"(?:[^"\\]|\\.)*"[^()"]*)*([()])""")
+
+# Skip to the next bracket, stepping over quoted strings and nodes nested up to
+# two deep (e.g. a whole "(pts (xy ...) ...)" in one match).  Possessive and
+# atomic, so that a failed match on an incomplete buffer can't backtrack.
+SKIP_QUOTED = r""""(?:[^"\\]|\\.)*+\""""
+SKIP_LEAF = rf"""\((?>[^()"]++|{SKIP_QUOTED})*+\)"""
+SKIP_NESTED = rf"""\((?>[^()"]++|{SKIP_QUOTED}|{SKIP_LEAF})*+\)"""
+SUBTREE_SKIP = re.compile(rf"""(?>[^()"]++|{SKIP_QUOTED}|{SKIP_NESTED})*+(?:(\()|\))""")
+
+# Key of the next child node, without consuming it
+CHILD_KEY = re.compile(f"{SPACE_OPT}{OPEN}({TOKEN})")
+
+# Streaming parser reads the file in chunks of (at least) this size
+STREAM_CHUNK_SIZE = 1 << 20
+
+
+def find_subtree_end(text: AnyStr, position: int, pattern: "re.Pattern[AnyStr]") -> int:
+	"""
+	Find end of the node whose opening bracket is at position, or -1 if it is
+	incomplete.  Only creates one match object per step, no nodes or strings.
+	"""
+	depth = 1
+	position += 1
+	match_bracket = pattern.match
+	while (match := match_bracket(text, position)) is not None:
+		position = match.end()
+		if match.start(1) >= 0:
+			depth += 1
+		else:
+			depth -= 1
+			if depth == 0:
+				return position
+	return -1
 
 
 @dataclass
@@ -127,51 +208,77 @@ class FastParserState():
 		else:
 			return ValueError(f"Syntax error at {self.position}/{len(self.text)}:\n{caret_line}\n{caret_str}")
 
+	def peek_key(self) -> Optional[str]:
+		match = CHILD_KEY.match(self.text, self.position)
+		return None if match is None else match.group(1)
+
+	def skip_node(self):
+		""" Step over the node at the current position without parsing it """
+		self.read(NODE_SPACE)
+		if (end := find_subtree_end(self.text, self.position, SUBTREE_SKIP)) < 0:
+			raise self.syntax_error()
+		self.position = end
+
+
+class FastParserStreamReader():
+	""" Incrementally decodes a file into the parser state buffer """
+
+	state: FastParserState
+	fp: BinaryIO
+	chunk_size: int
+	size: int
+	done: int
+	eof: bool
+
+	def __init__(self, fp: BinaryIO, chunk_size: int):
+		self.state = FastParserState("", 0)
+		self.fp = fp
+		self.chunk_size = chunk_size
+		self.size = os.fstat(fp.fileno()).st_size
+		self.done = 0
+		self.eof = False
+		self.decoder = codecs.getincrementaldecoder("utf-8")()
+
+	def read_more(self) -> bool:
+		""" Drop consumed text from buffer and append more, returns False at end of file """
+		if self.eof:
+			return False
+		state = self.state
+		text = state.text[state.position:]
+		# Grow reads with the buffer, so huge nodes aren't re-scanned once per chunk
+		chunk = self.fp.read(max(self.chunk_size, len(text)))
+		self.done += len(chunk)
+		self.eof = not chunk
+		state.text = text + self.decoder.decode(chunk, final=self.eof)
+		state.position = 0
+		return True
+
 
 class FastParser(Parser):
 
 	observer: ParserObserver
+	schema: ParseSchema
+	# Position after which to report progress next
+	report_at: int
 
-	__slots__ = ("observer")
+	__slots__ = ("observer", "schema", "report_at")
 
-	def __init__(self, observer: ParserObserver = NullParserObserver()):
+	def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
 		self.observer = observer
+		self.schema = schema
+		self.report_at = 0
 
-	def dequote(self, value: str):
-		assert value[0] == "\""
-		assert value[-1] == "\""
-		position = 1
-		end = len(value) - 1
-		result: List[str] = []
-		while (match := STR_ESCAPES.search(value, position, end)) is not None:
-			result.append(value[position:match.start()])
-			if (esc := match.group(1)) is not None:  # escaped/special char
-				if esc == r"\\":
-					result.append("\\")
-				elif esc == r'"':
-					result.append("\"")
-				elif esc == r'r':
-					result.append("\r")
-				elif esc == r'n':
-					result.append("\n")
-				elif esc == r't':
-					result.append("\t")
-				else:
-					raise Exception()
-			elif (esc := match.group(2)) is not None:  # hexadecimal charcode
-				result.append(chr(int(esc, 16)))
-			elif (esc := match.group(3)) is not None:  # octal charcode
-				result.append(chr(int(esc, 8)))
-			else:
-				raise Exception()
-			position = match.end()
-		result.append(value[position:end])
-		return "".join(result)
+	def report_progress(self, done: int, total: int):
+		""" Parse nodes call this once position passes report_at """
+		self.observer.progress(done, total)
+		self.report_at = done + self.observer.byte_interval
 
-	def parse_node(self, state: FastParserState) -> Node:
+	dequote = staticmethod(dequote)
+
+	def parse_node(self, state: FastParserState, schema: ParseSchema = None) -> Node:
 		if (match := state.read(NODE_START)) is None:
 			raise state.syntax_error()
-		key: str = match.group(1)
+		key: str = intern(match.group(1))
 		values: List[str] = []
 		children: List[Node] = []
 		# Optimisation by parsing the first few attributes and the closing
@@ -188,9 +295,10 @@ class FastParser(Parser):
 		#  - 2N+2: close
 		for idx in range(2, 2 + 2 * NODE_START_ATTR_BATCH, 2):
 			if (unquoted := match.group(idx)):
-				values.append(unquoted)
+				values.append(intern_value(unquoted))
 			elif (quoted := match.group(idx + 1)):
-				values.append(self.dequote(quoted))
+				# Inline fast lane of dequote, few values have escapes
+				values.append(intern_value(quoted[1:-1] if "\\" not in quoted else dequote(quoted)))
 			else:
 				break
 		closed = match.group(2 + 2 * NODE_START_ATTR_BATCH) is not None
@@ -207,38 +315,112 @@ class FastParser(Parser):
 				#  - 2N+1: close
 				for idx in range(1, 2 * NODE_ATTR_BATCH, 2):
 					if (unquoted := match.group(idx)) is not None:
-						values.append(unquoted)
+						values.append(intern_value(unquoted))
 					elif (quoted := match.group(idx + 1)) is not None:
-						values.append(self.dequote(quoted))
+						values.append(intern_value(quoted[1:-1] if "\\" not in quoted else dequote(quoted)))
 					else:
 						break
 				closed = match.group(1 + 2 * NODE_ATTR_BATCH) is not None
 				# End optimisation
 			elif state.read(NODE_CLOSE) is not None:
 				closed = True
-			else:
+			elif schema is None:
 				children.append(self.parse_node(state))
-		self.observer.progress(state.position, len(state.text))
+			elif (child_key := state.peek_key()) is not None and child_key not in schema:
+				state.skip_node()
+			else:
+				children.append(self.parse_node(state, schema[child_key] if child_key is not None else None))
+		if state.position >= self.report_at:
+			self.report_progress(state.position, len(state.text))
 		return Node(
 			key=key,
-			values=values,
-			children=children,
+			values=tuple(values),
+			children=tuple(children),
 		)
 
 	def parse(self, text: str, root_values: Optional[Sequence[str]] = None) -> Selection:
 		state = FastParserState(text, 0)
-		self.observer.progress(0, len(text))
+		self.report_progress(0, len(text))
 		root = Node(
 			key="(root)",
 			values=tuple([] if root_values is None else root_values),
-			children=tuple([self.parse_node(state)]),
+			children=tuple([self.parse_node(state, self.schema)]),
 		)
 		state.read(NODE_SPACE)
 		if state.position != len(text):
 			raise state.syntax_error()
+		self.report_progress(len(text), len(text))
 		return Selection(nodes=[root])
 
 	def parse_file(self, path: str) -> Selection:
-		with open(path, "r", encoding="utf-8") as fp:
-			text = fp.read()
-		return self.parse(text, root_values=[path])
+		with Tracer.span("parse file", parser=type(self).__name__, path=path) as span:
+			with open(path, "r", encoding="utf-8") as fp:
+				text = fp.read()
+			span.set(chars=len(text))
+			return self.parse(text, root_values=[path])
+
+	def stream_head(self, reader: FastParserStreamReader) -> Node:
+		""" Parse key and values of root node, leaving the state at its first child """
+		state = reader.state
+		while True:
+			state.read(NODE_SPACE)
+			if (match := SUBTREE_BRACKET.match(state.text, state.position + 1)) is not None:
+				break
+			if not reader.read_more():
+				raise state.syntax_error()
+		# Terminate the head where the first child starts, and parse it as a leaf
+		head_end = match.start(1)
+		head = self.parse_node(FastParserState(state.text[state.position:head_end] + ")", 0))
+		state.position = head_end
+		return head
+
+	def stream_children(self, reader: FastParserStreamReader) -> Iterator[Node]:
+		state = reader.state
+		schema = self.schema
+		# Positions reported by parse_node would be relative to the buffer
+		child_parser = type(self)()
+		with reader.fp:
+			while True:
+				state.read(NODE_SPACE)
+				if state.position == len(state.text):
+					if not reader.read_more():
+						raise state.syntax_error()
+				elif state.text[state.position] == ")":
+					state.position += 1
+					break
+				elif state.text[state.position] != "(":
+					raise state.syntax_error()
+				elif (end := find_subtree_end(state.text, state.position, SUBTREE_SKIP)) < 0:
+					if not reader.read_more():
+						raise state.syntax_error()
+				elif schema is None:
+					yield child_parser.parse_node(state)
+					if reader.done >= self.report_at:
+						self.report_progress(reader.done, reader.size)
+				elif (child_key := state.peek_key()) is not None and child_key not in schema:
+					state.position = end
+				else:
+					yield child_parser.parse_node(state, schema[child_key] if child_key is not None else None)
+					if reader.done >= self.report_at:
+						self.report_progress(reader.done, reader.size)
+			while reader.read_more():
+				pass
+			state.read(NODE_SPACE)
+			if state.position != len(state.text):
+				raise state.syntax_error()
+			self.report_progress(reader.size, reader.size)
+
+	def stream_file(self, path: str, chunk_size: int = STREAM_CHUNK_SIZE) -> NodeStream:
+		fp = open(path, "rb")
+		try:
+			reader = FastParserStreamReader(fp, chunk_size)
+			self.report_progress(0, reader.size)
+			head = self.stream_head(reader)
+		except BaseException:
+			fp.close()
+			raise
+		return NodeStream(
+			key=head.key,
+			values=head.values,
+			children=self.stream_children(reader),
+		)
@@ -0,0 +1,334 @@
+"""
+Parse Kicad-style s-expression files into flat arrays
+
+The whole tree is a handful of int arrays indexed by node id (in file order),
+plus the original text: key ids, parent/first-child/next-sibling links, and
+(start, end) offsets of each value in the text.  A board is a few dozen
+objects rather than one per node and value, so many boards can be held at
+once without the memory and garbage-collector cost of the node tree.
+
+Node ids are wrapped in lightweight FlatNode views when visited, which keep
+their children once listed, so the trees work with Selection and the loaders
+like any other parser output.
+"""
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union, overload
+import logging
+
+from ..selection import Selection
+from ...utils.tracing import Tracer
+
+from .parser import Parser, ParseSchema
+from .parser_observer import ParserObserver, NullParserObserver
+from .fast_parser import (
+	FastParserState,
+	NODE_START,
+	NODE_ATTR,
+	NODE_CLOSE,
+	NODE_SPACE,
+	NODE_START_ATTR_BATCH,
+	NODE_ATTR_BATCH,
+	dequote,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+NO_NODE = -1
+# Node holding the file's top-level node, like the root Node of other parsers
+ROOT_NODE = 0
+
+
+class FlatTree():
+	""" Struct-of-arrays node tree over the text it was parsed from """
+
+	text: str
+	keys: List[str]
+	key_ids: Dict[str, int]
+	# Per node
+	node_key: "array[int]"
+	node_parent: "array[int]"
+	node_first_child: "array[int]"
+	node_next_sibling: "array[int]"
+	node_values_start: "array[int]"
+	node_values_end: "array[int]"
+	# Per value, [start, end) offsets into text
+	value_spans: "array[int]"
+	# Values of ROOT_NODE, which are not in the text
+	root_values: Sequence[str]
+
+	__slots__ = (
+		"text",
+		"keys",
+		"key_ids",
+		"node_key",
+		"node_parent",
+		"node_first_child",
+		"node_next_sibling",
+		"node_values_start",
+		"node_values_end",
+		"value_spans",
+		"root_values",
+	)
+
+	def __init__(self, text: str, root_values: Sequence[str] = ()):
+		self.text = text
+		self.keys = []
+		self.key_ids = {}
+		self.node_key = array("i")
+		self.node_parent = array("i")
+		self.node_first_child = array("i")
+		self.node_next_sibling = array("i")
+		self.node_values_start = array("i")
+		self.node_values_end = array("i")
+		self.value_spans = array("i")
+		self.root_values = root_values
+
+	def __len__(self):
+		return len(self.node_key)
+
+	def get_key_id(self, key: str) -> int:
+		if (key_id := self.key_ids.get(key)) is None:
+			key_id = self.key_ids[key] = len(self.keys)
+			self.keys.append(key)
+		return key_id
+
+	def add_node(self, key: str, parent: int) -> int:
+		node = len(self.node_key)
+		self.node_key.append(self.get_key_id(key))
+		self.node_parent.append(parent)
+		self.node_first_child.append(NO_NODE)
+		self.node_next_sibling.append(NO_NODE)
+		self.node_values_start.append(0)
+		self.node_values_end.append(0)
+		return node
+
+	def set_values(self, node: int, spans: List[int]):
+		start = len(self.value_spans) >> 1
+		self.value_spans.extend(spans)
+		self.node_values_start[node] = start
+		self.node_values_end[node] = start + (len(spans) >> 1)
+
+	def get_value(self, index: int) -> str:
+		spans = self.value_spans
+		start = spans[index << 1]
+		end = spans[(index << 1) + 1]
+		value = self.text[start:end]
+		if value[0] == "\"":
+			return dequote(value)
+		return value
+
+	def iter_children(self, node: int) -> Iterator[int]:
+		child = self.node_first_child[node]
+		next_sibling = self.node_next_sibling
+		while child != NO_NODE:
+			yield child
+			child = next_sibling[child]
+
+	def iter_children_by_key(self, node: int, key: str) -> Iterator[int]:
+		if (key_id := self.key_ids.get(key)) is None:
+			return
+		node_key = self.node_key
+		for child in self.iter_children(node):
+			if node_key[child] == key_id:
+				yield child
+
+
+class FlatValues(Sequence[str]):
+	""" Values of one node, decoded from the text on access """
+
+	tree: FlatTree
+	start: int
+	end: int
+
+	__slots__ = ("tree", "start", "end")
+
+	def __init__(self, tree: FlatTree, start: int, end: int):
+		self.tree = tree
+		self.start = start
+		self.end = end
+
+	def __len__(self):
+		return self.end - self.start
+
+	@overload
+	def __getitem__(self, index: int) -> str:
+		...
+
+	@overload
+	def __getitem__(self, index: slice) -> Sequence[str]:
+		...
+
+	def __getitem__(self, index: Union[int, slice]) -> Union[str, Sequence[str]]:
+		count = self.end - self.start
+		if isinstance(index, slice):
+			return [
+				self.tree.get_value(self.start + item)
+				for item in range(*index.indices(count))
+			]
+		if index < 0:
+			index += count
+		if index < 0 or index >= count:
+			raise IndexError("Value index out of range")
+		return self.tree.get_value(self.start + index)
+
+	def __eq__(self, other: Any):
+		return isinstance(other, Sequence) and list(self) == list(other)  # pyright: ignore
+
+	def __hash__(self):
+		return hash(tuple(self))
+
+	def __repr__(self):
+		return repr(list(self))
+
+
+class FlatNode():
+	""" Node-like view of one node id in a flat tree, see NodeView """
+
+	tree: FlatTree
+	id: int
+	# Views of the children and the same grouped by key, built on first access
+	_children: Optional[Tuple["FlatNode", ...]]
+	_children_index: Optional[Dict[str, List["FlatNode"]]]
+
+	__slots__ = ("tree", "id", "_children", "_children_index")
+
+	def __init__(self, tree: FlatTree, id: int):
+		self.tree = tree
+		self.id = id
+		self._children = None
+		self._children_index = None
+
+	@property
+	def key(self) -> str:
+		tree = self.tree
+		return tree.keys[tree.node_key[self.id]]
+
+	@property
+	def values(self) -> Sequence[str]:
+		tree = self.tree
+		if self.id == ROOT_NODE:
+			return tree.root_values
+		return FlatValues(tree, tree.node_values_start[self.id], tree.node_values_end[self.id])
+
+	@property
+	def children(self) -> Sequence["FlatNode"]:
+		children = self._children
+		if children is None:
+			tree = self.tree
+			children = self._children = tuple(FlatNode(tree, child) for child in tree.iter_children(self.id))
+		return children
+
+	@property
+	def parent(self) -> Optional["FlatNode"]:
+		parent = self.tree.node_parent[self.id]
+		return None if parent == NO_NODE else FlatNode(self.tree, parent)
+
+	def children_by_key(self, key: str) -> Sequence["FlatNode"]:
+		index = self._children_index
+		if index is None:
+			index = self._children_index = {}
+			for child in self.children:
+				if (group := index.get(child.key)) is None:
+					index[child.key] = [child]
+				else:
+					group.append(child)
+		return index.get(key, ())
+
+	def __eq__(self, other: Any):
+		return isinstance(other, FlatNode) and other.tree is self.tree and other.id == self.id
+
+	def __hash__(self):
+		return hash((id(self.tree), self.id))
+
+	def __repr__(self):
+		return f"FlatNode(key={self.key!r}, id={self.id})"
+
+
+class FlatParser(Parser):
+
+	observer: ParserObserver
+	schema: ParseSchema
+	# Position after which to report progress next
+	report_at: int
+
+	__slots__ = ("observer", "schema", "report_at")
+
+	def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
+		self.observer = observer
+		self.schema = schema
+		self.report_at = 0
+
+	def report_progress(self, done: int, total: int):
+		""" Parse nodes call this once position passes report_at """
+		self.observer.progress(done, total)
+		self.report_at = done + self.observer.byte_interval
+
+	def parse_node(self, state: FastParserState, tree: FlatTree, parent: int, schema: ParseSchema = None) -> int:
+		if (match := state.read(NODE_START)) is None:
+			raise state.syntax_error()
+		regs = match.regs
+		node = tree.add_node(match.group(1), parent)
+		spans: List[int] = []
+		last_child = NO_NODE
+		# Same batching as the fast parser, see there for group numbering
+		for idx in range(2, 2 + 2 * NODE_START_ATTR_BATCH, 2):
+			if (span := regs[idx])[0] >= 0 or (span := regs[idx + 1])[0] >= 0:
+				spans.extend(span)
+			else:
+				break
+		closed = regs[2 + 2 * NODE_START_ATTR_BATCH][0] >= 0
+		while not closed:
+			if (match := state.read(NODE_ATTR)) is not None:
+				regs = match.regs
+				for idx in range(1, 2 * NODE_ATTR_BATCH, 2):
+					if (span := regs[idx])[0] >= 0 or (span := regs[idx + 1])[0] >= 0:
+						spans.extend(span)
+					else:
+						break
+				closed = regs[1 + 2 * NODE_ATTR_BATCH][0] >= 0
+				continue
+			elif state.read(NODE_CLOSE) is not None:
+				break
+			elif schema is None:
+				child = self.parse_node(state, tree, node)
+			elif (child_key := state.peek_key()) is not None and child_key not in schema:
+				state.skip_node()
+				continue
+			else:
+				child = self.parse_node(state, tree, node, schema[child_key] if child_key is not None else None)
+			if last_child == NO_NODE:
+				tree.node_first_child[node] = child
+			else:
+				tree.node_next_sibling[last_child] = child
+			last_child = child
+		# Values may follow children, so store them once the node is closed
+		tree.set_values(node, spans)
+		if state.position >= self.report_at:
+			self.report_progress(state.position, len(state.text))
+		return node
+
+	def parse_tree(self, text: str, root_values: Sequence[str] = ()) -> FlatTree:
+		tree = FlatTree(text, root_values)
+		state = FastParserState(text, 0)
+		self.report_progress(0, len(text))
+		root = tree.add_node("(root)", NO_NODE)
+		tree.node_first_child[root] = self.parse_node(state, tree, root, self.schema)
+		state.read(NODE_SPACE)
+		if state.position != len(text):
+			raise state.syntax_error()
+		self.report_progress(len(text), len(text))
+		logger.debug("Parsed %d nodes with %d values", len(tree), len(tree.value_spans) >> 1)
+		return tree
+
+	def parse(self, text: str, root_values: Optional[Sequence[str]] = None) -> Selection:
+		tree = self.parse_tree(text, tuple([] if root_values is None else root_values))
+		return Selection(nodes=[FlatNode(tree, ROOT_NODE)])
+
+	def parse_file(self, path: str) -> Selection:
+		with Tracer.span("parse file", parser=type(self).__name__, path=path) as span:
+			with open(path, "r", encoding="utf-8") as fp:
+				text = fp.read()
+			span.set(chars=len(text))
+			return self.parse(text, root_values=[path])
@@ -0,0 +1,248 @@
+"""
+Re-parse edited s-expression files incrementally
+
+Keeps the text and node tree of the last parse of recently parsed files in
+memory (the least recently parsed are forgotten past max_remembered).  When
+a file is parsed again, the common prefix and suffix of the old and new text
+are found, and only the top-level children overlapping the changed region
+in between are parsed again.  Node trees of the other top-level children are
+reused as-is, so a small edit to a big sheet costs roughly one text compare.
+
+Falls back to a full parse when the edit touches the head of the root node,
+or changes the bracket structure around the edited region.
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import os
+from typing import ClassVar, List, Optional, Sequence, Tuple
+
+from ..node import Node
+from ..selection import Selection
+from ...utils.tracing import Tracer
+
+from .parser import Parser, ParseSchema
+from .parser_observer import ParserObserver, NullParserObserver
+from .fast_parser import (
+	FastParser,
+	FastParserState,
+	NODE_ATTR,
+	NODE_CLOSE,
+	NODE_SPACE,
+	SUBTREE_BRACKET,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# Text is compared in blocks of this size before narrowing down to the char
+COMPARE_BLOCK_SIZE = 1 << 16
+
+
+def common_prefix_length(a: str, b: str) -> int:
+	limit = min(len(a), len(b))
+	position = 0
+	while position < limit and a[position:position + COMPARE_BLOCK_SIZE] == b[position:position + COMPARE_BLOCK_SIZE]:
+		position += COMPARE_BLOCK_SIZE
+	limit = min(limit, position + COMPARE_BLOCK_SIZE)
+	while position < limit and a[position] == b[position]:
+		position += 1
+	return position
+
+
+def common_suffix_length(a: str, b: str, limit: int) -> int:
+	""" Suffix no longer than limit, so it can't overlap the common prefix """
+	len_a = len(a)
+	len_b = len(b)
+	length = 0
+	while length < limit and a[max(0, len_a - length - COMPARE_BLOCK_SIZE):len_a - length] == b[max(0, len_b - length - COMPARE_BLOCK_SIZE):len_b - length]:
+		length += COMPARE_BLOCK_SIZE
+	length = min(length, limit)
+	while length < limit and a[len_a - length - 1] == b[len_b - length - 1]:
+		length += 1
+	return length
+
+
+@dataclass
+class TopLevelChild():
+	""" [start, end) span of a top-level child in the text, node is None if skipped by the schema """
+	start: int
+	end: int
+	node: Optional[Node]
+
+
+@dataclass
+class IncrementalParseResult():
+	text: str
+	head: Node
+	# Where the first child (or the closing bracket) starts
+	head_end: int
+	children: List[TopLevelChild]
+
+
+class IncrementalParser(Parser):
+
+	# Last parse of each file, shared between parser instances since the
+	# loaders create a new parser for each load.  Least recently parsed first.
+	previous: ClassVar["OrderedDict[Tuple[str, str], IncrementalParseResult]"] = OrderedDict()
+	# Enough for the sheets and board of a big project, each entry holds a
+	# whole file's text and tree
+	max_remembered: ClassVar[int] = 64
+
+	observer: ParserObserver
+	schema: ParseSchema
+	parser: FastParser
+
+	def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
+		self.observer = observer
+		self.schema = schema
+		self.parser = FastParser(observer, schema)
+
+	@classmethod
+	def forget(cls):
+		""" Release all remembered texts and trees """
+		cls.previous.clear()
+
+	@classmethod
+	def remember(cls, key: Tuple[str, str], result: IncrementalParseResult):
+		previous = cls.previous
+		previous[key] = result
+		previous.move_to_end(key)
+		while len(previous) > cls.max_remembered:
+			previous.popitem(last=False)
+
+	def parse(self, text: str, root_values: Optional[Sequence[str]] = None) -> Selection:
+		return self.parser.parse(text, root_values)
+
+	def parse_head(self, state: FastParserState) -> Optional[Node]:
+		""" Parse key and values of the root node, leaving the state at its first child """
+		state.read(NODE_SPACE)
+		if (match := SUBTREE_BRACKET.match(state.text, state.position + 1)) is None or match.group(1) != "(":
+			return None
+		# Terminate the head where the first child starts, and parse it as a leaf
+		head_end = match.start(1)
+		head = self.parser.parse_node(FastParserState(state.text[state.position:head_end] + ")", 0))
+		state.position = head_end
+		return head
+
+	def parse_children(self, state: FastParserState, stop: Optional[int]) -> Optional[List[TopLevelChild]]:
+		"""
+		Parse top-level children until the closing bracket of the root node, or
+		until the given position.  Returns None if the text there doesn't split
+		into whole children.
+		"""
+		parser = self.parser
+		schema = self.schema
+		text = state.text
+		children: List[TopLevelChild] = []
+		while stop is None or state.position < stop:
+			start = state.position
+			if NODE_CLOSE.match(text, start) is not None:
+				break
+			if NODE_ATTR.match(text, start) is not None:
+				# Values after children
+				return None
+			if schema is None:
+				node = parser.parse_node(state)
+			elif (child_key := state.peek_key()) is not None and child_key not in schema:
+				state.skip_node()
+				node = None
+			else:
+				node = parser.parse_node(state, schema[child_key] if child_key is not None else None)
+			children.append(TopLevelChild(start, state.position, node))
+		if stop is not None and state.position != stop:
+			return None
+		return children
+
+	def parse_tail(self, state: FastParserState) -> bool:
+		""" Read closing bracket of the root node, returns False if there's anything else there """
+		if state.read(NODE_CLOSE) is None:
+			return False
+		state.read(NODE_SPACE)
+		return state.position == len(state.text)
+
+	def parse_full(self, text: str) -> IncrementalParseResult:
+		state = FastParserState(text, 0)
+		if (head := self.parse_head(state)) is not None:
+			head_end = state.position
+			children = self.parse_children(state, None)
+			if children is not None and self.parse_tail(state):
+				return IncrementalParseResult(text, head, head_end, children)
+		# Unusual layout (e.g. values after children), just parse it all
+		logger.info("Root node can't be split into children, parsing it in full")
+		return IncrementalParseResult(text, self.parser.parse(text).children[0], len(text), [])
+
+	def parse_changes(self, previous: IncrementalParseResult, text: str) -> Optional[IncrementalParseResult]:
+		old_text = previous.text
+		prefix = common_prefix_length(old_text, text)
+		suffix = common_suffix_length(old_text, text, min(len(old_text), len(text)) - prefix)
+		if prefix < previous.head_end or not previous.children:
+			return None
+		shift = len(text) - len(old_text)
+		old_children = previous.children
+		# Children entirely within the common prefix/suffix are unchanged
+		keep_before = 0
+		while keep_before < len(old_children) and old_children[keep_before].end <= prefix:
+			keep_before += 1
+		keep_after = len(old_children)
+		while keep_after > keep_before and old_children[keep_after - 1].start >= len(old_text) - suffix:
+			keep_after -= 1
+		resume = old_children[keep_before - 1].end if keep_before > 0 else previous.head_end
+		state = FastParserState(text, resume)
+		if keep_after < len(old_children):
+			stop = old_children[keep_after].start + shift
+			if (changed := self.parse_children(state, stop)) is None:
+				return None
+			after = [
+				TopLevelChild(child.start + shift, child.end + shift, child.node)
+				for child in old_children[keep_after:]
+			]
+		else:
+			if (changed := self.parse_children(state, None)) is None or not self.parse_tail(state):
+				return None
+			after = []
+		logger.info(
+			"Incremental parse: reused %d of %d top-level children, parsed %d",
+			keep_before + len(after), len(old_children), len(changed),
+		)
+		return IncrementalParseResult(
+			text,
+			previous.head,
+			previous.head_end,
+			old_children[:keep_before] + changed + after,
+		)
+
+	def parse_file(self, path: str) -> Selection:
+		with Tracer.span("parse file", parser=type(self).__name__, path=path) as span:
+			with open(path, "r", encoding="utf-8") as fp:
+				text = fp.read()
+			key = (os.path.abspath(path), repr(self.schema))
+			self.observer.progress(0, len(text))
+			previous = self.previous.get(key)
+			if previous is not None and previous.text == text:
+				span.set(parse="unchanged")
+				result = previous
+			elif previous is None or (result := self.parse_changes(previous, text)) is None:
+				span.set(parse="full")
+				result = self.parse_full(text)
+			else:
+				span.set(parse="incremental")
+			self.remember(key, result)
+		self.observer.progress(len(text), len(text))
+		head = result.head
+		top = Node(
+			key=head.key,
+			values=head.values,
+			children=head.children or tuple(
+				child.node
+				for child in result.children
+				if child.node is not None
+			),
+		)
+		root = Node(
+			key="(root)",
+			values=(path,),
+			children=(top,),
+		)
+		return Selection(nodes=[root])
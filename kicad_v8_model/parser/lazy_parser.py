@@ -0,0 +1,211 @@
+"""
+Parse Kicad-style s-expression files lazily
+
+Each node is parsed up to its first child, then the rest of the node is
+stepped over with a bracket scan and recorded as a span of the text.  The
+span is parsed (again lazily, one level at a time) when the children of the
+node are first accessed.
+
+Most of the node tree is never read by the loaders, so this makes load time
+scale with what is actually read rather than with file size.
+
+Values may also follow children, e.g. "(pin ... (length 0) hide (name ...))",
+so reading past the leading values of a node also parses its span.
+"""
+from typing import Any, List, Optional, Sequence, Union, overload
+from sys import intern
+import re
+
+from ..node import Node, intern_value
+
+from .fast_parser import (
+	FastParser,
+	FastParserState,
+	NODE_START,
+	NODE_ATTR,
+	NODE_CLOSE,
+	NODE_START_ATTR_BATCH,
+	NODE_ATTR_BATCH,
+	SUBTREE_SKIP,
+	dequote,
+	find_subtree_end,
+)
+from .parser import ParseSchema
+
+
+class LazyBody():
+	""" Unparsed remainder of a node, from its first child to its closing bracket """
+
+	parser: "LazyParser"
+	text: str
+	start: int
+	schema: ParseSchema
+	values: List[str]
+	children: Optional[Sequence[Node]]
+
+	__slots__ = ("parser", "text", "start", "schema", "values", "children")
+
+	def __init__(self, parser: "LazyParser", text: str, start: int, schema: ParseSchema, values: List[str]):
+		self.parser = parser
+		self.text = text
+		self.start = start
+		self.schema = schema
+		self.values = values
+		self.children = None
+
+	def expand(self) -> Sequence[Node]:
+		if self.children is None:
+			self.children = self.parser.parse_body(
+				FastParserState(self.text, self.start),
+				self.schema,
+				self.values,
+			)
+			# Children hold references to the text themselves if they need it
+			self.text = ""
+		return self.children
+
+
+class LazyValues(Sequence[str]):
+
+	body: LazyBody
+
+	__slots__ = ("body",)
+
+	def __init__(self, body: LazyBody):
+		self.body = body
+
+	@overload
+	def __getitem__(self, index: int) -> str:
+		...
+
+	@overload
+	def __getitem__(self, index: slice) -> Sequence[str]:
+		...
+
+	def __getitem__(self, index: Union[int, slice]) -> Union[str, Sequence[str]]:
+		body = self.body
+		# Leading values are known without parsing the body
+		if isinstance(index, int) and 0 <= index < len(body.values):
+			return body.values[index]
+		body.expand()
+		return body.values[index]
+
+	def __len__(self):
+		body = self.body
+		body.expand()
+		return len(body.values)
+
+	def __eq__(self, other: Any):
+		return isinstance(other, Sequence) and list(self) == list(other)  # pyright: ignore
+
+	def __hash__(self):
+		return hash(tuple(self))
+
+	def __repr__(self):
+		return repr(list(self))
+
+
+class LazyChildren(Sequence[Node]):
+
+	body: LazyBody
+
+	__slots__ = ("body",)
+
+	def __init__(self, body: LazyBody):
+		self.body = body
+
+	@overload
+	def __getitem__(self, index: int) -> Node:
+		...
+
+	@overload
+	def __getitem__(self, index: slice) -> Sequence[Node]:
+		...
+
+	def __getitem__(self, index: Union[int, slice]) -> Union[Node, Sequence[Node]]:
+		return self.body.expand()[index]
+
+	def __len__(self):
+		return len(self.body.expand())
+
+	def __iter__(self):
+		return iter(self.body.expand())
+
+	def __eq__(self, other: Any):
+		return isinstance(other, Sequence) and list(self) == list(other)  # pyright: ignore
+
+	def __hash__(self):
+		return hash(tuple(self))
+
+	def __repr__(self):
+		return repr(list(self))
+
+
+class LazyParser(FastParser):
+
+	def parse_node(self, state: FastParserState, schema: ParseSchema = None) -> Node:
+		if (match := state.read(NODE_START)) is None:
+			raise state.syntax_error()
+		key: str = intern(match.group(1))
+		open_position = match.start(1) - 1
+		values: List[str] = []
+		# Same batching as the fast parser, see there for group numbering
+		for idx in range(2, 2 + 2 * NODE_START_ATTR_BATCH, 2):
+			if (unquoted := match.group(idx)):
+				values.append(intern_value(unquoted))
+			elif (quoted := match.group(idx + 1)):
+				values.append(intern_value(quoted[1:-1] if "\\" not in quoted else dequote(quoted)))
+			else:
+				break
+		closed = match.group(2 + 2 * NODE_START_ATTR_BATCH) is not None
+		while not closed:
+			if (match := state.read(NODE_ATTR)) is not None:
+				closed = self.read_attr_values(match, values)
+			elif state.read(NODE_CLOSE) is not None:
+				closed = True
+			else:
+				break
+		if state.position >= self.report_at:
+			self.report_progress(state.position, len(state.text))
+		if closed:
+			return Node(
+				key=key,
+				values=tuple(values),
+				children=(),
+			)
+		if (end := find_subtree_end(state.text, open_position, SUBTREE_SKIP)) < 0:
+			raise state.syntax_error()
+		body = LazyBody(self, state.text, state.position, schema, values)
+		state.position = end
+		return Node(
+			key=key,
+			values=LazyValues(body),
+			children=LazyChildren(body),
+		)
+
+	def read_attr_values(self, match: "re.Match[str]", values: List[str]) -> bool:
+		""" Read values from a NODE_ATTR match, returns True if it also closed the node """
+		for idx in range(1, 2 * NODE_ATTR_BATCH, 2):
+			if (unquoted := match.group(idx)) is not None:
+				values.append(intern_value(unquoted))
+			elif (quoted := match.group(idx + 1)) is not None:
+				values.append(intern_value(quoted[1:-1] if "\\" not in quoted else dequote(quoted)))
+			else:
+				break
+		return match.group(1 + 2 * NODE_ATTR_BATCH) is not None
+
+	def parse_body(self, state: FastParserState, schema: ParseSchema, values: List[str]) -> Sequence[Node]:
+		children: List[Node] = []
+		closed = False
+		while not closed:
+			if (match := state.read(NODE_ATTR)) is not None:
+				closed = self.read_attr_values(match, values)
+			elif state.read(NODE_CLOSE) is not None:
+				closed = True
+			elif schema is None:
+				children.append(self.parse_node(state))
+			elif (child_key := state.peek_key()) is not None and child_key not in schema:
+				state.skip_node()
+			else:
+				children.append(self.parse_node(state, schema[child_key] if child_key is not None else None))
+		return tuple(children)
@@ -0,0 +1,348 @@
+"""
+Parse Kicad-style s-expression files directly from a memory-mapped file
+
+Runs the same tokenizer regexes as the fast parser, but over the raw bytes of
+the file, so we never hold a decoded copy of the whole file in memory.  Values
+are stored as spans into the mapped file and only decoded when accessed, which
+for layout files is a small fraction of all values.
+
+Once a file is parsed, the spans of the values kept are copied out into one
+bytes object and the mapping is closed, so no file stays mapped (and on
+Windows, locked) while its nodes are alive.  Skipped subtrees, which are most
+of a layout file, are never copied.
+"""
+from array import array
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union, overload
+import logging
+import mmap
+import os
+import re
+from sys import intern
+
+from ..node import Node, NodeStream
+from ..selection import Selection
+from ...utils.tracing import Tracer
+
+from .parser import Parser, ParseSchema
+from .parser_observer import ParserObserver, NullParserObserver
+from .fast_parser import (
+	NODE_START as STR_NODE_START,
+	NODE_ATTR as STR_NODE_ATTR,
+	NODE_CLOSE as STR_NODE_CLOSE,
+	NODE_SPACE as STR_NODE_SPACE,
+	SUBTREE_BRACKET as STR_SUBTREE_BRACKET,
+	SUBTREE_SKIP as STR_SUBTREE_SKIP,
+	CHILD_KEY as STR_CHILD_KEY,
+	NODE_START_ATTR_BATCH,
+	NODE_ATTR_BATCH,
+	dequote,
+	find_subtree_end,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+Buffer = Union[bytes, mmap.mmap]
+
+
+def close_buffer(buffer: Buffer) -> None:
+	if isinstance(buffer, mmap.mmap):
+		buffer.close()
+
+
+def to_bytes_pattern(pattern: "re.Pattern[str]") -> "re.Pattern[bytes]":
+	return re.compile(pattern.pattern.encode("ascii"), pattern.flags & ~re.UNICODE)
+
+
+NODE_START = to_bytes_pattern(STR_NODE_START)
+NODE_ATTR = to_bytes_pattern(STR_NODE_ATTR)
+NODE_CLOSE = to_bytes_pattern(STR_NODE_CLOSE)
+NODE_SPACE = to_bytes_pattern(STR_NODE_SPACE)
+SUBTREE_BRACKET = to_bytes_pattern(STR_SUBTREE_BRACKET)
+SUBTREE_SKIP = to_bytes_pattern(STR_SUBTREE_SKIP)
+CHILD_KEY = to_bytes_pattern(STR_CHILD_KEY)
+
+QUOTE = ord("\"")
+CLOSE = ord(")")
+
+
+class LazyValues(Sequence[str]):
+	""" Node values as (start, end) offsets into the file, decoded together on first access """
+
+	buffer: Buffer
+	spans: "array[int]"
+	# All of the values, once any has been read
+	decoded: Optional[Tuple[str, ...]]
+
+	__slots__ = ("buffer", "spans", "decoded")
+
+	def __init__(self, buffer: Buffer, spans: "array[int]"):
+		self.buffer = buffer
+		self.spans = spans
+		self.decoded = None
+
+	def __len__(self):
+		return len(self.spans) >> 1
+
+	def decode(self) -> Tuple[str, ...]:
+		buffer = self.buffer
+		spans = self.spans
+		decoded = self.decoded = tuple(
+			dequote(buffer[start:end].decode("utf-8")) if buffer[start] == QUOTE else buffer[start:end].decode("utf-8")
+			for start, end in zip(spans[::2], spans[1::2])
+		)
+		return decoded
+
+	@overload
+	def __getitem__(self, index: int) -> str:
+		...
+
+	@overload
+	def __getitem__(self, index: slice) -> Sequence[str]:
+		...
+
+	def __getitem__(self, index: Union[int, slice]) -> Union[str, Sequence[str]]:
+		decoded = self.decoded
+		if decoded is None:
+			decoded = self.decode()
+		return decoded[index]
+
+	def __iter__(self) -> Iterator[str]:
+		decoded = self.decoded
+		if decoded is None:
+			decoded = self.decode()
+		return iter(decoded)
+
+	def __eq__(self, other: Any):
+		return isinstance(other, Sequence) and list(self) == list(other)  # pyright: ignore
+
+	def __hash__(self):
+		return hash(tuple(self))
+
+	def __repr__(self):
+		return repr(list(self))
+
+
+@dataclass
+class MmapParserState():
+	buffer: Buffer
+	position: int
+
+	__slots__ = ("buffer", "position")
+
+	def read(self, pattern: "re.Pattern[bytes]"):
+		match = pattern.match(self.buffer, self.position)
+		if match is not None:
+			self.position = match.end()
+		return match
+
+	def syntax_error(self):
+		size = len(self.buffer)
+		caret_pre = max(0, self.position - 40)
+		caret_post = min(size, self.position + 40)
+		caret_line = "  " + self.buffer[caret_pre:caret_post].decode("utf-8", errors="replace").replace("\n", "").replace("\t", "")
+		caret_str = "-" * (2 + self.position - caret_pre - 1) + "^"
+		logger.info("")
+		logger.info("ERROR at position %d:", self.position)
+		logger.info("%s", caret_line)
+		logger.info("%s", caret_str)
+		logger.info("")
+		if self.position == size:
+			return ValueError(f"Unexpected end-of-input at {self.position}/{size}:\n{caret_line}\n{caret_str}")
+		else:
+			return ValueError(f"Syntax error at {self.position}/{size}:\n{caret_line}\n{caret_str}")
+
+	def skip_node(self):
+		""" Step over the node at the current position without parsing it """
+		self.read(NODE_SPACE)
+		if (end := find_subtree_end(self.buffer, self.position, SUBTREE_SKIP)) < 0:
+			raise self.syntax_error()
+		self.position = end
+
+
+class MmapParser(Parser):
+
+	observer: ParserObserver
+	schema: ParseSchema
+	keys: Dict[bytes, str]
+	# Position after which to report progress next
+	report_at: int
+	# Values parsed since the last detach
+	parsed: List[LazyValues]
+
+	__slots__ = ("observer", "schema", "keys", "report_at", "parsed")
+
+	def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
+		self.observer = observer
+		self.schema = schema
+		self.keys = {}
+		self.report_at = 0
+		self.parsed = []
+
+	def report_progress(self, done: int, total: int):
+		""" Parse nodes call this once position passes report_at """
+		self.observer.progress(done, total)
+		self.report_at = done + self.observer.byte_interval
+
+	def parse_key(self, buffer: Buffer, start: int, end: int) -> str:
+		""" Keys are few and repeated a lot, so share one str per distinct key """
+		raw = buffer[start:end]
+		if (key := self.keys.get(raw)) is None:
+			key = self.keys[raw] = intern(raw.decode("ascii"))
+		return key
+
+	def peek_key(self, state: MmapParserState) -> Optional[str]:
+		match = CHILD_KEY.match(state.buffer, state.position)
+		return None if match is None else self.parse_key(state.buffer, *match.regs[1])
+
+	def parse_node(self, state: MmapParserState, schema: ParseSchema = None) -> Node:
+		if (match := state.read(NODE_START)) is None:
+			raise state.syntax_error()
+		buffer = state.buffer
+		regs = match.regs
+		key = self.parse_key(buffer, *regs[1])
+		spans = array("q")
+		children: List[Node] = []
+		# Same batching as the fast parser, see there for group numbering
+		for idx in range(2, 2 + 2 * NODE_START_ATTR_BATCH, 2):
+			if (span := regs[idx])[0] >= 0 or (span := regs[idx + 1])[0] >= 0:
+				spans.extend(span)
+			else:
+				break
+		closed = regs[2 + 2 * NODE_START_ATTR_BATCH][0] >= 0
+		while not closed:
+			if (match := state.read(NODE_ATTR)) is not None:
+				regs = match.regs
+				for idx in range(1, 2 * NODE_ATTR_BATCH, 2):
+					if (span := regs[idx])[0] >= 0 or (span := regs[idx + 1])[0] >= 0:
+						spans.extend(span)
+					else:
+						break
+				closed = regs[1 + 2 * NODE_ATTR_BATCH][0] >= 0
+			elif state.read(NODE_CLOSE) is not None:
+				closed = True
+			elif schema is None:
+				children.append(self.parse_node(state))
+			elif (child_key := self.peek_key(state)) is not None and child_key not in schema:
+				state.skip_node()
+			else:
+				children.append(self.parse_node(state, schema[child_key] if child_key is not None else None))
+		if state.position >= self.report_at:
+			self.report_progress(state.position, len(buffer))
+		values = LazyValues(buffer, spans)
+		self.parsed.append(values)
+		return Node(
+			key=key,
+			values=values,
+			children=tuple(children),
+		)
+
+	def detach(self) -> None:
+		""" Copy the values parsed so far out of their buffer, into one shared bytes object """
+		chunks: List[Buffer] = []
+		offset = 0
+		for values in self.parsed:
+			buffer = values.buffer
+			spans = values.spans
+			for index in range(0, len(spans), 2):
+				start = spans[index]
+				end = spans[index + 1]
+				chunks.append(buffer[start:end])
+				spans[index] = offset
+				offset += end - start
+				spans[index + 1] = offset
+		copy = b"".join(chunks)
+		for values in self.parsed:
+			values.buffer = copy
+		self.parsed = []
+
+	def parse_buffer(self, buffer: Buffer, root_values: Optional[Sequence[str]] = None) -> Selection:
+		state = MmapParserState(buffer, 0)
+		self.report_progress(0, len(buffer))
+		root = Node(
+			key="(root)",
+			values=tuple([] if root_values is None else root_values),
+			children=tuple([self.parse_node(state, self.schema)]),
+		)
+		state.read(NODE_SPACE)
+		if state.position != len(buffer):
+			raise state.syntax_error()
+		self.report_progress(len(buffer), len(buffer))
+		return Selection(nodes=[root])
+
+	def parse(self, text: str, root_values: Optional[Sequence[str]] = None) -> Selection:
+		try:
+			return self.parse_buffer(text.encode("utf-8"), root_values)
+		finally:
+			# Nothing to detach from, the values own their copy of the text
+			self.parsed = []
+
+	def map_file(self, path: str) -> Buffer:
+		with open(path, "rb") as fp:
+			if os.fstat(fp.fileno()).st_size == 0:
+				# Can't map an empty file, let the parser report it
+				return b""
+			return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def parse_file(self, path: str) -> Selection:
+		with Tracer.span("parse file", parser=type(self).__name__, path=path):
+			buffer = self.map_file(path)
+			try:
+				selection = self.parse_buffer(buffer, root_values=[path])
+				self.detach()
+				return selection
+			finally:
+				self.parsed = []
+				close_buffer(buffer)
+
+	def stream_children(self, state: MmapParserState) -> Iterator[Node]:
+		""" Each child is detached from the mapping before it is yielded, the mapping is closed at the end """
+		buffer = state.buffer
+		schema = self.schema
+		try:
+			while True:
+				state.read(NODE_SPACE)
+				if state.position == len(buffer):
+					raise state.syntax_error()
+				if buffer[state.position] == CLOSE:
+					state.position += 1
+					break
+				if schema is None:
+					child = self.parse_node(state)
+				elif (child_key := self.peek_key(state)) is not None and child_key not in schema:
+					state.skip_node()
+					continue
+				else:
+					child = self.parse_node(state, schema[child_key] if child_key is not None else None)
+				self.detach()
+				yield child
+			state.read(NODE_SPACE)
+			if state.position != len(buffer):
+				raise state.syntax_error()
+		finally:
+			self.parsed = []
+			close_buffer(buffer)
+
+	def stream_file(self, path: str) -> NodeStream:
+		""" Whole file is mapped already, so this just defers building the children """
+		buffer = self.map_file(path)
+		state = MmapParserState(buffer, 0)
+		try:
+			self.report_progress(0, len(buffer))
+			state.read(NODE_SPACE)
+			if (match := SUBTREE_BRACKET.match(buffer, state.position + 1)) is None:
+				raise state.syntax_error()
+			# Terminate the head where the first child starts, and parse it as a leaf
+			head_end = match.start(1)
+			head = self.parse_node(MmapParserState(buffer[state.position:head_end] + b")", 0))
+		except BaseException:
+			close_buffer(buffer)
+			raise
+		state.position = head_end
+		return NodeStream(
+			key=head.key,
+			values=list(head.values),
+			children=self.stream_children(state),
+		)
@@ -1,13 +1,24 @@
-from typing import Optional, Protocol, Sequence
+from typing import Mapping, Optional, Protocol, Sequence, runtime_checkable
 
+from ..node import NodeStream
 from ..selection import Selection
 
 from .parser_observer import ParserObserver, NullParserObserver
 
 
+# Which children of the file's top-level node to parse, and recursively which
+# of their children to parse.  None parses everything below that node.
+#
+# {"footprint": {"at": None}} only keeps footprints, and only their "at"
+# children (with all of the children of those).
+#
+# Skipped nodes are stepped over without being parsed.
+ParseSchema = Optional[Mapping[str, "ParseSchema"]]
+
+
 class Parser(Protocol):
 
-    def __init__(self, observer: ParserObserver = NullParserObserver()):
+    def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
         ...
 
     def parse(self, text: str, root_values: Optional[Sequence[str]] = None) -> Selection:
@@ -15,3 +26,11 @@ class Parser(Protocol):
 
     def parse_file(self, path: str) -> Selection:
         ...
+
+
+@runtime_checkable
+class StreamingParser(Parser, Protocol):
+
+    def stream_file(self, path: str) -> NodeStream:
+        """ Parse head of root node, then parse its children lazily while reading the file """
+        ...
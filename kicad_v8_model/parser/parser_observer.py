@@ -1,8 +1,16 @@
 from abc import ABC, abstractmethod
+import sys
+import time
+from typing import Callable, Optional
+
+from ...utils.cancellation import CancellationToken
 
 
 class ParserObserver(ABC):
 
+	# Parsers may skip progress calls until this many more bytes are parsed
+	byte_interval: int = 0
+
 	@abstractmethod
 	def progress(self, done: int, total: int):
 		...
@@ -10,5 +18,47 @@ class ParserObserver(ABC):
 
 class NullParserObserver(ParserObserver):
 
+	byte_interval = sys.maxsize
+
 	def progress(self, done: int, total: int):
 		pass
+
+
+class ThrottledParserObserver(ParserObserver):
+	"""
+	Forwards progress once byte_interval bytes or time_interval seconds have
+	passed since the last update (and always at the end), e.g. to a UI which
+	yields to the event loop on each update.  The cancellation token is checked on each progress
+	call, raising OperationCancelled out of the parser once it's set.
+	"""
+
+	report: Callable[[int, int], None]
+	time_interval: float
+	cancellation: Optional[CancellationToken]
+	last_done: int
+	last_time: float
+
+	def __init__(
+		self,
+		report: Callable[[int, int], None],
+		byte_interval: int = 1 << 16,
+		time_interval: float = 0.1,
+		cancellation: Optional[CancellationToken] = None,
+	):
+		self.report = report
+		self.byte_interval = byte_interval
+		self.time_interval = time_interval
+		self.cancellation = cancellation
+		self.last_done = 0
+		self.last_time = 0.0
+
+	def progress(self, done: int, total: int):
+		if self.cancellation is not None:
+			self.cancellation.check()
+		if done < self.last_done:
+			# Started on the next file
+			self.last_done = 0
+		if done == total or (done - self.last_done >= self.byte_interval or time.monotonic() - self.last_time >= self.time_interval):
+			self.last_done = done
+			self.last_time = time.monotonic()
+			self.report(done, total)
@@ -12,14 +12,17 @@ Remember, function calls in python are also insanely expensive in both time and
 space.
 """
 from typing import List, Sequence, Optional
+from sys import intern
 import logging
 
-from ..node import Node
+from ..node import Node, intern_value
 from ..selection import Selection
+from ...utils.tracing import Tracer
 
 from .string_iterator import StringIterator
-from .parser import Parser
+from .parser import Parser, ParseSchema
 from .parser_observer import ParserObserver, NullParserObserver
+from .fast_parser import STR_ESCAPES, decode_escape
 
 
 logger = logging.getLogger(__name__)
@@ -35,8 +38,23 @@ class SimpleParser(Parser):
 	QUOTE_ESCAPE = "\\"
 	UNQUOTED_VALUE = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_-."
 
-	def __init__(self, observer: ParserObserver = NullParserObserver()):
+	def __init__(self, observer: ParserObserver = NullParserObserver(), schema: ParseSchema = None):
 		self.observer = observer
+		self.schema = schema
+
+	def apply_schema(self, node: Node, schema: ParseSchema) -> Node:
+		""" No fast skipping here, just drop the unwanted nodes after parsing """
+		if schema is None:
+			return node
+		return Node(
+			key=node.key,
+			values=node.values,
+			children=tuple(
+				self.apply_schema(child, schema[child.key])
+				for child in node.children
+				if child.key in schema
+			),
+		)
 
 	def parse_unquoted(self, it: StringIterator) -> str:
 		begin = it.mark()
@@ -50,7 +68,7 @@ class SimpleParser(Parser):
 		escape = False
 		while True:
 			ch = it.peek()
-			if ch == self.QUOTE_ESCAPE:
+			if ch == self.QUOTE_ESCAPE and not escape:
 				escape = True
 			elif ch == self.QUOTE_END and not escape:
 				break
@@ -59,6 +77,8 @@ class SimpleParser(Parser):
 			it.next()
 		result = it.slice(begin)
 		it.next()
+		if self.QUOTE_ESCAPE in result:
+			result = STR_ESCAPES.sub(decode_escape, result)
 		return result
 
 	def parse_value(self, it: StringIterator) -> str:
@@ -73,7 +93,7 @@ class SimpleParser(Parser):
 		it.expect(self.EXPR_BEGIN)
 		it.next()
 		it.skip(self.WHITESPACE)
-		key = self.parse_value(it)
+		key = intern(self.parse_value(it))
 		values: List[str] = []
 		children: List[Node] = []
 		it.skip(self.WHITESPACE)
@@ -81,7 +101,7 @@ class SimpleParser(Parser):
 			if char == self.EXPR_BEGIN:
 				children.append(self.parse_node(it))
 			else:
-				values.append(self.parse_value(it))
+				values.append(intern_value(self.parse_value(it)))
 			it.skip(self.WHITESPACE)
 		it.next()
 		self.observer.progress(it.it, len(it.string))
@@ -92,7 +112,7 @@ class SimpleParser(Parser):
 		try:
 			it = StringIterator(text, 0, len(text))
 			it.skip(self.WHITESPACE)
-			result = self.parse_node(it)
+			result = self.apply_schema(self.parse_node(it), self.schema)
 			it.skip(self.WHITESPACE)
 			root = Node(
 				key="(root)",
@@ -104,6 +124,8 @@ class SimpleParser(Parser):
 			raise ValueError("Unexpected end of expression") from exc
 
 	def parse_file(self, path: str) -> Selection:
-		with open(path, "r", encoding="utf-8") as fp:
-			text = fp.read()
-		return self.parse(text, root_values=[path])
+		with Tracer.span("parse file", parser=type(self).__name__, path=path) as span:
+			with open(path, "r", encoding="utf-8") as fp:
+				text = fp.read()
+			span.set(chars=len(text))
+			return self.parse(text, root_values=[path])
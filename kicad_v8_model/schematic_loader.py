@@ -4,9 +4,10 @@ import os
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Type
 
-from ..utils.to_dict_strict import to_dict_strict
+from ..utils.to_dict_strict import insert_strict, to_dict_strict
 from ..utils.common_value import common_value
 from ..utils.multi_map import MultiMap
+from ..utils.tracing import Tracer
 
 from .entities import (
 	ComponentReference,
@@ -20,10 +21,12 @@ from .entities import (
 	SymbolReference,
 )
 
-from .entity_path import EntityPath, EntityPathComponent
-from .node import Node
+from .entity_path import EntityPath, EntityPathComponent, EntityPathTrie
+from .node import NodeView
 from .selection import Selection
-from .parser import Parser, FastParser
+from .sibling_index import SiblingIndex
+from .parser import Parser, ParseSchema, FastParser, ParserObserver, NullParserObserver
+from .sheet_preloader import SheetPreloader
 
 
 logger = logging.getLogger(__name__)
@@ -31,21 +34,23 @@ logger = logging.getLogger(__name__)
 
 @dataclass
 class SheetMetadata():
-	node: Node
+	node: NodeView
 	filename: str
 	instances: List["SheetInstanceMetadata"]
+	# The same instances, by the path of the instance of this sheet holding them
+	instances_by_parent: Dict[EntityPath, List["SheetInstanceMetadata"]]
 
 
 @dataclass
 class SymbolMetadata():
-	node: Node
+	node: NodeView
 	instances: List["SymbolInstanceMetadata"]
 
 
 @dataclass
 class SheetInstanceMetadata():
 	""" Intermediate data to help with loading stuff """
-	node: Node
+	node: NodeView
 	id: EntityPathComponent
 	path: EntityPath
 	page: str
@@ -56,7 +61,7 @@ class SheetInstanceMetadata():
 @dataclass
 class SymbolInstanceMetadata():
 	""" Intermediate data to help with loading stuff """
-	node: Node
+	node: NodeView
 	path: EntityPath
 	designator: str
 	unit: int
@@ -65,7 +70,7 @@ class SymbolInstanceMetadata():
 @dataclass
 class ComponentDefinitionMetadata():
 	""" Intermediate data to help with loading stuff """
-	node: Node
+	node: NodeView
 
 
 @dataclass
@@ -78,8 +83,37 @@ class ComponentInstanceMetadata():
 
 
 class SchematicLoader():
+	# CachedParser is worth it when sheets are re-read over and over, most of
+	# them unchanged, e.g. by the clone plugin (see PARSE_CACHE_ENVIRONMENT_VARIABLE)
 	parser_class: Type[Parser] = FastParser
 
+	# Only parse what we read, skips graphics, wires, labels, pin geometry, etc
+	schema: ParseSchema = {
+		"version": None,
+		"uuid": None,
+		"lib_symbols": {
+			"symbol": {
+				"symbol": {},
+			},
+		},
+		"symbol": {
+			"lib_id": None,
+			"unit": None,
+			"in_bom": None,
+			"on_board": None,
+			"dnp": None,
+			"uuid": None,
+			"property": None,
+			"instances": None,
+		},
+		"sheet": {
+			"uuid": None,
+			"property": None,
+			"instances": None,
+		},
+		"sheet_instances": None,
+	}
+
 	project: Project
 	filename: str
 	project_name: str
@@ -92,10 +126,11 @@ class SchematicLoader():
 	component_definition_metadata: Dict[EntityPathComponent, ComponentDefinitionMetadata]
 	component_instance_metadata: Dict[EntityPath, ComponentInstanceMetadata]
 
-	sheet_definitions: List[SheetDefinition]
-	sheet_instances: List[SheetInstance]
-	symbol_definitions: List[SymbolDefinition]
-	symbol_instances: List[SymbolInstance]
+	# Indexed as in the project, so lookups while loading don't scan
+	sheet_definitions: Dict[str, SheetDefinition]
+	sheet_instances: Dict[EntityPath, SheetInstance]
+	symbol_definitions: Dict[EntityPathComponent, SymbolDefinition]
+	symbol_instances: Dict[EntityPath, SymbolInstance]
 	component_definitions: List[ComponentDefinition]
 	component_instances: List[ComponentInstance]
 
@@ -103,15 +138,34 @@ class SchematicLoader():
 	root_sheet_instance: SheetInstance
 
 	@staticmethod
-	def load(project: Project, filename: str):
-		sheet_loader = SchematicLoader(project, filename)
-		sheet_loader.read_schematic()
-		sheet_loader.get_result()
+	def load(project: Project, filename: str, observer: ParserObserver = NullParserObserver()):
+		with Tracer.span("load schematic", path=filename):
+			sheet_loader = SchematicLoader(project, filename, observer=observer)
+			sheet_loader.read_schematic()
+			sheet_loader.get_result()
 
-	def __init__(self, project: Project, filename: str, sheet_loader: Optional[Callable[[str], Selection]] = None):
+	@staticmethod
+	def load_parallel(project: Project, filename: str, max_workers: Optional[int] = None):
+		""" Parse all sheet files up-front in a process pool, then load as usual """
+		with Tracer.span("load schematic (parallel)", path=filename):
+			preloader = SheetPreloader(SchematicLoader.parser_class, SchematicLoader.schema)
+			with Tracer.span("preload sheets") as span:
+				preloader.load(os.path.join(os.path.curdir, filename), max_workers=max_workers)
+				span.set(sheet_files=len(preloader.futures))
+			sheet_loader = SchematicLoader(project, filename, sheet_loader=preloader.get_sheet)
+			sheet_loader.read_schematic()
+			sheet_loader.get_result()
+
+	def __init__(
+		self,
+		project: Project,
+		filename: str,
+		sheet_loader: Optional[Callable[[str], Selection]] = None,
+		observer: ParserObserver = NullParserObserver(),
+	):
 		self.project = project
 		if sheet_loader is None:
-			sheet_loader = self.parser_class().parse_file
+			sheet_loader = self.parser_class(observer=observer, schema=self.schema).parse_file
 		self.filename = os.path.join(os.path.curdir, filename)
 		self.project_name = Path(filename).stem
 		self.sheet_loader = sheet_loader
@@ -119,28 +173,46 @@ class SchematicLoader():
 		self.symbol_metadata = {}
 		self.component_definition_metadata = {}
 		self.component_instance_metadata = {}
-		self.sheet_definitions = []
-		self.sheet_instances = []
-		self.symbol_definitions = []
-		self.symbol_instances = []
+		self.sheet_definitions = {}
+		self.sheet_instances = {}
+		self.symbol_definitions = {}
+		self.symbol_instances = {}
 		self.component_definitions = []
 		self.component_instances = []
 
 	def read_schematic(self):
-		self.read_sheet_definitions()
-		self.read_sheet_instances()
-		self.read_symbol_definitions()
-		self.read_symbol_instances()
-		self.read_component_definitions()
-		self.read_component_instances()
+		with Tracer.span("read sheet definitions") as span:
+			self.read_sheet_definitions()
+			span.set(sheet_definitions=len(self.sheet_definitions))
+		with Tracer.span("read sheet instances") as span:
+			self.read_sheet_instances()
+			span.set(sheet_instances=len(self.sheet_instances))
+		with Tracer.span("read symbol definitions") as span:
+			self.read_symbol_definitions()
+			span.set(symbol_definitions=len(self.symbol_definitions))
+		with Tracer.span("read symbol instances") as span:
+			self.read_symbol_instances()
+			span.set(symbol_instances=len(self.symbol_instances))
+		with Tracer.span("read component definitions") as span:
+			self.read_component_definitions()
+			span.set(component_definitions=len(self.component_definitions))
+		with Tracer.span("read component instances") as span:
+			self.read_component_instances()
+			span.set(component_instances=len(self.component_instances))
 
 	def get_result(self):
 		project = self.project
 		project.name = self.project_name
-		project.sheet_definitions = to_dict_strict(self.sheet_definitions, lambda item: item.filename)
-		project.sheet_instances = to_dict_strict(self.sheet_instances, lambda item: item.path)
-		project.symbol_definitions = to_dict_strict(self.symbol_definitions, lambda item: item.id)
-		project.symbol_instances = to_dict_strict(self.symbol_instances, lambda item: item.path)
+		project.sheet_definitions = self.sheet_definitions
+		project.sheet_instances = self.sheet_instances
+		project.symbol_definitions = self.symbol_definitions
+		project.symbol_instances = self.symbol_instances
+		project.paths = EntityPathTrie(
+			(instance.path, instance)
+			for instances in (self.sheet_instances, self.symbol_instances)
+			for instance in instances.values()
+		)
+		project.siblings = SiblingIndex.build(self.sheet_instances.values())
 		project.component_definitions = self.component_definitions
 		project.component_instances = to_dict_strict(self.component_instances, lambda item: item.reference.designator)
 		project.root_sheet_definition = self.root_sheet_definition
@@ -150,14 +222,7 @@ class SchematicLoader():
 		logger.info("Reading sheet definition")
 
 		def read_sheet_definition(filename: str):
-			if already_loaded := next(
-				(
-					item
-					for item in self.sheet_definitions
-					if item.filename == filename
-				),
-				None
-			):
+			if (already_loaded := self.sheet_definitions.get(filename)) is not None:
 				return already_loaded
 			logger.info("Reading project: %s", filename)
 			node = self.sheet_loader(filename).kicad_sch
@@ -185,11 +250,15 @@ class SchematicLoader():
 				for inner_sheet_node in node.sheet
 				for inner_path_node in inner_sheet_node.instances.project.filter(0, self.project_name).path
 			]
-			self.sheet_definitions.append(sheet_definition)
+			instances_by_parent: Dict[EntityPath, List[SheetInstanceMetadata]] = {}
+			for sheet_instance in sheet_instances:
+				instances_by_parent.setdefault(sheet_instance.path[:-1], []).append(sheet_instance)
+			self.sheet_definitions[filename] = sheet_definition
 			self.sheet_metadata[filename] = SheetMetadata(
 				node=~node,
 				filename=filename,
 				instances=sheet_instances,
+				instances_by_parent=instances_by_parent,
 			)
 			for sheet_instance in sheet_instances:
 				read_sheet_definition(sheet_instance.filename)
@@ -199,7 +268,7 @@ class SchematicLoader():
 
 	def read_sheet_instances(self):
 		logger.info("Reading sheet instances")
-		root_path = EntityPath([self.root_sheet_definition.id])
+		root_path = EntityPath.of((self.root_sheet_definition.id,))
 		logger.info("Reading sheet instance: %s / %s", self.project_name, root_path)
 		root_sheet_definition_node = Selection([self.sheet_metadata[self.root_sheet_definition.filename].node])
 		self.root_sheet_instance = SheetInstance(
@@ -211,18 +280,12 @@ class SchematicLoader():
 			children=[],
 			symbols=[],
 		)
-		self.sheet_instances.append(self.root_sheet_instance)
+		self.sheet_instances[root_path] = self.root_sheet_instance
 
 		def instantiante_inner_sheets(parent: SheetInstance):
-			for metadata in self.sheet_metadata[parent.definition.filename].instances:
-				if not metadata.path.startswith(parent.path):
-					continue
+			for metadata in self.sheet_metadata[parent.definition.filename].instances_by_parent.get(parent.path, ()):
 				logger.info("Reading sheet instance: %s / %s", metadata.name, metadata.path)
-				definition = next(
-					item
-					for item in self.sheet_definitions
-					if item.filename == metadata.filename
-				)
+				definition = self.sheet_definitions[metadata.filename]
 				sheet_instance = SheetInstance(
 					definition=definition,
 					path=metadata.path,
@@ -232,7 +295,7 @@ class SchematicLoader():
 					children=[],
 					symbols=[],
 				)
-				self.sheet_instances.append(sheet_instance)
+				insert_strict(self.sheet_instances, sheet_instance.path, sheet_instance)
 				parent.children.append(sheet_instance)
 				definition.instances.append(sheet_instance)
 				instantiante_inner_sheets(sheet_instance)
@@ -241,22 +304,28 @@ class SchematicLoader():
 
 	def read_symbol_definitions(self):
 		logger.info("Reading symbol definitions")
-		for sheet_definition in self.sheet_definitions:
+		for sheet_definition in self.sheet_definitions.values():
 			sheet_node = Selection([self.sheet_metadata[sheet_definition.filename].node])
+			library_symbols: Dict[str, List[NodeView]] = {}
+			for library_symbol_node in sheet_node.lib_symbols.symbol.nodes:
+				if library_symbol_node.values:
+					library_symbols.setdefault(library_symbol_node.values[0], []).append(library_symbol_node)
+			multi_units: Dict[str, bool] = {}
 			for symbol_node in sheet_node.symbol:
 				symbol_id = EntityPathComponent.parse(symbol_node.uuid[0])
 				symbol_library_id = symbol_node.lib_id[0]
 				designator = symbol_node.property.filter(0, "Reference")[1]
 				value = symbol_node.property.filter(0, "Value")[1]
-				unit = int(symbol_node.unit[0])
+				unit = symbol_node.unit.as_int()
 				logger.info("Reading symbol definition: %s / %s / %s", symbol_id, symbol_library_id, value)
-				library_info = sheet_node.lib_symbols.symbol.filter(0, symbol_library_id)
-				multi_unit = len([
-					...
-					for symbol in library_info.symbol
-					for unit in symbol[0].split("_")[-2]
-					if unit != "0"
-				]) > 1
+				if (multi_unit := multi_units.get(symbol_library_id)) is None:
+					library_info = Selection(library_symbols.get(symbol_library_id, []))
+					multi_unit = multi_units[symbol_library_id] = len([
+						...
+						for symbol in library_info.symbol
+						for unit in symbol[0].split("_")[-2]
+						if unit != "0"
+					]) > 1
 				symbol_definition = SymbolDefinition(
 					sheet=sheet_definition,
 					id=symbol_id,
@@ -267,7 +336,7 @@ class SchematicLoader():
 					),
 					instances=[],
 				)
-				self.symbol_definitions.append(symbol_definition)
+				insert_strict(self.symbol_definitions, symbol_id, symbol_definition)
 				sheet_definition.symbols.append(symbol_definition)
 				assert symbol_id not in self.symbol_metadata
 				self.symbol_metadata[symbol_definition.id] = SymbolMetadata(
@@ -277,7 +346,7 @@ class SchematicLoader():
 							node=~symbol_node,
 							path=EntityPath.parse(path_node[0]) + symbol_id,
 							designator=path_node.reference[0],
-							unit=int(path_node.unit[0]),
+							unit=path_node.unit.as_int(),
 						)
 						for path_node in symbol_node.instances.project.filter(0, self.project_name).path
 					],
@@ -288,11 +357,7 @@ class SchematicLoader():
 
 	def read_symbol_instances(self):
 		logger.info("Reading symbol instances")
-		sheet_map = {
-			item.path: item
-			for item in self.sheet_instances
-		}
-		for symbol_definition in self.symbol_definitions:
+		for symbol_definition in self.symbol_definitions.values():
 			metadata = self.symbol_metadata[symbol_definition.id]
 			for symbol_instance_metadata in metadata.instances:
 				symbol_reference = SymbolReference(
@@ -301,7 +366,7 @@ class SchematicLoader():
 					multi_unit=symbol_definition.reference.multi_unit,
 				)
 				logger.info("Reading symbol instance: %s", symbol_reference)
-				sheet_instance = sheet_map[symbol_instance_metadata.path[:-1]]
+				sheet_instance = self.sheet_instances[symbol_instance_metadata.path[:-1]]
 				symbol_instance = SymbolInstance(
 					definition=symbol_definition,
 					path=symbol_instance_metadata.path,
@@ -311,13 +376,13 @@ class SchematicLoader():
 				self.component_instance_metadata[symbol_instance_metadata.path] = ComponentInstanceMetadata(
 					symbol_instance=symbol_instance,
 				)
-				self.symbol_instances.append(symbol_instance)
+				insert_strict(self.symbol_instances, symbol_instance.path, symbol_instance)
 				sheet_instance.symbols.append(symbol_instance)
 				symbol_definition.instances.append(symbol_instance)
 
 	def read_component_definitions(self):
 		for units in MultiMap.groupby(
-			self.symbol_definitions,
+			self.symbol_definitions.values(),
 			lambda symbol_definition: symbol_definition.reference.designator,
 		).groups():
 			nodes = [
@@ -325,9 +390,9 @@ class SchematicLoader():
 				for unit in units
 			]
 			symbol_library_id = common_value(nodes, lambda node: node.lib_id[0])
-			in_bom = common_value(nodes, lambda node: node.in_bom[0] == "yes")
-			on_board = common_value(nodes, lambda node: node.on_board[0] == "yes")
-			dnp = common_value(nodes, lambda node: node.dnp[0] == "yes")
+			in_bom = common_value(nodes, lambda node: node.in_bom.as_bool())
+			on_board = common_value(nodes, lambda node: node.on_board.as_bool())
+			dnp = common_value(nodes, lambda node: node.dnp.as_bool())
 			value = common_value(nodes, lambda node: node.property.filter(0, "Value")[0])
 			properties = {
 				name: common_value(nodes, lambda node: node.property.filter(0, name)[1])
@@ -351,7 +416,7 @@ class SchematicLoader():
 				unit.component = component_definition
 
 	def read_component_instances(self):
-		for units in MultiMap.groupby(self.symbol_instances, lambda symbol_instance: symbol_instance.reference.designator).groups():
+		for units in MultiMap.groupby(self.symbol_instances.values(), lambda symbol_instance: symbol_instance.reference.designator).groups():
 			component_definition = common_value(units, lambda unit: unit.definition.component)
 			designator = next(iter(units)).reference.designator  # Same for all since it was the groupby key
 			reference = ComponentReference(
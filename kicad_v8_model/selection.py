@@ -1,14 +1,21 @@
 from dataclasses import dataclass
-from typing import Iterator, List, Optional, Sequence, Set
+from typing import ClassVar, Iterator, List, Optional, Sequence, Set
 
-from .node import Node
+from .angle import Angle
+from .entity_path import EntityPathComponent
+from .node import NodeView
+from .values import parse_angle, parse_bool, parse_id, parse_int, parse_length, parse_vector, parse_vectors
+from .vector2 import Vector2
 
 
 @dataclass
 class Selection():
-    nodes: List[Node]
+    nodes: Sequence[NodeView]
 
-    def _get_one(self) -> Node:
+    # Look up children via the per-node key index instead of scanning them
+    use_key_index: ClassVar[bool] = True
+
+    def _get_one(self) -> NodeView:
         if not self.nodes:
             raise KeyError("No nodes in selection")
         if len(self.nodes) > 1:
@@ -35,7 +42,7 @@ class Selection():
         return self._get_one().values
 
     @property
-    def children(self) -> Sequence[Node]:
+    def children(self) -> Sequence[NodeView]:
         return self._get_one().children
 
     @property
@@ -44,6 +51,14 @@ class Selection():
 
     def children_by_key(self, key: str) -> "Selection":
         """ Filter children by key """
+        if self.use_key_index:
+            if len(self.nodes) == 1:
+                return Selection(list(self.nodes[0].children_by_key(key)))
+            return Selection([
+                child
+                for node in self.nodes
+                for child in node.children_by_key(key)
+            ])
         nodes = [
             child
             for node in self.nodes
@@ -62,6 +77,31 @@ class Selection():
             else:
                 raise
 
+    def as_int(self, index: int = 0) -> int:
+        return parse_int(self.value_by_index(index))
+
+    def as_bool(self, index: int = 0) -> bool:
+        return parse_bool(self.value_by_index(index))
+
+    def as_length(self, index: int = 0) -> int:
+        """ Millimetres to nanometres """
+        return parse_length(self.value_by_index(index))
+
+    def as_angle(self, index: int = 0, default: Optional[str] = None) -> Angle:
+        return parse_angle(self.value_by_index(index, default))
+
+    def as_id(self, index: int = 0) -> EntityPathComponent:
+        return parse_id(self.value_by_index(index))
+
+    def as_vector(self, index: int = 0) -> Vector2:
+        """ Coordinate pair in nanometres, e.g. from at/start/end/xy """
+        values = self._get_one().values
+        return parse_vector(values[index], values[index + 1])
+
+    def as_vectors(self, index: int = 0) -> List[Vector2]:
+        """ Coordinate pair of every selected node, converted in bulk """
+        return parse_vectors([node.values for node in self.nodes], index)
+
     def filter(self, field: int, value: str) -> "Selection":
         """ Filter selection by field value """
         filtered_nodes = [
@@ -93,7 +133,7 @@ class Selection():
     def __str__(self):
         indent = "  "
 
-        def stringify(node: Node, level: int) -> List[str]:
+        def stringify(node: NodeView, level: int) -> List[str]:
             return (
                 [
                     (indent * level) + " ".join([node.key] + list(node.values)),
@@ -112,4 +152,4 @@ class Selection():
 
     def __add__(self, other: "Selection"):
         """ Merge selections (no deduplication) """
-        return Selection(self.nodes + other.nodes)
+        return Selection([*self.nodes, *other.nodes])
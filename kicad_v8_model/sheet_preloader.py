@@ -0,0 +1,85 @@
+"""
+Parse all sheet files of a schematic hierarchy in parallel
+
+Sheet files are independent of each other until the schematic loader links
+them together, so we find the child sheet filenames with a cheap regex scan of
+each file, and hand the actual parsing off to a process pool.
+
+Parsed trees come back from the workers as packed tuples, which pickle much
+faster than the node dataclasses.
+
+Note: worker processes are forked on Linux.  Other platforms spawn a new
+interpreter via sys.executable, which is not Python when running inside Kicad,
+so only use this from standalone scripts there.
+"""
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+import logging
+import os
+import re
+from typing import Dict, List, Optional, Type
+
+from .node import PackedNode, pack_node, unpack_node
+from .selection import Selection
+from .parser import Parser, ParseSchema
+from .parser.fast_parser import dequote
+
+
+logger = logging.getLogger(__name__)
+
+
+SHEET_FILE_PROPERTY = re.compile(r'''\(property\s+"Sheetfile"\s+("(?:[^"\\]|\\.)*")''')
+
+
+def normalise_sheet_filename(filename: str) -> str:
+	return os.path.normpath(filename)
+
+
+def find_sheet_files(filename: str) -> List[str]:
+	""" Find filenames of child sheets without parsing the whole file """
+	with open(filename, "r", encoding="utf-8") as fp:
+		text = fp.read()
+	return [
+		normalise_sheet_filename(os.path.join(os.path.dirname(filename), dequote(match.group(1))))
+		for match in SHEET_FILE_PROPERTY.finditer(text)
+	]
+
+
+def parse_packed(parser_class: Type[Parser], schema: ParseSchema, filename: str) -> PackedNode:
+	""" Runs in worker process """
+	return pack_node(~parser_class(schema=schema).parse_file(filename))
+
+
+class SheetPreloader():
+
+	parser_class: Type[Parser]
+	schema: ParseSchema
+	futures: Dict[str, "Future[PackedNode]"]
+
+	def __init__(self, parser_class: Type[Parser], schema: ParseSchema = None):
+		self.parser_class = parser_class
+		self.schema = schema
+		self.futures = {}
+
+	def submit_all(self, executor: Executor, root_filename: str):
+		pending = [normalise_sheet_filename(root_filename)]
+		while pending:
+			filename = pending.pop()
+			if filename in self.futures:
+				continue
+			logger.info("Queueing sheet for parsing: %s", filename)
+			self.futures[filename] = executor.submit(parse_packed, self.parser_class, self.schema, filename)
+			try:
+				pending += find_sheet_files(filename)
+			except OSError:
+				# Let the parser report the error, if the loader needs this sheet
+				pass
+
+	def load(self, root_filename: str, max_workers: Optional[int] = None):
+		with ProcessPoolExecutor(max_workers=max_workers) as executor:
+			self.submit_all(executor, root_filename)
+		logger.info("Parsed %d sheet files", len(self.futures))
+
+	def get_sheet(self, filename: str) -> Selection:
+		""" Drop-in replacement for Parser.parse_file, for sheets found by the preloader """
+		future = self.futures[normalise_sheet_filename(filename)]
+		return Selection(nodes=[unpack_node(future.result())])
@@ -0,0 +1,65 @@
+"""
+Sheet and symbol instances grouped by parent sheet instance and definition
+
+Clone placement addresses an instance by the definition and position of it
+and each of its ancestors among the siblings of the same definition (see
+clone_placement.spath).  Working that out by filtering the parent's children
+at every level is a scan per level per lookup, so the groups and positions
+are worked out once when the schematic is loaded:
+
+	index = project.siblings
+	position = index.position(symbol_instance)
+	same = index.siblings(symbol_instance.sheet, symbol_instance.definition)
+	assert same[position] is symbol_instance
+
+Groups are keyed by the parent and definition objects themselves.  The root
+sheet instance has no parent, it is the only one in its group.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union, overload
+
+from .entities import SheetDefinition, SheetInstance, SymbolDefinition, SymbolInstance
+
+
+Instance = Union[SheetInstance, SymbolInstance]
+Definition = Union[SheetDefinition, SymbolDefinition]
+
+
+@dataclass
+class SiblingIndex():
+	# In the same order as in the parent's children/symbols
+	groups: Dict[Tuple[Optional[SheetInstance], Definition], List[Instance]]
+	positions: Dict[Instance, int]
+
+	@staticmethod
+	def build(sheets: Iterable[SheetInstance]) -> "SiblingIndex":
+		index = SiblingIndex(groups={}, positions={})
+		for sheet in sheets:
+			if sheet.parent is None:
+				index.add(None, sheet)
+			for child in sheet.children:
+				index.add(sheet, child)
+			for symbol in sheet.symbols:
+				index.add(sheet, symbol)
+		return index
+
+	def add(self, parent: Optional[SheetInstance], item: Instance) -> None:
+		group = self.groups.setdefault((parent, item.definition), [])
+		self.positions[item] = len(group)
+		group.append(item)
+
+	def position(self, item: Instance) -> int:
+		""" Position of the item among the siblings of the same definition """
+		return self.positions[item]
+
+	@overload
+	def siblings(self, parent: Optional[SheetInstance], definition: SheetDefinition) -> Sequence[SheetInstance]:
+		...
+
+	@overload
+	def siblings(self, parent: Optional[SheetInstance], definition: SymbolDefinition) -> Sequence[SymbolInstance]:
+		...
+
+	def siblings(self, parent: Optional[SheetInstance], definition: Definition) -> Sequence[Instance]:
+		""" Children or symbols of the parent with the definition, in order """
+		return self.groups.get((parent, definition), [])
@@ -0,0 +1,295 @@
+"""
+Spatial index over board items, for "what is near this point / in this box"
+
+A uniform grid: each item is filed under every cell its bounding box
+touches, so a query only looks at items in the cells it overlaps.  Items
+spanning many cells (large zones) are kept in one list which every query
+checks, rather than filling the grid.
+
+	index = SpatialIndex.build(project)
+	items = index.query_box(Box(0, 0, 10_000_000, 10_000_000), layer=BoardLayer.F_Cu)
+	[nearest] = index.nearest(Vector2(5_000_000, 5_000_000))
+
+Coordinates are nanometres.  The model doesn't hold footprint outlines yet,
+so footprints are indexed at their position.  Arcs are boxed by their three
+points, which can miss a bulge past an axis extreme.  Items are plain model
+entities, so after moving one call update() to re-file it.
+"""
+from dataclasses import dataclass
+import heapq
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .board import BoardLayer
+from .entities import ArcRoute, Footprint, PolygonRoute, Project, StraightRoute, Via
+from .entity_path import EntityPathComponent
+from .vector2 import Vector2
+
+
+# Nanometres, a few typical track lengths
+DEFAULT_CELL_SIZE = 2_000_000
+
+# Items touching more cells than this aren't filed in the grid
+MAX_ITEM_CELLS = 256
+
+SpatialItem = Union[Footprint, StraightRoute, ArcRoute, Via, PolygonRoute]
+
+Cell = Tuple[int, int]
+
+
+@dataclass(frozen=True)
+class Box():
+	""" Inclusive bounds """
+	low_x: int
+	low_y: int
+	high_x: int
+	high_y: int
+
+	@staticmethod
+	def around(points: Iterable[Vector2], margin: int = 0) -> "Box":
+		xs = [point.x for point in points]
+		ys = [point.y for point in points]
+		return Box(min(xs) - margin, min(ys) - margin, max(xs) + margin, max(ys) + margin)
+
+	def intersects(self, other: "Box") -> bool:
+		return (
+			self.low_x <= other.high_x and other.low_x <= self.high_x and
+			self.low_y <= other.high_y and other.low_y <= self.high_y
+		)
+
+	def distance_squared(self, point: Vector2) -> int:
+		""" Zero inside the box """
+		dx = max(self.low_x - point.x, 0, point.x - self.high_x)
+		dy = max(self.low_y - point.y, 0, point.y - self.high_y)
+		return dx * dx + dy * dy
+
+
+def line_box(item: StraightRoute) -> Box:
+	start, end = item.start, item.end
+	return Box(min(start.x, end.x), min(start.y, end.y), max(start.x, end.x), max(start.y, end.y))
+
+
+def position_box(item: Union[Footprint, Via]) -> Box:
+	position = item.position
+	return Box(position.x, position.y, position.x, position.y)
+
+
+# By exact type, isinstance is slow against the protocol bases of the entities
+ITEM_BOXES: Dict[type, Callable[[Any], Box]] = {
+	StraightRoute: line_box,
+	ArcRoute: lambda item: Box.around((item.start, item.mid, item.end)),
+	PolygonRoute: lambda item: Box.around(item.points),
+	Via: position_box,
+	Footprint: position_box,
+}
+
+
+def item_box(item: SpatialItem) -> Box:
+	return ITEM_BOXES[type(item)](item)
+
+
+def item_layers(item: SpatialItem) -> FrozenSet[BoardLayer]:
+	if type(item) is Via:
+		# Through and blind vias connect every copper layer between their two
+		copper = BoardLayer.id_map()[:BoardLayer.B_Cu.index + 1]
+		first, last = sorted(layer.type.index for layer in item.layers)
+		return frozenset(copper[first:last + 1])
+	return frozenset((item.layer.type,))
+
+
+def segment_distance_squared(start: Vector2, end: Vector2, point: Vector2) -> float:
+	dx = end.x - start.x
+	dy = end.y - start.y
+	length_squared = dx * dx + dy * dy
+	if length_squared == 0:
+		t = 0.0
+	else:
+		t = min(1.0, max(0.0, ((point.x - start.x) * dx + (point.y - start.y) * dy) / length_squared))
+	ox = start.x + t * dx - point.x
+	oy = start.y + t * dy - point.y
+	return ox * ox + oy * oy
+
+
+@dataclass(eq=False)
+class SpatialEntry():
+	""" Compared and hashed by identity """
+	item: SpatialItem
+	box: Box
+	layers: FrozenSet[BoardLayer]
+	# Empty for items kept out of the grid
+	cells: List[Cell]
+
+	def distance_squared(self, point: Vector2) -> float:
+		""" To the track itself for straight tracks, otherwise to the bounding box """
+		item = self.item
+		if type(item) is StraightRoute:
+			return segment_distance_squared(item.start, item.end, point)
+		return self.box.distance_squared(point)
+
+
+class SpatialIndex():
+
+	cell_size: int
+	entries: Dict[EntityPathComponent, SpatialEntry]
+	cells: Dict[Cell, List[SpatialEntry]]
+	oversized: List[SpatialEntry]
+	# Bounds of all cells ever used, for ending nearest-neighbour searches
+	cell_bounds: Optional[Tuple[int, int, int, int]]
+
+	def __init__(self, cell_size: int = DEFAULT_CELL_SIZE):
+		self.cell_size = cell_size
+		self.entries = {}
+		self.cells = {}
+		self.oversized = []
+		self.cell_bounds = None
+
+	@staticmethod
+	def build(project: Project, cell_size: int = DEFAULT_CELL_SIZE) -> "SpatialIndex":
+		index = SpatialIndex(cell_size)
+		for items in (project.footprints, project.tracks, project.track_arcs, project.vias, project.zones):
+			for item in items.values():
+				index.insert(item)
+		return index
+
+	def __len__(self):
+		return len(self.entries)
+
+	def __contains__(self, item: SpatialItem):
+		return item.id in self.entries
+
+	def cell_of(self, point: Vector2) -> Cell:
+		return (point.x // self.cell_size, point.y // self.cell_size)
+
+	def cell_range(self, box: Box) -> Tuple[range, range]:
+		cell_size = self.cell_size
+		return (
+			range(box.low_x // cell_size, box.high_x // cell_size + 1),
+			range(box.low_y // cell_size, box.high_y // cell_size + 1),
+		)
+
+	def cells_of(self, box: Box) -> List[Cell]:
+		xs, ys = self.cell_range(box)
+		return [
+			(x, y)
+			for x in xs
+			for y in ys
+		]
+
+	def insert(self, item: SpatialItem) -> None:
+		id = item.id
+		if id in self.entries:
+			raise KeyError("Item already indexed", id)
+		box = item_box(item)
+		xs, ys = self.cell_range(box)
+		entry = SpatialEntry(item=item, box=box, layers=item_layers(item), cells=[])
+		self.entries[id] = entry
+		if len(xs) * len(ys) > MAX_ITEM_CELLS:
+			self.oversized.append(entry)
+			return
+		entry.cells = self.cells_of(box)
+		cells = self.cells
+		for cell in entry.cells:
+			if (items := cells.get(cell)) is None:
+				cells[cell] = [entry]
+			else:
+				items.append(entry)
+		if (bounds := self.cell_bounds) is None:
+			self.cell_bounds = (xs[0], ys[0], xs[-1], ys[-1])
+		elif xs[0] < bounds[0] or ys[0] < bounds[1] or xs[-1] > bounds[2] or ys[-1] > bounds[3]:
+			self.cell_bounds = (min(bounds[0], xs[0]), min(bounds[1], ys[0]), max(bounds[2], xs[-1]), max(bounds[3], ys[-1]))
+
+	def remove(self, item: SpatialItem) -> None:
+		""" Uses the cells the item was filed under, so works after it has moved """
+		entry = self.entries.pop(item.id)
+		if not entry.cells:
+			self.oversized.remove(entry)
+		for cell in entry.cells:
+			items = self.cells[cell]
+			items.remove(entry)
+			if not items:
+				del self.cells[cell]
+
+	def update(self, item: SpatialItem) -> None:
+		""" Re-file an item after it has moved """
+		self.remove(item)
+		self.insert(item)
+
+	def query_box(self, box: Box, layer: Optional[BoardLayer] = None) -> List[SpatialItem]:
+		""" Items whose bounding box intersects the box """
+		found: Dict[SpatialEntry, None] = {}
+		candidates: List[List[SpatialEntry]] = [self.oversized]
+		for cell in self.cells_of(box):
+			if (items := self.cells.get(cell)) is not None:
+				candidates.append(items)
+		for items in candidates:
+			for entry in items:
+				if entry in found:
+					continue
+				if layer is not None and layer not in entry.layers:
+					continue
+				if entry.box.intersects(box):
+					found[entry] = None
+		return [entry.item for entry in found]
+
+	def ring(self, centre: Cell, radius: int) -> Iterator[Cell]:
+		""" Cells at exactly this Chebyshev distance from the centre """
+		cx, cy = centre
+		if radius == 0:
+			yield centre
+			return
+		for x in range(cx - radius, cx + radius + 1):
+			yield (x, cy - radius)
+			yield (x, cy + radius)
+		for y in range(cy - radius + 1, cy + radius):
+			yield (cx - radius, y)
+			yield (cx + radius, y)
+
+	def nearest(
+		self,
+		point: Vector2,
+		count: int = 1,
+		layer: Optional[BoardLayer] = None,
+		max_distance: Optional[int] = None,
+	) -> List[SpatialItem]:
+		""" Up to count items nearest the point, nearest first """
+		if count < 1:
+			return []
+		seen: Dict[SpatialEntry, float] = {}
+		# Max-heap (negated) of the best count so far
+		best: List[Tuple[float, int, SpatialEntry]] = []
+		limit = None if max_distance is None else max_distance * max_distance
+
+		def consider(items: List[SpatialEntry]):
+			for entry in items:
+				if entry in seen or (layer is not None and layer not in entry.layers):
+					continue
+				distance = seen[entry] = entry.distance_squared(point)
+				if limit is not None and distance > limit:
+					continue
+				if len(best) < count:
+					heapq.heappush(best, (-distance, len(seen), entry))
+				elif distance < -best[0][0]:
+					heapq.heapreplace(best, (-distance, len(seen), entry))
+
+		consider(self.oversized)
+		if self.cell_bounds is not None:
+			centre = self.cell_of(point)
+			bx0, by0, bx1, by1 = self.cell_bounds
+			# Past this radius, rings hold no cells
+			last_radius = max(centre[0] - bx0, bx1 - centre[0], centre[1] - by0, by1 - centre[1])
+			radius = 0
+			while radius <= last_radius:
+				for cell in self.ring(centre, radius):
+					if (items := self.cells.get(cell)) is not None:
+						consider(items)
+				# Anything not seen yet is in a further ring, at least this far away
+				bound = radius * self.cell_size
+				bound = bound * bound
+				if len(best) == count and -best[0][0] <= bound:
+					break
+				if limit is not None and bound > limit:
+					break
+				radius += 1
+		return [
+			entry.item
+			for _, _, entry in sorted(best, key=lambda result: (-result[0], result[1]))
+		]
@@ -0,0 +1,284 @@
+"""
+Generate synthetic Kicad projects for benchmarking
+
+Writes a schematic hierarchy and a matching board, with the same structure the
+loaders expect from real Kicad 8 files, but with sizes we can dial up and down.
+Output is fully determined by the settings (including the seed), so results
+from different machines and runs are comparable.
+
+Hierarchy: the root sheet holds sheet_fanout instances of sheet_1, which holds
+sheet_fanout instances of sheet_2, and so on down to sheet_depth.  Each sheet
+has symbols_per_sheet resistors, and each symbol instance gets a footprint.
+With sheet_files_per_level above one, the sheet blocks of each level are dealt
+round-robin over that many files, so the hierarchy has many sheet definitions
+as well as many instances.
+"""
+from dataclasses import dataclass
+from pathlib import Path
+from random import Random
+from typing import Dict, List, TextIO
+from uuid import UUID
+
+
+@dataclass(frozen=True)
+class SyntheticProjectSettings():
+	name: str = "synthetic"
+	seed: int = 1
+	sheet_depth: int = 2
+	sheet_fanout: int = 2
+	sheet_files_per_level: int = 1
+	symbols_per_sheet: int = 10
+	pads_per_footprint: int = 2
+	nets: int = 50
+	tracks: int = 1000
+	track_arcs: int = 100
+	vias: int = 100
+	zones: int = 2
+	# Points in each zone's filled polygon, often most of a real board file
+	filled_polygon_points: int = 1000
+
+	@property
+	def sheet_instance_count(self) -> int:
+		return sum(self.sheet_fanout ** level for level in range(self.sheet_depth + 1))
+
+	@property
+	def symbol_instance_count(self) -> int:
+		return self.sheet_instance_count * self.symbols_per_sheet
+
+
+# Roughly: a small board, a typical one, a big one, one bigger than we've seen,
+# and a wide one
+SYNTHETIC_PROJECT_SIZES: Dict[str, SyntheticProjectSettings] = {
+	"small": SyntheticProjectSettings(
+		sheet_depth=1, sheet_fanout=2, symbols_per_sheet=10,
+		tracks=300, track_arcs=30, vias=30, zones=2, filled_polygon_points=2000,
+	),
+	"medium": SyntheticProjectSettings(
+		sheet_depth=2, sheet_fanout=4, symbols_per_sheet=20,
+		tracks=3000, track_arcs=300, vias=300, zones=4, filled_polygon_points=10000,
+	),
+	"large": SyntheticProjectSettings(
+		sheet_depth=3, sheet_fanout=4, symbols_per_sheet=25,
+		tracks=15000, track_arcs=1500, vias=1500, zones=8, filled_polygon_points=30000,
+	),
+	"huge": SyntheticProjectSettings(
+		sheet_depth=3, sheet_fanout=6, symbols_per_sheet=30,
+		tracks=60000, track_arcs=6000, vias=6000, zones=16, filled_polygon_points=50000,
+	),
+	# Many copies of one block, as in a 64-channel design, for clone mapping
+	"channels": SyntheticProjectSettings(
+		sheet_depth=1, sheet_fanout=64, symbols_per_sheet=60,
+		tracks=3000, track_arcs=300, vias=300, zones=4, filled_polygon_points=10000,
+	),
+}
+
+
+@dataclass
+class SyntheticSymbolInstance():
+	""" What a footprint needs to point back to its symbol """
+	path: str
+	designator: str
+
+
+class SyntheticProjectGenerator():
+
+	settings: SyntheticProjectSettings
+	directory: Path
+	random: Random
+	root_id: str
+	symbol_instances: List[SyntheticSymbolInstance]
+	page: int
+
+	def __init__(self, settings: SyntheticProjectSettings, directory: Path):
+		self.settings = settings
+		self.directory = directory
+		self.random = Random(settings.seed)
+		self.root_id = self.uuid()
+		self.symbol_instances = []
+		self.page = 1
+
+	@staticmethod
+	def generate(settings: SyntheticProjectSettings, directory: Path) -> "SyntheticProjectGenerator":
+		generator = SyntheticProjectGenerator(settings, directory)
+		generator.write_project()
+		return generator
+
+	@property
+	def schematic_file(self) -> Path:
+		return self.directory / f"{self.settings.name}.kicad_sch"
+
+	@property
+	def layout_file(self) -> Path:
+		return self.directory / f"{self.settings.name}.kicad_pcb"
+
+	def sheet_file(self, level: int, index: int = 0) -> Path:
+		if level == 0:
+			return self.schematic_file
+		if index == 0:
+			return self.directory / f"sheet_{level}.kicad_sch"
+		return self.directory / f"sheet_{level}_{index}.kicad_sch"
+
+	def uuid(self) -> str:
+		return str(UUID(int=self.random.getrandbits(128), version=4))
+
+	def coordinate(self) -> str:
+		return f"{self.random.uniform(0, 300):.4f}"
+
+	def net(self) -> int:
+		return self.random.randrange(1, self.settings.nets)
+
+	def copper_layer(self) -> str:
+		return self.random.choice(("F.Cu", "B.Cu"))
+
+	def next_page(self) -> str:
+		self.page += 1
+		return str(self.page)
+
+	def write_project(self):
+		settings = self.settings
+		self.directory.mkdir(parents=True, exist_ok=True)
+		# sheet_files_per_level files per level, shared by all instances on that level
+		level_instance_paths = [[f"/{self.root_id}"]]
+		for level in range(settings.sheet_depth + 1):
+			next_level_instance_paths: List[List[str]] = [[] for _ in range(settings.sheet_files_per_level)]
+			for index, instance_paths in enumerate(level_instance_paths):
+				sheet_id = self.root_id if level == 0 else self.uuid()
+				child_ids = [self.uuid() for _ in range(settings.sheet_fanout)] if level < settings.sheet_depth else []
+				self.write_sheet(level, index, sheet_id, instance_paths, child_ids)
+				for child_index, child_id in enumerate(child_ids):
+					next_level_instance_paths[child_index % settings.sheet_files_per_level] += [
+						f"{instance_path}/{child_id}"
+						for instance_path in instance_paths
+					]
+			level_instance_paths = [
+				instance_paths
+				for instance_paths in next_level_instance_paths
+				if instance_paths
+			]
+		self.write_board()
+
+	def write_sheet(self, level: int, index: int, sheet_id: str, instance_paths: List[str], child_ids: List[str]):
+		""" instance_paths are the paths of all instances of this sheet """
+		settings = self.settings
+		with open(self.sheet_file(level, index), "w", encoding="utf-8") as fp:
+			fp.write('(kicad_sch (version 20231120) (generator "eeschema") (generator_version "8.0")\n')
+			fp.write(f'\t(uuid "{sheet_id}")\n')
+			fp.write('\t(paper "A4")\n')
+			fp.write('\t(lib_symbols\n')
+			fp.write('\t\t(symbol "Device:R" (pin_numbers hide) (pin_names (offset 0)) (exclude_from_sim no) (in_bom yes) (on_board yes)\n')
+			fp.write('\t\t\t(property "Reference" "R" (at 2.032 0 90) (effects (font (size 1.27 1.27))))\n')
+			fp.write('\t\t\t(symbol "R_0_1" (rectangle (start -1.016 -2.54) (end 1.016 2.54) (stroke (width 0.254) (type default)) (fill (type none))))\n')
+			fp.write('\t\t\t(symbol "R_1_1"\n')
+			fp.write('\t\t\t\t(pin passive line (at 0 3.81 270) (length 1.27) (name "~" (effects (font (size 1.27 1.27)))) (number "1" (effects (font (size 1.27 1.27)))))\n')
+			fp.write('\t\t\t\t(pin passive line (at 0 -3.81 90) (length 1.27) (name "~" (effects (font (size 1.27 1.27)))) (number "2" (effects (font (size 1.27 1.27)))))\n')
+			fp.write('\t\t\t)\n')
+			fp.write('\t\t)\n')
+			fp.write('\t)\n')
+			for index in range(settings.symbols_per_sheet):
+				self.write_symbol(fp, index, instance_paths)
+				self.write_wire(fp)
+			for child_index, child_id in enumerate(child_ids):
+				self.write_sheet_block(fp, child_index, level + 1, child_id, instance_paths)
+			if level == 0:
+				fp.write('\t(sheet_instances (path "/" (page "1")))\n')
+			fp.write(')\n')
+
+	def write_sheet_block(self, fp: TextIO, index: int, level: int, child_id: str, parent_paths: List[str]):
+		fp.write(f'\t(sheet (at {10 + 30 * index} 10) (size 20 20) (fields_autoplaced yes)\n')
+		fp.write('\t\t(stroke (width 0.1524) (type solid)) (fill (color 0 0 0 0.0000))\n')
+		fp.write(f'\t\t(uuid "{child_id}")\n')
+		fp.write(f'\t\t(property "Sheetname" "block_{level}_{index}" (at 0 0 0) (effects (font (size 1.27 1.27)) (justify left bottom)))\n')
+		fp.write(f'\t\t(property "Sheetfile" "{self.sheet_file(level, index % self.settings.sheet_files_per_level).name}" (at 0 0 0) (effects (font (size 1.27 1.27)) (justify left top)))\n')
+		fp.write(f'\t\t(instances (project "{self.settings.name}"\n')
+		for parent_path in parent_paths:
+			fp.write(f'\t\t\t(path "{parent_path}" (page "{self.next_page()}"))\n')
+		fp.write('\t\t))\n')
+		fp.write('\t)\n')
+
+	def write_symbol(self, fp: TextIO, index: int, instance_paths: List[str]):
+		symbol_id = self.uuid()
+		x = self.coordinate()
+		y = self.coordinate()
+		fp.write(f'\t(symbol (lib_id "Device:R") (at {x} {y} 0) (unit 1) (exclude_from_sim no) (in_bom yes) (on_board yes) (dnp no)\n')
+		fp.write(f'\t\t(uuid "{symbol_id}")\n')
+		fp.write(f'\t\t(property "Reference" "R{index}" (at {x} {y} 0) (effects (font (size 1.27 1.27)) (justify left)))\n')
+		fp.write(f'\t\t(property "Value" "{index + 1}k" (at {x} {y} 0) (effects (font (size 1.27 1.27)) (justify left)))\n')
+		fp.write(f'\t\t(property "Footprint" "Resistor_SMD:R_0603_1608Metric" (at {x} {y} 0) (effects (font (size 1.27 1.27)) hide))\n')
+		fp.write(f'\t\t(pin "1" (uuid "{self.uuid()}"))\n')
+		fp.write(f'\t\t(pin "2" (uuid "{self.uuid()}"))\n')
+		fp.write(f'\t\t(instances (project "{self.settings.name}"\n')
+		for instance_path in instance_paths:
+			designator = f"R{len(self.symbol_instances) + 1}"
+			self.symbol_instances.append(SyntheticSymbolInstance(f"{instance_path}/{symbol_id}", designator))
+			fp.write(f'\t\t\t(path "{instance_path}" (reference "{designator}") (unit 1))\n')
+		fp.write('\t\t))\n')
+		fp.write('\t)\n')
+
+	def write_wire(self, fp: TextIO):
+		fp.write(f'\t(wire (pts (xy {self.coordinate()} {self.coordinate()}) (xy {self.coordinate()} {self.coordinate()})) (stroke (width 0) (type default)) (uuid "{self.uuid()}"))\n')
+
+	def write_board(self):
+		settings = self.settings
+		with open(self.layout_file, "w", encoding="utf-8") as fp:
+			fp.write('(kicad_pcb (version 20240108) (generator "pcbnew") (generator_version "8.0")\n')
+			fp.write('\t(general (thickness 1.6) (legacy_teardrops no))\n')
+			fp.write('\t(paper "A4")\n')
+			fp.write('\t(layers\n')
+			fp.write('\t\t(0 "F.Cu" signal)\n')
+			fp.write('\t\t(31 "B.Cu" signal)\n')
+			fp.write('\t\t(36 "B.SilkS" user "B.Silkscreen")\n')
+			fp.write('\t\t(37 "F.SilkS" user "F.Silkscreen")\n')
+			fp.write('\t\t(44 "Edge.Cuts" user)\n')
+			fp.write('\t)\n')
+			fp.write('\t(net 0 "")\n')
+			for net in range(1, settings.nets):
+				fp.write(f'\t(net {net} "N{net}")\n')
+			for symbol_instance in self.symbol_instances:
+				self.write_footprint(fp, symbol_instance)
+			for _ in range(settings.tracks):
+				fp.write(f'\t(segment (start {self.coordinate()} {self.coordinate()}) (end {self.coordinate()} {self.coordinate()}) (width 0.25) (layer "{self.copper_layer()}") (net {self.net()}) (uuid "{self.uuid()}"))\n')
+			for _ in range(settings.track_arcs):
+				fp.write(f'\t(arc (start {self.coordinate()} {self.coordinate()}) (mid {self.coordinate()} {self.coordinate()}) (end {self.coordinate()} {self.coordinate()}) (width 0.25) (layer "{self.copper_layer()}") (net {self.net()}) (uuid "{self.uuid()}"))\n')
+			for _ in range(settings.vias):
+				fp.write(f'\t(via (at {self.coordinate()} {self.coordinate()}) (size 0.6) (drill 0.3) (layers "F.Cu" "B.Cu") (net {self.net()}) (uuid "{self.uuid()}"))\n')
+			for _ in range(settings.zones):
+				self.write_zone(fp)
+			fp.write(')\n')
+
+	def write_footprint(self, fp: TextIO, symbol_instance: SyntheticSymbolInstance):
+		settings = self.settings
+		layer = "B.Cu" if self.random.random() < 0.2 else "F.Cu"
+		silk = "B.SilkS" if layer == "B.Cu" else "F.SilkS"
+		angle = self.random.choice(("", " 90", " 180", " 270"))
+		# Footprint paths are relative to the root sheet
+		path = symbol_instance.path[len(self.root_id) + 1:]
+		fp.write(f'\t(footprint "Resistor_SMD:R_0603_1608Metric" (layer "{layer}") (uuid "{self.uuid()}") (at {self.coordinate()} {self.coordinate()}{angle})\n')
+		fp.write(f'\t\t(property "Reference" "{symbol_instance.designator}" (at 0 -1.43 0) (layer "{silk}") (uuid "{self.uuid()}") (effects (font (size 1 1) (thickness 0.15))))\n')
+		fp.write(f'\t\t(property "Value" "10k" (at 0 1.43 0) (layer "F.Fab") (uuid "{self.uuid()}") (effects (font (size 1 1) (thickness 0.15))))\n')
+		fp.write(f'\t\t(property "Footprint" "Resistor_SMD:R_0603_1608Metric" (at 0 0 0) (unlocked yes) (layer "F.Fab") hide (uuid "{self.uuid()}") (effects (font (size 1.27 1.27))))\n')
+		fp.write(f'\t\t(path "{path}")\n')
+		fp.write('\t\t(sheetname "block")\n')
+		fp.write('\t\t(attr smd)\n')
+		for start, end in (("-0.237 -0.5225", "0.237 -0.5225"), ("-0.237 0.5225", "0.237 0.5225")):
+			fp.write(f'\t\t(fp_line (start {start}) (end {end}) (stroke (width 0.12) (type solid)) (layer "{silk}") (uuid "{self.uuid()}"))\n')
+		for pad in range(settings.pads_per_footprint):
+			net = self.net()
+			fp.write(f'\t\t(pad "{pad + 1}" smd roundrect (at {pad * 1.6 - 0.8:.2f} 0{angle}) (size 0.8 0.95) (layers "{layer}" "F.Paste" "F.Mask") (roundrect_rratio 0.25) (net {net} "N{net}") (pintype "passive") (uuid "{self.uuid()}"))\n')
+		fp.write('\t\t(model "${KICAD8_3DMODEL_DIR}/Resistor_SMD.3dshapes/R_0603_1608Metric.wrl" (offset (xyz 0 0 0)) (scale (xyz 1 1 1)) (rotate (xyz 0 0 0)))\n')
+		fp.write('\t)\n')
+
+	def write_zone(self, fp: TextIO):
+		settings = self.settings
+		net = self.net()
+		layer = self.copper_layer()
+		fp.write(f'\t(zone (net {net}) (net_name "N{net}") (layer "{layer}") (uuid "{self.uuid()}") (hatch edge 0.5)\n')
+		fp.write('\t\t(connect_pads (clearance 0.5)) (min_thickness 0.25) (filled_areas_thickness no)\n')
+		fp.write('\t\t(fill yes (thermal_gap 0.5) (thermal_bridge_width 0.5))\n')
+		fp.write('\t\t(polygon (pts (xy 0 0) (xy 300 0) (xy 300 300) (xy 0 300)))\n')
+		fp.write(f'\t\t(filled_polygon (layer "{layer}")\n')
+		fp.write('\t\t\t(pts\n')
+		for _ in range(settings.filled_polygon_points):
+			fp.write(f'\t\t\t\t(xy {self.coordinate()} {self.coordinate()})\n')
+		fp.write('\t\t\t)\n')
+		fp.write('\t\t)\n')
+		fp.write('\t)\n')
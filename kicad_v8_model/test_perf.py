@@ -1,28 +1,67 @@
+from argparse import ArgumentParser
+from functools import reduce
+import gc
+import json
 import logging
+import mmap
+import multiprocessing
+import os
+import re
 from pathlib import Path
+import resource
+import shutil
+import tempfile
 import time
-from typing import Callable
+import tracemalloc
+from typing import Callable, Dict, List, Optional, Tuple, Type
+from uuid import UUID
 import cProfile
 import pstats
 import pprofile
 
+from .angle import Angle
+from .board import BoardLayer, Layer
 from .entities import Project
+from .entity_path import EntityPath, EntityPathComponent, EntityPathTrie
+from .geometry_tables import GeometryTables
 from .schematic_loader import SchematicLoader
 from .layout_loader import LayoutLoader
+from .node import Node, pack_node
+from .selection import Selection
+from .sheet_preloader import find_sheet_files, normalise_sheet_filename
+from .spatial_index import Box, SpatialIndex
+from ..utils.tracing import Tracer
+from ..clone_placement.placement import Placement
+from ..clone_placement.spath import Spath
+from .bench_harness import BenchmarkSession, DEFAULT_REGRESSION_THRESHOLD
+from .synthetic_project import SYNTHETIC_PROJECT_SIZES, SyntheticProjectGenerator, SyntheticProjectSettings
+from .vector2 import Vector2
 from . import parser
+from . import values
+from .parser import fast_parser
 
 
 def now():
     return time.clock_gettime(time.CLOCK_MONOTONIC)
 
 
-def time_execution(name: str, op: Callable[[], None]) -> None:
-    t0 = now()
-    op()
-    t1 = now()
-    dt = t1 - t0
+def measure_peak_rss(name: str, op: Callable[[], None]) -> None:
+    """ Run in a forked process, so earlier runs don't hold up the peak """
+    context = multiprocessing.get_context("fork")
+    reader, writer = context.Pipe(duplex=False)
+
+    def child():
+        rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        op()
+        rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        writer.send(rss1 - rss0)
+
+    process = context.Process(target=child)
+    process.start()
+    delta_kib = reader.recv()
+    process.join()
     print("")
-    print(f"bench: {name}, time: {dt:.2f}s")
+    print(f"bench: {name}, peak rss increase: {delta_kib / 1024:.1f}MiB")
     print("")
 
 
@@ -49,13 +88,702 @@ def profile_lines(name: str, op: Callable[[], None]) -> None:
     print("")
 
 
-def run():
+def bench_read_footprints(session: BenchmarkSession, project: Project, layout_file: Path) -> None:
+    """ Time only the footprint reader, with and without the children key index """
+    state: Dict[str, Selection] = {}
+    loader = LayoutLoader.__new__(LayoutLoader)
+    super(LayoutLoader, loader).__init__(project)
+
+    def setup():
+        # Fresh tree each time, as the index is cached on the nodes
+        state["pcb"] = parser.FastParser().parse_file(str(layout_file)).kicad_pcb
+        loader.read_layers(state["pcb"].layers)
+
+    for use_key_index in (False, True):
+        Selection.use_key_index = use_key_index
+        session.run(
+            f"read footprints (key index: {use_key_index})",
+            lambda: loader.read_footprints(state["pcb"].footprint),
+            setup=setup,
+        )
+    Selection.use_key_index = True
+
+
+def bench_geometry_tables(session: BenchmarkSession, project: Project) -> None:
+    """ Build the columnar route tables, and compare a box query on them against a loop over the tracks """
+    routes = (list(project.tracks.values()), list(project.track_arcs.values()), list(project.vias.values()), list(project.zones.values()))
+    if (tables := GeometryTables.build(*routes)) is None:
+        logging.getLogger(__name__).info("NumPy not available, skipping geometry table benchmarks")
+        return
+    session.run("geometry tables: build", lambda: GeometryTables.build(*routes))
+    # Top-left quarter of the area spanned by the track starts
+    start = tables.tracks.start
+    box_low = Vector2(int(start[:, 0].min()), int(start[:, 1].min()))
+    box_high = Vector2(int(start[:, 0].mean()), int(start[:, 1].mean()))
+
+    def query_objects():
+        [
+            track.id
+            for track in routes[0]
+            if min(track.start.x, track.end.x) <= box_high.x and max(track.start.x, track.end.x) >= box_low.x
+            if min(track.start.y, track.end.y) <= box_high.y and max(track.start.y, track.end.y) >= box_low.y
+        ]
+
+    session.run(f"geometry tables: box query, {len(tables.tracks)} track objects", query_objects)
+    session.run(f"geometry tables: box query, {len(tables.tracks)} track rows", lambda: tables.tracks.rows_in_box(box_low, box_high))
+
+
+def bench_spatial_index(session: BenchmarkSession, project: Project) -> None:
+    """ Build the spatial index, and compare box and nearest queries on it against scanning every item """
+    session.run("spatial index: build", lambda: SpatialIndex.build(project))
+    index = SpatialIndex.build(project)
+    entries = list(index.entries.values())
+    if not entries:
+        return
+    # A 10mm box and point around the first footprint (or whatever item comes first)
+    centre = entries[0].item.position
+    box = Box(centre.x - 5_000_000, centre.y - 5_000_000, centre.x + 5_000_000, centre.y + 5_000_000)
+    session.run(f"spatial index: box query, scan {len(entries)} items", lambda: [entry.item for entry in entries if entry.box.intersects(box)])
+    session.run(f"spatial index: box query, {len(entries)} items", lambda: index.query_box(box))
+    session.run(f"spatial index: nearest 5, scan {len(entries)} items", lambda: sorted(entries, key=lambda entry: entry.distance_squared(centre))[:5])
+    session.run(f"spatial index: nearest 5, {len(entries)} items", lambda: index.nearest(centre, 5))
+
+
+def bench_entity_paths(session: BenchmarkSession, project: Project) -> None:
+    """ Look up every symbol instance by an equal (not identical) path, and list symbols under each sheet with and without the trie """
+    paths = [EntityPath(list(path)) for path in project.symbol_instances]
+    sheets = list(project.sheet_instances.values())
+    symbols = list(project.symbol_instances.values())
+
+    def look_up():
+        for path in paths:
+            project.symbol_instances[path]
+
+    def scan_under():
+        for sheet in sheets:
+            [symbol for symbol in symbols if symbol.path.startswith(sheet.path)]
+
+    def trie_under():
+        for sheet in sheets:
+            project.symbols_under(sheet.path)
+
+    session.run(f"entity paths: look up {len(paths)} symbol instances", look_up)
+    session.run(f"entity paths: symbols under {len(sheets)} sheets, scan", scan_under)
+    session.run(f"entity paths: symbols under {len(sheets)} sheets, trie", trie_under)
+
+
+def kicad_flip(orientation: Angle, left_right: bool) -> Angle:
+    """ Orientation after Kicad's FOOTPRINT::Flip: mirror around the x axis, then half a turn for a left/right flip """
+    orientation = -orientation
+    if left_right:
+        orientation = orientation + Angle.from_degrees(180)
+    return orientation.wrap()
+
+
+def check_clone_orientation() -> None:
+    """
+    Cloning flips (as FlipAction does, left/right) then rotates, which must
+    land the source reference on the target's orientation, and turn the other
+    footprints the same way relative to it (mirrored when flipped)
+    """
+    front = Layer(number=0, name="F.Cu", type=BoardLayer.F_Cu)
+    back = Layer(number=31, name="B.Cu", type=BoardLayer.B_Cu)
+    angles = [Angle.from_degrees(degrees) for degrees in (0, 30, 90, 180, 270)]
+    offset = Angle.from_degrees(45)
+
+    def same(a: Angle, b: Angle) -> bool:
+        difference = (a - b).wrap().degrees
+        return min(difference, 360 - difference) < 1e-9
+
+    for source_flipped in (False, True):
+        for target_flipped in (False, True):
+            for source_angle in angles:
+                for target_angle in angles:
+                    source = Placement(Vector2(x=0, y=0), source_angle, source_flipped, back if source_flipped else front)
+                    target = Placement(Vector2(x=0, y=0), target_angle, target_flipped, back if target_flipped else front)
+                    flip = source_flipped != target_flipped
+                    rotation = source.rotation_onto(target)
+
+                    def clone(orientation: Angle) -> Angle:
+                        return (kicad_flip(orientation, left_right=True) if flip else orientation) + rotation
+
+                    if not same(clone(source_angle), target_angle):
+                        raise AssertionError(f"Cloned {source} onto {target} at {clone(source_angle)}")
+                    expected = target_angle - offset if flip else target_angle + offset
+                    if not same(clone(source_angle + offset), expected):
+                        raise AssertionError(f"Cloned a footprint at {offset} to {source} onto {target} at {clone(source_angle + offset)}")
+
+
+def check_path_trie(project: Project) -> None:
+    """ The trie's common prefix must match reducing its paths with &, for the whole project and under each sheet """
+    for sheet in project.sheet_instances.values():
+        trie = EntityPathTrie(project.paths.items_under(sheet.path))
+        expected = reduce(lambda a, b: a & b, (path for path, _ in trie.items_under(())))
+        if (actual := trie.common_prefix()) != expected:
+            raise AssertionError(f"Common prefix under {sheet.path} is {actual}, expected {expected}")
+
+
+def check_spaths(project: Project) -> None:
+    """ Every sheet and symbol instance must resolve back from its spath, with and without the sibling index """
+    root = project.root_sheet_instance
+    for sheet in project.sheet_instances.values():
+        for siblings in (None, project.siblings):
+            if (actual := Spath.create(sheet, root, siblings).resolve_sheet(root, siblings)) is not sheet:
+                raise AssertionError(f"Spath of sheet {sheet.path} resolved to {actual.path}")
+    for symbol in project.symbol_instances.values():
+        for siblings in (None, project.siblings):
+            if (actual := Spath.create(symbol, root, siblings).resolve_symbol(root, siblings)) is not symbol:
+                raise AssertionError(f"Spath of symbol {symbol.path} resolved to {actual.path}")
+
+
+def check_sheet_hashes(project: Project) -> None:
+    """ Sheet definitions and instances must work as set members and dict keys """
+    definitions = {definition: definition for definition in project.sheet_definitions.values()}
+    instances = {instance: instance for instance in project.sheet_instances.values()}
+    if len(definitions) != len(project.sheet_definitions) or len(instances) != len(project.sheet_instances):
+        raise AssertionError("Distinct sheets collapsed as dict keys")
+    for sheet in project.sheet_instances.values():
+        if instances[sheet] is not sheet or definitions[sheet.definition] is not sheet.definition:
+            raise AssertionError(f"Looked up the wrong sheet for {sheet.path}")
+
+
+def check_footprint_links(project: Project) -> None:
+    """ Every footprint's component must link back to that footprint """
+    for footprint in project.footprints.values():
+        if (linked := getattr(footprint.component, "footprint", None)) is not footprint:
+            raise AssertionError(f"Component {footprint.component} of footprint {footprint} links to {linked}")
+
+
+UUID_PATTERN = re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}")
+
+
+def bench_uuids(session: BenchmarkSession, files: List[Path]) -> None:
+    """ Parse and hash every uuid in the files, as uuid.UUID (how ids used to be held) and as EntityPathComponent """
+    uuids = [
+        match.group()
+        for file in files
+        for match in UUID_PATTERN.finditer(file.read_text())
+    ]
+    session.run(f"uuids: parse and hash {len(uuids)} as UUID", lambda: set(UUID(hex=value) for value in uuids))
+    session.run(
+        f"uuids: parse and hash {len(uuids)} as EntityPathComponent",
+        lambda: set(EntityPathComponent.parse(value) for value in uuids),
+    )
+
+
+def bench_parsers(session: BenchmarkSession, schematic_file: Path, layout_file: Path) -> None:
+    """ Time the parsers alone, on the root sheet and the board """
+    for parser_class in (parser.SimpleParser, parser.FastParser):
+        name = parser_class.__name__
+        session.run(
+            f"{name}: parse schematic",
+            lambda: parser_class(schema=SchematicLoader.schema).parse_file(str(schematic_file)),
+        )
+        session.run(
+            f"{name}: parse layout",
+            lambda: parser_class(schema=LayoutLoader.schema).parse_file(str(layout_file)),
+        )
+
+
+def bench_loaders(
+    session: BenchmarkSession,
+    name: str,
+    parser_class: Type[parser.Parser],
+    schematic_file: Path,
+    layout_file: Path,
+    setup: Optional[Callable[[], None]] = None,
+) -> None:
+    """ Time both loaders with the given parser, the schematic into a fresh project each run """
+    projects = [Project()]
+
+    def new_project():
+        projects[0] = Project()
+        if setup is not None:
+            setup()
+
+    SchematicLoader.parser_class = parser_class
+    LayoutLoader.parser_class = parser_class
+    session.run(
+        f"{name}: schematic",
+        lambda: SchematicLoader.load(projects[0], str(schematic_file)),
+        setup=new_project,
+    )
+    session.run(
+        f"{name}: layout",
+        lambda: LayoutLoader.load(projects[0], str(layout_file)),
+        setup=setup,
+    )
+    SchematicLoader.parser_class = parser.FastParser
+    LayoutLoader.parser_class = parser.FastParser
+
+
+# Hierarchy shapes by scale: wide has one sheet file per block under the root,
+# deep is a binary tree of instances over two files per level
+HIERARCHY_SHAPES: Dict[str, Callable[[int], SyntheticProjectSettings]] = {
+    "wide": lambda scale: SyntheticProjectSettings(
+        sheet_depth=1, sheet_fanout=scale, sheet_files_per_level=scale, symbols_per_sheet=2,
+        tracks=0, track_arcs=0, vias=0, zones=0,
+    ),
+    "deep": lambda scale: SyntheticProjectSettings(
+        sheet_depth=scale, sheet_fanout=2, sheet_files_per_level=2, symbols_per_sheet=2,
+        tracks=0, track_arcs=0, vias=0, zones=0,
+    ),
+}
+
+
+def bench_sheet_hierarchy(
+    session: BenchmarkSession,
+    scales: Optional[Dict[str, Tuple[int, ...]]] = None,
+) -> None:
+    """
+    Load ever bigger hierarchies from sheets parsed up-front, so only the
+    loader's own bookkeeping is timed.  The time per sheet instance should
+    stay flat as the hierarchy grows, apart from deep hierarchies having one
+    more uuid in every path per level.
+    """
+    if scales is None:
+        scales = {"wide": (100, 200, 400, 800), "deep": (6, 7, 8, 9)}
+    table: List[str] = []
+    for shape, shape_scales in scales.items():
+        for scale in shape_scales:
+            settings = HIERARCHY_SHAPES[shape](scale)
+            with tempfile.TemporaryDirectory(prefix="kicad-perf-") as directory:
+                generator = SyntheticProjectGenerator.generate(settings, Path(directory))
+                sheet_parser = parser.FastParser(schema=SchematicLoader.schema)
+                sheets = {
+                    normalise_sheet_filename(str(sheet_file)): sheet_parser.parse_file(str(sheet_file))
+                    for sheet_file in Path(directory).glob("*.kicad_sch")
+                }
+
+            def load():
+                loader = SchematicLoader(
+                    Project(),
+                    str(generator.schematic_file),
+                    sheet_loader=lambda filename: sheets[normalise_sheet_filename(filename)],
+                )
+                loader.read_schematic()
+                loader.get_result()
+
+            instances = settings.sheet_instance_count
+            result = session.run(f"sheet hierarchy: {shape} {scale}, {instances} sheet instances", load)
+            table.append(f"| {shape:5s} | {scale:5d} | {len(sheets):6d} | {instances:9d} | {result.median:7.3f} | {result.median / instances * 1e6:8.1f} |")
+    print("")
+    print("bench: sheet hierarchy, median load time")
+    print("| shape | scale | sheets | instances | t       | us/inst  |")
+    print("|-------|-------|--------|-----------|---------|----------|")
+    for line in table:
+        print(line)
+    print("")
+
+
+def set_batch_sizes(start_attr_batch: int, attr_batch: int) -> None:
+    """ Rebuild the fast parser regexes, which it reads from its module globals """
+    fast_parser.NODE_START_ATTR_BATCH = start_attr_batch
+    fast_parser.NODE_ATTR_BATCH = attr_batch
+    fast_parser.NODE_START = fast_parser.build_node_start(start_attr_batch)
+    fast_parser.NODE_ATTR = fast_parser.build_node_attr(attr_batch)
+
+
+def bench_batch_sizes(
+    session: BenchmarkSession,
+    schematic_file: Path,
+    layout_file: Path,
+    repeats: int,
+    start_attr_batches: Tuple[int, ...] = (0, 2, 5, 10, 20),
+    attr_batches: Tuple[int, ...] = (1, 2, 5, 10, 20),
+) -> None:
+    """ Sweep NODE_START_ATTR_BATCH/NODE_ATTR_BATCH for the fast parser, on text already in memory """
+    schematic_text = schematic_file.read_text(encoding="utf-8")
+    layout_text = layout_file.read_text(encoding="utf-8")
+    defaults = (fast_parser.NODE_START_ATTR_BATCH, fast_parser.NODE_ATTR_BATCH)
+    table: List[str] = []
+    try:
+        for start_attr_batch in start_attr_batches:
+            for attr_batch in attr_batches:
+                set_batch_sizes(start_attr_batch, attr_batch)
+                times = [
+                    session.run(
+                        f"batch sizes {start_attr_batch}/{attr_batch}: parse {name}",
+                        lambda: parser.FastParser(schema=schema).parse(text),
+                        repeats=repeats,
+                    )
+                    for name, schema, text in (
+                        ("schematic", SchematicLoader.schema, schematic_text),
+                        ("layout", LayoutLoader.schema, layout_text),
+                    )
+                ]
+                table.append(
+                    f"| {start_attr_batch:3d} | {attr_batch:3d} | " +
+                    " | ".join(
+                        f"{result.median:6.3f} ± {(result.ci_high - result.ci_low) / 2:5.3f}"
+                        for result in times
+                    ) +
+                    " |"
+                )
+    finally:
+        set_batch_sizes(*defaults)
+    print("")
+    print("bench: batch sizes, median ± half the 95% CI")
+    print("| N   | n   | t_sch          | t_lay          |")
+    print("|-----|-----|----------------|----------------|")
+    for line in table:
+        print(line)
+    print("")
+
+
+# Quoted values as they appear in files, and their decoded strings
+DEQUOTE_CORPUS: List[Tuple[str, str]] = [
+    (r'""', ""),
+    (r'"R1"', "R1"),
+    (r'"Device:R_Small"', "Device:R_Small"),
+    (r'"10k 1% 0402"', "10k 1% 0402"),
+    (r'"µF ±5% Ω"', "µF ±5% Ω"),
+    (r'"say \"hi\""', 'say "hi"'),
+    (r'"C:\\path\\file"', "C:\\path\\file"),
+    (r'"trailing\\"', "trailing\\"),
+    (r'"line\nbreak\r\n\ttab"', "line\nbreak\r\n\ttab"),
+    (r'"\x41\x4a\x4A"', "AJJ"),
+    (r'"\101\060\177"', "A0\x7f"),
+    (r'"\\n is not a newline"', "\\n is not a newline"),
+    (r'"mixed \"\x41\101\\\n"', 'mixed "AA\\\n'),
+]
+
+
+def check_mmap_parser(files: List[Path]) -> None:
+    """ Mmap parser must give the fast parser's tree, still decodable once it has closed the mapping, decoding values once """
+    for file in files:
+        expected = pack_node(~parser.FastParser().parse_file(str(file)))
+        root = ~parser.MmapParser().parse_file(str(file))
+        nodes = [root]
+        while nodes:
+            node = nodes.pop()
+            if isinstance(getattr(node.values, "buffer", None), mmap.mmap):
+                raise AssertionError(f"Mmap parser left {file} mapped")
+            nodes.extend(node.children)
+        if pack_node(root) != expected:
+            raise AssertionError(f"Mmap parser read {file} differently")
+        if (values := root.children[0].children_by_key("version")[0].values)[0] is not values[0]:
+            raise AssertionError(f"Mmap parser decodes values of {file} on every access")
+        stream = parser.MmapParser().stream_file(str(file))
+        children = list(stream.children)
+        if (stream.key, tuple(stream.values), tuple(pack_node(child) for child in children)) != expected[2][0]:
+            raise AssertionError(f"Mmap parser streamed {file} differently")
+
+
+def check_flat_parser(files: List[Path]) -> None:
+    """ Flat parser must give the fast parser's tree, listing each node's children only once """
+    for file in files:
+        expected = pack_node(~parser.FastParser().parse_file(str(file)))
+        root = ~parser.FlatParser().parse_file(str(file))
+        if pack_node(root) != expected:
+            raise AssertionError(f"Flat parser read {file} differently")
+        top = root.children[0]
+        if top.children is not top.children or top.children_by_key("uuid") is not top.children_by_key("uuid"):
+            raise AssertionError(f"Flat parser lists children of {file} on every access")
+
+
+def check_incremental_parser_bound(files: List[Path]) -> None:
+    """ Incremental parser must only remember the most recently parsed files """
+    max_remembered = parser.IncrementalParser.max_remembered
+    parser.IncrementalParser.forget()
+    parser.IncrementalParser.max_remembered = 1
+    try:
+        for file in files:
+            parser.IncrementalParser().parse_file(str(file))
+        if [path for path, _ in parser.IncrementalParser.previous] != [str(files[-1].absolute())]:
+            raise AssertionError(f"Incremental parser remembers {list(parser.IncrementalParser.previous)}")
+    finally:
+        parser.IncrementalParser.max_remembered = max_remembered
+        parser.IncrementalParser.forget()
+
+
+def check_parse_cache(schematic_file: Path) -> None:
+    """ Parse cache must give the parsed tree, only from a private directory, and drop entries past max_age """
+    cache_dir = parser.CachedParser.cache_dir
+    expected = pack_node(~parser.FastParser().parse_file(str(schematic_file)))
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        parser.CachedParser.cache_dir = os.path.join(scratch_dir, "cache")
+        try:
+            for _ in range(2):
+                if pack_node(~parser.CachedParser().parse_file(str(schematic_file))) != expected:
+                    raise AssertionError(f"Parse cache read {schematic_file} differently")
+            (entry,) = (entry.path for entry in os.scandir(parser.CachedParser.cache_dir))
+            if os.name == "posix" and os.stat(parser.CachedParser.cache_dir).st_mode & 0o077:
+                raise AssertionError("Parse cache directory is accessible to other users")
+            # Unused for too long: dropped, then parsed and written again
+            os.utime(entry, (0, 0))
+            parser.CachedParser().parse_file(str(schematic_file))
+            if os.stat(entry).st_mtime == 0:
+                raise AssertionError("Parse cache kept an entry past max_age")
+            if os.name == "posix":
+                os.chmod(parser.CachedParser.cache_dir, 0o755)
+                os.remove(entry)
+                parser.CachedParser().parse_file(str(schematic_file))
+                if os.path.exists(entry):
+                    raise AssertionError("Parse cache used a directory readable by other users")
+        finally:
+            parser.CachedParser.cache_dir = cache_dir
+
+
+def check_throttled_observer() -> None:
+    """ Throttled observer must forward progress once either the byte or the time interval has passed """
+    reports: List[int] = []
+    observer = parser.ThrottledParserObserver(lambda done, total: reports.append(done), byte_interval=10, time_interval=3600)
+    observer.last_time = time.monotonic()
+    for done in (5, 15):
+        observer.progress(done, 100)
+    observer.time_interval = 0
+    for done in (16, 100):
+        observer.progress(done, 100)
+    if reports != [15, 16, 100]:
+        raise AssertionError(f"Throttled observer forwarded {reports}")
+
+
+def check_trace_export() -> None:
+    """ Tracing to a file must append each outermost span's events once, and not keep them """
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        path = os.path.join(scratch_dir, "trace.json")
+        Tracer.start(path)
+        for _ in range(3):
+            with Tracer.span("outer"):
+                with Tracer.span("inner"):
+                    pass
+            if Tracer.events:
+                raise AssertionError(f"Tracer kept {len(Tracer.events)} events after writing them")
+        Tracer.stop()
+        with open(path, encoding="utf-8") as fp:
+            if [event["name"] for event in json.load(fp)] != ["inner", "outer"] * 3:
+                raise AssertionError("Tracer wrote the wrong events")
+
+
+def check_dequote() -> None:
+    """ All parsers must decode the corpus the same as fast_parser.dequote """
+    for quoted, expected in DEQUOTE_CORPUS:
+        if (actual := fast_parser.dequote(quoted)) != expected:
+            raise AssertionError(f"dequote({quoted}) = {actual!r}, expected {expected!r}")
+        text = f"(value {quoted})"
+        for parser_class in (parser.SimpleParser, parser.FastParser, parser.LazyParser, parser.MmapParser, parser.FlatParser):
+            if (actual := (~parser_class().parse(text).value).values[0]) != expected:
+                raise AssertionError(f"{parser_class.__name__} parsed {quoted} as {actual!r}, expected {expected!r}")
+
+
+def bench_dequote(session: BenchmarkSession, schematic_files: List[Path]) -> None:
+    """ Dequote every quoted value in the schematic, with and without the escape-free fast lane """
+    quoted_value = re.compile(fast_parser.QUOTED_VALUE)
+    values = [
+        match.group()
+        for schematic_file in schematic_files
+        for match in quoted_value.finditer(schematic_file.read_text(encoding="utf-8"))
+    ]
+    decode_escape = fast_parser.decode_escape
+    str_escapes = fast_parser.STR_ESCAPES
+    dequote = fast_parser.dequote
+
+    def decode_all():
+        for value in values:
+            str_escapes.sub(decode_escape, value[1:-1])
+
+    def dequote_all():
+        for value in values:
+            dequote(value)
+
+    slow = session.run(f"dequote {len(values)} values: escape decoder", decode_all)
+    fast = session.run(f"dequote {len(values)} values: fast lane", dequote_all)
+    print("")
+    print(
+        f"bench: dequote per value, "
+        f"escape decoder: {slow.median / len(values) * 1e9:.0f}ns, "
+        f"fast lane: {fast.median / len(values) * 1e9:.0f}ns"
+    )
+    print("")
+
+
+# Lengths in millimetres as Kicad writes them, with the expected nanometres
+LENGTH_CORPUS: List[Tuple[str, int]] = [
+    ("0", 0),
+    ("-0", 0),
+    ("1", 1_000_000),
+    ("0.000001", 1),
+    ("-0.000001", -1),
+    ("0.001001", 1_001),
+    ("0.000511", 511),
+    ("-1.001995", -1_001_995),
+    ("127.254", 127_254_000),
+    ("2147.483647", 2_147_483_647),
+]
+
+
+def check_values() -> None:
+    """ Lengths must round to the nearest nanometre, the same one by one and in bulk """
+    for value, expected in LENGTH_CORPUS:
+        if (actual := values.parse_length(value)) != expected:
+            raise AssertionError(f"parse_length({value}) = {actual}, expected {expected}")
+    corpus = [value for value, _ in LENGTH_CORPUS] * values.BULK_CONVERSION_MIN_VALUES
+    if values.parse_lengths(corpus) != [values.parse_length(value) for value in corpus]:
+        raise AssertionError("parse_lengths differs from parse_length")
+    point = Selection([Node(key="xy", values=("0.001001", "-0.000511"), children=())])
+    if point.as_vectors() != [point.as_vector()] or point.as_vector() != Vector2(x=1_001, y=-511):
+        raise AssertionError(f"Decoded {point} as {point.as_vector()}")
+
+
+def bench_memory(schematic_file: Path, layout_file: Path) -> None:
+    def load_project():
+        project = Project()
+        SchematicLoader.load(project, str(schematic_file))
+        LayoutLoader.load(project, str(layout_file))
+
+    for parser_class in (parser.SimpleParser, parser.FastParser, parser.LazyParser, parser.MmapParser, parser.FlatParser):
+        SchematicLoader.parser_class = parser_class
+        LayoutLoader.parser_class = parser_class
+        measure_peak_rss(f"{parser_class.__name__}: schematic + layout", load_project)
+    LayoutLoader.parser_class = parser.FastParser
+
+
+# Objects counted after each phase of the memory profile, by type name
+MEMORY_PROFILE_TYPES = ("Node", "Selection", "EntityPath", "EntityPathComponent", "UUID", "Vector2")
+
+
+def count_objects() -> Dict[str, int]:
+    counts = dict.fromkeys(MEMORY_PROFILE_TYPES, 0)
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in counts:
+            counts[name] += 1
+    return counts
+
+
+def profile_memory_phase(name: str, op: Callable[[], None], top: int) -> None:
+    """ Peak and retained traced allocations of one phase, its top allocation sites, and object counts """
+    gc.collect()
+    counts0 = count_objects()
+    snapshot0 = tracemalloc.take_snapshot()
+    current0 = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    op()
+    peak = tracemalloc.get_traced_memory()[1]
+    gc.collect()
+    current1 = tracemalloc.get_traced_memory()[0]
+    snapshot1 = tracemalloc.take_snapshot()
+    counts1 = count_objects()
+    print("")
+    print(
+        f"memory: {name}, "
+        f"peak: {(peak - current0) / 1048576:.1f}MiB, "
+        f"retained: {(current1 - current0) / 1048576:.1f}MiB"
+    )
+    print("  objects: " + ", ".join(
+        f"{type_name} {counts1[type_name]} ({counts1[type_name] - counts0[type_name]:+d})"
+        for type_name in MEMORY_PROFILE_TYPES
+    ))
+    snapshot_filter = tracemalloc.Filter(False, tracemalloc.__file__)
+    for stat in snapshot1.filter_traces([snapshot_filter]).compare_to(snapshot0.filter_traces([snapshot_filter]), "lineno")[:top]:
+        print(f"  {stat}")
+    print("")
+
+
+def profile_memory(schematic_file: Path, layout_file: Path, top: int = 10) -> None:
+    """
+    Load the project phase by phase under tracemalloc.  Sheets are parsed
+    up-front, so that parsing isn't billed to the sheet definitions, and the
+    layout is parsed as a tree (not streamed) so it can be split the same way.
+    """
+    project = Project()
+    sheets: Dict[str, Selection] = {}
+    layout: Dict[str, Selection] = {}
+    loader = SchematicLoader(
+        project,
+        str(schematic_file),
+        sheet_loader=lambda filename: sheets[normalise_sheet_filename(filename)],
+    )
+    layout_loader = LayoutLoader.__new__(LayoutLoader)
+    super(LayoutLoader, layout_loader).__init__(project)
+
+    def parse_sheets():
+        pending = [normalise_sheet_filename(str(schematic_file))]
+        sheet_parser = SchematicLoader.parser_class(schema=SchematicLoader.schema)
+        while pending:
+            filename = pending.pop()
+            if filename not in sheets:
+                sheets[filename] = sheet_parser.parse_file(filename)
+                pending += find_sheet_files(filename)
+
+    def parse_layout():
+        layout["pcb"] = LayoutLoader.parser_class(schema=LayoutLoader.schema).parse_file(str(layout_file)).kicad_pcb
+
+    def read_layout():
+        layout_loader.read_tree(layout["pcb"])
+        layout_loader.get_result()
+
+    def group_components():
+        loader.read_component_definitions()
+        loader.read_component_instances()
+        loader.get_result()
+
+    phases: List[Tuple[str, Callable[[], None]]] = [
+        ("parse schematic", parse_sheets),
+        ("sheet definitions", loader.read_sheet_definitions),
+        ("sheet instances", loader.read_sheet_instances),
+        ("symbol definitions", loader.read_symbol_definitions),
+        ("symbol instances", loader.read_symbol_instances),
+        ("component grouping", group_components),
+        ("parse layout", parse_layout),
+        ("layout read", read_layout),
+    ]
+    tracemalloc.start()
+    try:
+        for name, op in phases:
+            profile_memory_phase(name, op, top)
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"memory: total, peak: {peak / 1048576:.1f}MiB, retained: {current / 1048576:.1f}MiB")
+        print("")
+    finally:
+        tracemalloc.stop()
+
+
+def get_project_file() -> Path:
+    """ Use my big project if it's here, otherwise a generated one of similar size """
+    project_file = Path("/home/mark/projects/big-audio-interface/kicad/main.kicad_pro")
+    if project_file.exists():
+        return project_file
+    directory = Path(tempfile.mkdtemp(prefix="kicad-perf-"))
+    generator = SyntheticProjectGenerator.generate(SYNTHETIC_PROJECT_SIZES["large"], directory)
+    return generator.schematic_file.with_suffix(".kicad_pro")
+
+
+def run(args: Optional[List[str]] = None):
+    argument_parser = ArgumentParser(description="Profile and benchmark the parsers and loaders")
+    argument_parser.add_argument("--repeats", type=int, default=5, help="timed runs per benchmark")
+    argument_parser.add_argument("--warmup", type=int, default=1, help="untimed runs before those")
+    argument_parser.add_argument("--sweep-repeats", type=int, default=3, help="timed runs per batch size in the sweep")
+    argument_parser.add_argument("--no-sweep", action="store_true", help="skip the batch size sweep")
+    argument_parser.add_argument("--baseline", type=Path, help="compare results against this baseline")
+    argument_parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="relative slowdown that counts as a regression")
+    argument_parser.add_argument("--save", type=Path, help="save results as a new baseline")
+    argument_parser.add_argument("--memory", action="store_true", help="profile memory by load phase instead of timing")
+    argument_parser.add_argument("--memory-top", type=int, default=10, help="allocation sites to list per phase")
+    argument_parser.add_argument("--trace", type=Path, help="load the project once, and write a Chrome trace of it here")
+    options = argument_parser.parse_args(args)
+
     logging.basicConfig(level=logging.DEBUG)
     logger = logging.getLogger(__name__)
-    project_file = Path("/home/mark/projects/big-audio-interface/kicad/main.kicad_pro")
+    project_file = get_project_file()
     logger.info("Loading %s", project_file.stem)
     schematic_file = project_file.with_suffix(".kicad_sch")
     layout_file = project_file.with_suffix(".kicad_pcb")
+    session = BenchmarkSession(repeats=options.repeats, warmup=options.warmup)
+
+    if options.memory:
+        profile_memory(schematic_file, layout_file, options.memory_top)
+        return
+
+    if options.trace is not None:
+        Tracer.start()
+        project = Project()
+        SchematicLoader.load(project, str(schematic_file))
+        LayoutLoader.load(project, str(layout_file))
+        Tracer.stop()
+        Tracer.export(str(options.trace))
+        return
 
     spin_end = now() + 2
     while now() < spin_end:
@@ -63,6 +791,7 @@ def run():
 
     # Profile fast parser
     project = Project()
+    SchematicLoader.parser_class = parser.FastParser
     profile_calls(
         "fast parser: schematic",
         lambda: SchematicLoader.load(project, str(schematic_file)),
@@ -72,29 +801,86 @@ def run():
         lambda: LayoutLoader.load(project, str(layout_file)),
     )
 
-    # Time simple parser
-    project = Project()
-    SchematicLoader.parser_class = parser.SimpleParser
-    time_execution(
-        "simple parser: schematic",
-        lambda: SchematicLoader.load(project, str(schematic_file)),
-    )
-    time_execution(
-        "simple parser: layout",
-        lambda: LayoutLoader.load(project, str(layout_file)),
+    check_dequote()
+    check_values()
+    check_trace_export()
+    check_throttled_observer()
+    check_clone_orientation()
+    check_path_trie(project)
+    check_spaths(project)
+    check_sheet_hashes(project)
+    check_footprint_links(project)
+    check_mmap_parser([schematic_file, layout_file])
+    check_flat_parser([schematic_file, layout_file])
+    check_incremental_parser_bound([schematic_file, layout_file])
+    check_parse_cache(schematic_file)
+    bench_dequote(session, sorted(project_file.parent.glob("*.kicad_sch")))
+
+    bench_parsers(session, schematic_file, layout_file)
+    bench_uuids(session, sorted(project_file.parent.glob("*.kicad_sch")) + [layout_file])
+
+    bench_loaders(session, "simple parser", parser.SimpleParser, schematic_file, layout_file)
+    bench_loaders(session, "fast parser", parser.FastParser, schematic_file, layout_file)
+    bench_loaders(session, "mmap parser", parser.MmapParser, schematic_file, layout_file)
+    bench_loaders(session, "lazy parser", parser.LazyParser, schematic_file, layout_file)
+    bench_sheet_hierarchy(session)
+
+    bench_read_footprints(session, project, layout_file)
+    bench_geometry_tables(session, project)
+    bench_spatial_index(session, project)
+    bench_entity_paths(session, project)
+
+    # Cached parser in a scratch cache, emptied before each cold run
+    cache_dir = parser.CachedParser.cache_dir
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        parser.CachedParser.cache_dir = os.path.join(scratch_dir, "cache")
+        bench_loaders(
+            session,
+            "cached parser (cold)",
+            parser.CachedParser,
+            schematic_file,
+            layout_file,
+            setup=lambda: shutil.rmtree(parser.CachedParser.cache_dir, ignore_errors=True),
+        )
+        bench_loaders(session, "cached parser (warm)", parser.CachedParser, schematic_file, layout_file)
+    parser.CachedParser.cache_dir = cache_dir
+
+    # Incremental parser, forgetting earlier parses before each first run
+    bench_loaders(
+        session,
+        "incremental parser (first)",
+        parser.IncrementalParser,
+        schematic_file,
+        layout_file,
+        setup=parser.IncrementalParser.forget,
     )
+    bench_loaders(session, "incremental parser (repeat)", parser.IncrementalParser, schematic_file, layout_file)
+    parser.IncrementalParser.forget()
 
-    # Time fast parser
-    project = Project()
+    if not options.no_sweep:
+        bench_batch_sizes(session, schematic_file, layout_file, options.sweep_repeats)
+
+    bench_memory(schematic_file, layout_file)
+
+    # Time parallel sheet loading (fast parser in worker processes)
     SchematicLoader.parser_class = parser.FastParser
-    time_execution(
-        "fast parser: schematic",
-        lambda: SchematicLoader.load(project, str(schematic_file)),
-    )
-    time_execution(
-        "fast parser: layout",
-        lambda: LayoutLoader.load(project, str(layout_file)),
+    projects = [Project()]
+    session.run(
+        "fast parser (parallel): schematic",
+        lambda: SchematicLoader.load_parallel(projects[0], str(schematic_file)),
+        setup=lambda: projects.__setitem__(0, Project()),
     )
+    SchematicLoader.parser_class = parser.FastParser
+
+    if options.save is not None:
+        session.save(options.save)
+    if options.baseline is not None:
+        regressions = session.compare(options.baseline, options.threshold)
+        print("")
+        for regression in regressions:
+            print(regression)
+        print(f"bench: {len(regressions)} regressions against {options.baseline}")
+        print("")
 
     # import yaml
     # print(yaml.dump(project))
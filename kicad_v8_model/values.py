@@ -0,0 +1,86 @@
+"""
+Typed decoding of s-expression values
+
+Kicad writes lengths in millimetres with up to six decimals, we hold them in
+integer nanometres like pcbnew does.  Truncating the scaled float loses a
+nanometre on values such as 0.001001 (float("0.001001") * 1e6 is
+1000.9999999999999), so lengths are rounded to the nearest nanometre instead,
+which is exact for anything up to kilometres.
+
+Many coordinates at once (e.g. zone outlines) are converted in one go with
+NumPy when it's available.
+"""
+from typing import List, Sequence
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from .angle import Angle
+from .entity_path import EntityPathComponent
+from .vector2 import Vector2
+
+
+NANOMETRES_PER_MILLIMETRE = 1_000_000
+
+# Below this many coordinates, converting them one by one is faster than NumPy
+BULK_CONVERSION_MIN_VALUES = 64
+
+
+def parse_int(value: str) -> int:
+	return int(value)
+
+
+def parse_bool(value: str) -> bool:
+	""" yes/no flag """
+	if value == "yes":
+		return True
+	if value == "no":
+		return False
+	raise ValueError("Expected yes or no", value)
+
+
+def parse_length(value: str) -> int:
+	""" Millimetres to nanometres """
+	return round(float(value) * NANOMETRES_PER_MILLIMETRE)
+
+
+def parse_angle(value: str) -> Angle:
+	return Angle.from_degrees(float(value))
+
+
+def parse_id(value: str) -> EntityPathComponent:
+	return EntityPathComponent.parse(value)
+
+
+def parse_vector(x: str, y: str) -> Vector2:
+	return Vector2(
+		x=round(float(x) * NANOMETRES_PER_MILLIMETRE),
+		y=round(float(y) * NANOMETRES_PER_MILLIMETRE),
+	)
+
+
+def parse_lengths(values: Sequence[str]) -> List[int]:
+	""" Millimetres to nanometres, rounded the same as parse_length """
+	if numpy is None or len(values) < BULK_CONVERSION_MIN_VALUES:
+		return [
+			round(float(value) * NANOMETRES_PER_MILLIMETRE)
+			for value in values
+		]
+	# rint rounds halves to even, same as round()
+	scaled = numpy.array(values, dtype=numpy.float64) * NANOMETRES_PER_MILLIMETRE
+	return numpy.rint(scaled).astype(numpy.int64).tolist()
+
+
+def parse_vectors(values: Sequence[Sequence[str]], index: int = 0) -> List[Vector2]:
+	""" Coordinate pair at index of each value list, e.g. the xy nodes of pts """
+	lengths = parse_lengths([
+		pair[offset]
+		for pair in values
+		for offset in (index, index + 1)
+	])
+	return [
+		Vector2(x=x, y=y)
+		for x, y in zip(lengths[0::2], lengths[1::2])
+	]
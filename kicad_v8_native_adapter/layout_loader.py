@@ -15,6 +15,7 @@ from pcbnew import PCB_TRACK
 from pcbnew import PCB_ARC
 
 from ..utils.to_dict_strict import to_dict_strict
+from ..utils.tracing import Tracer
 
 from ..kicad_v8_model import BoardLayer
 from ..kicad_v8_model import Layer
@@ -35,13 +36,21 @@ class PluginLayoutLoader(BaseLayoutLoader):
 
 	@staticmethod
 	def load(project: Project, board: BOARD):
-		loader = PluginLayoutLoader(project, board)
-		loader.read_nets()
-		loader.read_layers()
-		loader.read_routes()
-		loader.read_footprints()
-		# loader.read_graphics()
-		loader.get_result()
+		with Tracer.span("load layout (pcbnew)"):
+			loader = PluginLayoutLoader(project, board)
+			with Tracer.span("read nets") as span:
+				loader.read_nets()
+				span.set(nets=len(loader.nets))
+			with Tracer.span("read layers"):
+				loader.read_layers()
+			with Tracer.span("read routes") as span:
+				loader.read_routes()
+				span.set(tracks=len(loader.tracks), vias=len(loader.vias), zones=len(loader.zones))
+			with Tracer.span("read footprints") as span:
+				loader.read_footprints()
+				span.set(footprints=len(loader.footprints))
+			# loader.read_graphics()
+			loader.get_result()
 
 	def read_nets(self):
 		board = self.board
@@ -126,7 +135,7 @@ class PluginLayoutLoader(BaseLayoutLoader):
 				mid=mid,
 				end=end,
 			)
-			self.arcs.append(route)
+			self.track_arcs.append(route)
 		logger.info("Reading vias")
 		for track in vias:
 			id = EntityPathComponent.parse(str(track.m_Uuid))
@@ -189,6 +198,7 @@ class PluginLayoutLoader(BaseLayoutLoader):
 				symbol_path=EntityPath.parse(pcbnew_footprint.GetPath().AsString()),
 			)
 			footprint.component = component_instance
+			component_instance.footprint = footprint
 			self.footprints.append(footprint)
 
 	# def read_graphics(self):
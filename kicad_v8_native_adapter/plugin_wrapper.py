@@ -13,8 +13,12 @@ from pcbnew import BOARD, ActionPlugin
 from .plugin import Plugin
 from .plugin_metadata import PluginMetadata
 
+from ..kicad_v8_model import SchematicLoader
+from ..kicad_v8_model.parser import CachedParser
+from ..kicad_v8_model.parser.cached_parser import PARSE_CACHE_ENVIRONMENT_VARIABLE
 from ..utils.error_handler import error_handler, LoggedException
 from ..utils.logging_config import LoggingConfig
+from ..utils.tracing import Tracer, TRACE_ENVIRONMENT_VARIABLE
 
 from ..ui.spinner import spin_while
 from ..ui.bored_user_entertainer import BoredUserEntertainer
@@ -73,6 +77,12 @@ class PluginWrapper(ActionPlugin, ABC):
 		filename = os.path.abspath(str(board.GetFileName()))
 		os.chdir(os.path.dirname(filename))
 		logger = self.init_log_sink()
+		if os.environ.get(TRACE_ENVIRONMENT_VARIABLE):
+			# Appended to after each top-level span, since clones run from the
+			# settings window after this returns
+			Tracer.start(os.path.abspath(f"mark-plugin-{type(self).__name__}.trace.json"))
+		if os.environ.get(PARSE_CACHE_ENVIRONMENT_VARIABLE):
+			SchematicLoader.parser_class = CachedParser
 		try:
 			self.execute(logger, board, filename)
 		except LoggedException:
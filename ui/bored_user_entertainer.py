@@ -1,5 +1,7 @@
 import wx
 
+from ..utils.cancellation import CancellationToken
+
 from .bored_user_entertainer_design import BoredUserEntertainerDesign
 
 
@@ -7,11 +9,25 @@ class BoredUserEntertainer():
 
 	_inst: BoredUserEntertainerDesign | None = None
 	_refcount: int = 0
+	_cancellation: CancellationToken = CancellationToken()
+
+	@staticmethod
+	def create() -> BoredUserEntertainerDesign:
+		inst = BoredUserEntertainerDesign(parent=wx.FindWindowByName("PcbFrame"))
+		# Added here rather than in the designer, as it only sets a flag
+		cancel_button = wx.Button(inst, wx.ID_CANCEL, "Cancel")
+		cancel_button.Bind(wx.EVT_BUTTON, lambda event: BoredUserEntertainer.cancel())
+		inst.GetSizer().Insert(3, cancel_button, 0, wx.ALIGN_CENTER_HORIZONTAL | wx.ALL, 5)
+		inst.SetSize(wx.Size(400, 140))
+		inst.Layout()
+		return inst
 
 	@staticmethod
 	def start() -> None:
 		if BoredUserEntertainer._inst is None:
-			BoredUserEntertainer._inst = BoredUserEntertainerDesign(parent=wx.FindWindowByName("PcbFrame"))
+			BoredUserEntertainer._inst = BoredUserEntertainer.create()
+		if BoredUserEntertainer._refcount == 0:
+			BoredUserEntertainer._cancellation = CancellationToken()
 		BoredUserEntertainer.message("Working, please wait...")
 		BoredUserEntertainer._inst.Show()
 		BoredUserEntertainer._refcount += 1
@@ -26,6 +42,17 @@ class BoredUserEntertainer():
 			BoredUserEntertainer._inst.Hide()
 		wx.Yield()
 
+	@staticmethod
+	def cancel() -> None:
+		""" Work checking the cancellation token stops at its next check """
+		BoredUserEntertainer._cancellation.cancel()
+		BoredUserEntertainer.message("Cancelling...")
+
+	@staticmethod
+	def cancellation() -> CancellationToken:
+		""" Token for the current operation, cancelled by the dialog's cancel button """
+		return BoredUserEntertainer._cancellation
+
 	@staticmethod
 	def message(caption: str) -> None:
 		inst = BoredUserEntertainer._inst
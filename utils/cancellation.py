@@ -0,0 +1,25 @@
+from .user_exception import UserException
+
+
+class OperationCancelled(UserException):
+
+	def __init__(self):
+		super().__init__("Cancelled by user")
+
+
+class CancellationToken():
+	""" Set from the UI, checked by long-running work at convenient points """
+
+	cancelled: bool
+
+	__slots__ = ("cancelled",)
+
+	def __init__(self):
+		self.cancelled = False
+
+	def cancel(self) -> None:
+		self.cancelled = True
+
+	def check(self) -> None:
+		if self.cancelled:
+			raise OperationCancelled()
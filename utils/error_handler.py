@@ -7,6 +7,7 @@ import wx
 from ..ui.message_box import MessageBox
 
 from .user_exception import UserException
+from .cancellation import OperationCancelled
 
 
 ReturnType = TypeVar("ReturnType")
@@ -31,6 +32,9 @@ def error_handler(func: Callable[..., ReturnType]) -> Callable[..., ReturnType]:
 				raise UserException("Unexpected error occurred") from error
 		except LoggedException:
 			raise
+		except OperationCancelled as error:
+			logging.getLogger(f"error_handler @ {repr(func)}").info("Operation cancelled by user")
+			raise LoggedException() from error
 		except UserException as error:
 			diagnostic = "".join(traceback.TracebackException.from_exception(error).format())
 			if "logger" in kwargs:
@@ -5,11 +5,14 @@ Key = TypeVar("Key")
 Value = TypeVar("Value")
 
 
+def insert_strict(result: Dict[Key, Value], key: Key, item: Value) -> None:
+	if key in result:
+		raise KeyError("Duplicate key", key, type(key), type(item), repr(result[key]), repr(item))
+	result[key] = item
+
+
 def to_dict_strict(items: Iterable[Value], key_func: Callable[[Value], Key]) -> Dict[Key, Value]:
 	result: Dict[Key, Value] = {}
 	for item in items:
-		key = key_func(item)
-		if key in result:
-			raise KeyError("Duplicate key", key, type(key), type(item), repr(result[key]), repr(item))
-		result[key] = item
+		insert_strict(result, key_func(item), item)
 	return result
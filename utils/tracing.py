@@ -0,0 +1,186 @@
+"""
+Lightweight tracing spans, exported in Chrome trace format
+
+Open the exported JSON in chrome://tracing or https://ui.perfetto.dev to see
+a timeline of where the time goes, e.g. inside Kicad where attaching a
+profiler isn't practical.
+
+	with Tracer.span("read footprints") as span:
+		...
+		span.set(footprints=len(footprints))
+
+Tracing is off by default, and a disabled span is one static method call
+returning a shared no-op object, so spans can stay in the code permanently.
+They are meant for phases (parsing a file, loading a sheet, planning a clone),
+not per-node work.
+"""
+from functools import wraps
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, ParamSpec, TypeVar
+
+
+logger = logging.getLogger(__name__)
+
+
+# Set to any non-empty value to trace plugin runs
+TRACE_ENVIRONMENT_VARIABLE = "MARK_PLUGIN_TRACE"
+
+ResultType = TypeVar("ResultType")
+ParamsType = ParamSpec("ParamsType")
+
+
+class Span():
+	""" Complete ("X") event, recorded when the span exits """
+
+	name: str
+	args: Dict[str, Any]
+	start_ns: int
+
+	__slots__ = ("name", "args", "start_ns")
+
+	def __init__(self, name: str, args: Dict[str, Any]):
+		self.name = name
+		self.args = args
+		self.start_ns = 0
+
+	def set(self, **args: Any) -> None:
+		""" Attach values to the span, shown when it's selected in the viewer """
+		self.args.update(args)
+
+	def count(self, name: str, increment: int = 1) -> None:
+		self.args[name] = self.args.get(name, 0) + increment
+
+	def __enter__(self) -> "Span":
+		Tracer._depth += 1
+		self.start_ns = time.perf_counter_ns()
+		return self
+
+	def __exit__(self, *exc_info: Any) -> None:
+		end_ns = time.perf_counter_ns()
+		Tracer.record({
+			"name": self.name,
+			"ph": "X",
+			"ts": (self.start_ns - Tracer._origin_ns) / 1000,
+			"dur": (end_ns - self.start_ns) / 1000,
+			"pid": os.getpid(),
+			"tid": threading.get_ident(),
+			"args": self.args,
+		})
+		Tracer._depth -= 1
+		if Tracer._depth == 0:
+			Tracer.flush()
+
+
+class NullSpan():
+	""" Returned for every span while tracing is disabled """
+
+	__slots__ = ()
+
+	def set(self, **args: Any) -> None:
+		pass
+
+	def count(self, name: str, increment: int = 1) -> None:
+		pass
+
+	def __enter__(self) -> "NullSpan":
+		return self
+
+	def __exit__(self, *exc_info: Any) -> None:
+		pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer():
+
+	enabled: bool = False
+	# If set, events are appended here whenever an outermost span ends, as a
+	# JSON array which viewers accept without its closing bracket
+	path: Optional[str] = None
+	# Events not appended to the path yet, or all of them without a path
+	events: List[Dict[str, Any]] = []
+	_written: int = 0
+	_origin_ns: int = 0
+	_depth: int = 0
+
+	@staticmethod
+	def start(path: Optional[str] = None) -> None:
+		Tracer.enabled = True
+		Tracer.path = path
+		Tracer.events = []
+		Tracer._written = 0
+		Tracer._origin_ns = time.perf_counter_ns()
+		Tracer._depth = 0
+		if path is not None:
+			with open(path, "w", encoding="utf-8") as fp:
+				fp.write("[\n")
+
+	@staticmethod
+	def stop() -> None:
+		Tracer.flush()
+		if Tracer.path is not None:
+			with open(Tracer.path, "a", encoding="utf-8") as fp:
+				fp.write("\n]\n")
+			logger.info("Wrote %d trace events to %s", Tracer._written, Tracer.path)
+		Tracer.enabled = False
+		Tracer.path = None
+
+	@staticmethod
+	def flush() -> None:
+		""" Append the events recorded since the last flush to the path, and let go of them """
+		if Tracer.path is None or not Tracer.events:
+			return
+		with open(Tracer.path, "a", encoding="utf-8") as fp:
+			for event in Tracer.events:
+				if Tracer._written:
+					fp.write(",\n")
+				json.dump(event, fp)
+				Tracer._written += 1
+		Tracer.events = []
+
+	@staticmethod
+	def span(name: str, **args: Any) -> "Span | NullSpan":
+		if not Tracer.enabled:
+			return NULL_SPAN
+		return Span(name, args)
+
+	@staticmethod
+	def counter(name: str, **values: float) -> None:
+		""" Counter ("C") event, plotted as a graph over time """
+		if not Tracer.enabled:
+			return
+		Tracer.record({
+			"name": name,
+			"ph": "C",
+			"ts": (time.perf_counter_ns() - Tracer._origin_ns) / 1000,
+			"pid": os.getpid(),
+			"tid": threading.get_ident(),
+			"args": values,
+		})
+
+	@staticmethod
+	def record(event: Dict[str, Any]) -> None:
+		Tracer.events.append(event)
+
+	@staticmethod
+	def export(path: str) -> None:
+		""" Write the events kept in memory, i.e. all of them when tracing without a path """
+		with open(path, "w", encoding="utf-8") as fp:
+			json.dump({"traceEvents": Tracer.events, "displayTimeUnit": "ms"}, fp)
+		logger.info("Wrote %d trace events to %s", len(Tracer.events), path)
+
+
+def traced(name: str) -> Callable[[Callable[ParamsType, ResultType]], Callable[ParamsType, ResultType]]:
+	""" Run the whole function in a span """
+	def decorator(func: Callable[ParamsType, ResultType]) -> Callable[ParamsType, ResultType]:
+		@wraps(func)
+		def wrapper(*args: ParamsType.args, **kwargs: ParamsType.kwargs) -> ResultType:
+			with Tracer.span(name):
+				return func(*args, **kwargs)
+		return wrapper
+	return decorator